@@ -0,0 +1,298 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, or_, select, update
+
+from controller.charts import rewrite_scope, run_chart_refresh
+from controller.database import db, upsert
+from controller.models import (
+    Song, PlayEvent, SongPlayRollup, SongListener, RollupState, ChartEntry, SongSimilarity
+)
+
+analytics_cli = AppGroup("analytics", help="Maintain play analytics rollups.")
+
+PERIODS = {
+    "hour": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "day": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+# ================= COMPACTION =================
+def compact_play_events(connection, batch_size=5000):
+    """Fold play events past the watermark into the rollup tables.
+
+    Runs in the caller's transaction. The watermark row is updated first so
+    concurrent compactors in other workers serialize on it instead of
+    counting the same events twice.
+    """
+    connection.execute(
+        upsert(connection, RollupState)
+        .values(name="plays", last_event_id=0)
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    connection.execute(
+        update(RollupState.__table__)
+        .where(RollupState.name == "plays")
+        .values(last_event_id=RollupState.last_event_id)
+    )
+    watermark = connection.execute(
+        select(RollupState.last_event_id).where(RollupState.name == "plays")
+    ).scalar()
+
+    events = connection.execute(
+        select(PlayEvent.id, PlayEvent.song_id, PlayEvent.user_id, PlayEvent.played_at)
+        .where(PlayEvent.id > watermark)
+        .order_by(PlayEvent.id)
+        .limit(batch_size)
+    ).all()
+    if not events:
+        return 0
+
+    creators = dict(connection.execute(
+        select(Song.song_id, Song.creator_id)
+        .where(Song.song_id.in_({e.song_id for e in events}))
+    ).all())
+
+    plays = Counter()
+    listeners = set()
+    for event in events:
+        creator_id = creators.get(event.song_id)
+        if creator_id is None:
+            continue  # song deleted since it was played
+        for period, truncate in PERIODS.items():
+            plays[(event.song_id, period, truncate(event.played_at), creator_id)] += 1
+        if event.user_id is not None:
+            listeners.add((event.song_id, PERIODS["day"](event.played_at), event.user_id, creator_id))
+
+    if plays:
+        stmt = upsert(connection, SongPlayRollup)
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["song_id", "period", "bucket"],
+                set_={"plays": SongPlayRollup.plays + stmt.excluded.plays}
+            ),
+            [
+                {"song_id": song_id, "period": period, "bucket": bucket, "creator_id": creator_id, "plays": count}
+                for (song_id, period, bucket, creator_id), count in plays.items()
+            ]
+        )
+
+    if listeners:
+        connection.execute(
+            upsert(connection, SongListener).on_conflict_do_nothing(),
+            [
+                {"song_id": song_id, "day": day, "user_id": user_id, "creator_id": creator_id}
+                for song_id, day, user_id, creator_id in listeners
+            ]
+        )
+        touched_days = {(song_id, day) for song_id, day, _, _ in listeners}
+        for song_id, day in touched_days:
+            count = connection.execute(
+                select(func.count())
+                .select_from(SongListener.__table__)
+                .where(SongListener.song_id == song_id, SongListener.day == day)
+            ).scalar()
+            connection.execute(
+                update(SongPlayRollup.__table__)
+                .where(
+                    SongPlayRollup.song_id == song_id,
+                    SongPlayRollup.period == "day",
+                    SongPlayRollup.bucket == day
+                )
+                .values(listeners=count)
+            )
+
+    connection.execute(
+        update(RollupState.__table__)
+        .where(RollupState.name == "plays")
+        .values(last_event_id=events[-1].id)
+    )
+    return len(events)
+
+
+def prune_play_events(connection, retention_days):
+    # Only events the compactor has already folded into the rollups are removed
+    watermark = connection.execute(
+        select(RollupState.last_event_id).where(RollupState.name == "plays")
+    ).scalar() or 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    return connection.execute(
+        PlayEvent.__table__.delete()
+        .where(PlayEvent.id <= watermark, PlayEvent.played_at < cutoff)
+    ).rowcount
+
+
+def purge_song_history(connection, song_id, chart_size):
+    """Delete a removed song's rollups, listeners, unfolded plays and similarities,
+    and re-rank the charts that listed it.
+
+    Older databases hand a deleted song's id to the next upload, which must
+    not inherit any of this. Call it once the song row is gone.
+    """
+    for table in (SongPlayRollup, SongListener):
+        connection.execute(delete(table.__table__).where(table.song_id == song_id))
+
+    # Events past either watermark are still to be folded in under this id
+    watermark = connection.execute(
+        select(func.min(RollupState.last_event_id)).where(RollupState.name.in_(("plays", "charts")))
+    ).scalar() or 0
+    connection.execute(
+        delete(PlayEvent.__table__).where(PlayEvent.id > watermark, PlayEvent.song_id == song_id)
+    )
+
+    connection.execute(
+        delete(SongSimilarity.__table__)
+        .where(or_(SongSimilarity.song_id == song_id, SongSimilarity.similar_song_id == song_id))
+    )
+
+    scopes = connection.execute(
+        select(ChartEntry.scope, ChartEntry.scope_id).where(ChartEntry.song_id == song_id).distinct()
+    ).all()
+    for scope, scope_id in scopes:
+        rewrite_scope(connection, scope, scope_id, chart_size)
+
+
+def run_compaction(app):
+    total = 0
+    with app.app_context():
+        while True:
+            with db.engine.begin() as connection:
+                compacted = compact_play_events(connection)
+            total += compacted
+            if not compacted:
+                break
+        retention = app.config["PLAY_EVENT_RETENTION_DAYS"]
+        if retention:
+            with db.engine.begin() as connection:
+                prune_play_events(connection, retention)
+    run_chart_refresh(app)
+    return total
+
+
+class RollupCompactor:
+    """Background thread that keeps the rollup tables current in each worker."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pid = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config["ROLLUP_INTERVAL"]
+        app.extensions["rollup_compactor"] = self
+        if self.interval > 0:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name="rollup-compactor", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                run_compaction(self.app)
+            except Exception as e:
+                print(f"Rollup compaction failed: {e}")
+
+
+rollup_compactor = RollupCompactor()
+
+
+# ================= QUERIES =================
+def window_start(days):
+    return PERIODS["day"](datetime.utcnow()) - timedelta(days=days - 1)
+
+
+def daily_plays(creator_id, days):
+    start = window_start(days)
+    rows = dict(
+        db.session.query(SongPlayRollup.bucket, func.sum(SongPlayRollup.plays))
+        .filter(
+            SongPlayRollup.creator_id == creator_id,
+            SongPlayRollup.period == "day",
+            SongPlayRollup.bucket >= start
+        )
+        .group_by(SongPlayRollup.bucket)
+        .all()
+    )
+    return [
+        {"day": (start + timedelta(days=i)).date().isoformat(), "plays": int(rows.get(start + timedelta(days=i), 0))}
+        for i in range(days)
+    ]
+
+
+def song_series(song_id, period, buckets):
+    now = PERIODS[period](datetime.utcnow())
+    step = timedelta(hours=1) if period == "hour" else timedelta(days=1)
+    start = now - step * (buckets - 1)
+    rows = {
+        row.bucket: row for row in SongPlayRollup.query.filter(
+            SongPlayRollup.song_id == song_id,
+            SongPlayRollup.period == period,
+            SongPlayRollup.bucket >= start
+        )
+    }
+    series = []
+    for i in range(buckets):
+        bucket = start + step * i
+        row = rows.get(bucket)
+        point = {"bucket": bucket.isoformat(), "plays": row.plays if row else 0}
+        # Unique listeners are only tracked per day
+        if period == "day":
+            point["listeners"] = row.listeners or 0 if row else 0
+        series.append(point)
+    return series
+
+
+def top_songs(creator_id, days, limit=5):
+    plays = func.sum(SongPlayRollup.plays).label("plays")
+    rows = (
+        db.session.query(SongPlayRollup.song_id, plays)
+        .filter(
+            SongPlayRollup.creator_id == creator_id,
+            SongPlayRollup.period == "day",
+            SongPlayRollup.bucket >= window_start(days)
+        )
+        .group_by(SongPlayRollup.song_id)
+        .order_by(plays.desc())
+        .limit(limit)
+        .all()
+    )
+    titles = dict(
+        db.session.query(Song.song_id, Song.title)
+        .filter(Song.song_id.in_([song_id for song_id, _ in rows]))
+        .all()
+    )
+    return [
+        {"song_id": song_id, "title": titles[song_id], "plays": int(count)}
+        for song_id, count in rows if song_id in titles
+    ]
+
+
+def unique_listeners(creator_id, days):
+    return (
+        db.session.query(func.count(func.distinct(SongListener.user_id)))
+        .filter(SongListener.creator_id == creator_id, SongListener.day >= window_start(days))
+        .scalar()
+    )
+
+
+# ================= CLI =================
+@analytics_cli.command("compact")
+def compact_command():
+    """Fold pending play events into the hourly and daily rollups."""
+    print(f"Compacted {run_compaction(current_app._get_current_object())} play events")
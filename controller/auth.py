@@ -0,0 +1,75 @@
+from functools import wraps
+
+from flask import flash, g, redirect, session, url_for
+from sqlalchemy.orm import selectinload
+
+from controller.cache import TTLCache
+from controller.database import db
+from controller.models import User
+
+LISTENER_ROLES = ("USER", "CREATOR")
+ALL_ROLES = ("ADMIN", "CREATOR", "USER")
+
+# user_id -> is_blocked. Blocking in one worker reaches the others within the TTL.
+block_cache = TTLCache(ttl=0)
+
+
+def init_auth(app):
+    block_cache.ttl = app.config["BLOCK_STATUS_TTL"]
+
+
+def has_role(*roles):
+    granted = session.get("roles", [])
+    return any(role in granted for role in roles)
+
+
+def current_user():
+    """The logged-in user with roles, loaded in one query at most once per request."""
+    if "current_user" not in g:
+        user_id = session.get("user_id")
+        g.current_user = None
+        if user_id is not None:
+            g.current_user = db.session.get(User, user_id, options=[selectinload(User.roles)])
+        if g.current_user is not None:
+            block_cache.set(user_id, g.current_user.is_blocked)
+    return g.current_user
+
+
+def is_blocked(user_id=None):
+    """Block status from the per-process cache, so hot endpoints skip the users table."""
+    if user_id is None:
+        user_id = session.get("user_id")
+    user = g.get("current_user")
+    if user is not None and user.user_id == user_id:
+        return user.is_blocked
+    return block_cache.get_or_set(
+        user_id, lambda: db.session.query(User.is_blocked).filter_by(user_id=user_id).scalar()
+    ) or False
+
+
+def invalidate_block_status(user_id):
+    # Called after an admin blocks or unblocks a user
+    block_cache.invalidate(user_id)
+
+
+def role_required(*roles, denied=None, load_user=False):
+    """Let the view run only when the session holds one of `roles`.
+
+    Otherwise return `denied` (any view return value), or redirect to the
+    login page when it is not given. With load_user, a session whose user
+    no longer exists is cleared as well.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if not has_role(*roles):
+                return denied if denied is not None else redirect(url_for("tunex.login"))
+            if load_user and current_user() is None:
+                session.clear()
+                if denied is not None:
+                    return denied
+                flash("Session expired. Please log in again.", "error")
+                return redirect(url_for("tunex.login"))
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,223 @@
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from controller.database import apply_sqlite_pragmas, sqlite_pragmas
+from controller.passwords import PasswordHasher, PasswordsBusy
+
+bench_cli = AppGroup("bench", help="Measure startup and request performance.")
+
+# Runs in a fresh interpreter so nothing is already imported
+STARTUP_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "gemini_loaded": "google.generativeai" in sys.modules,
+}))
+"""
+
+
+def measure_startup(root, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE],
+            cwd=root, env=dict(os.environ, PYTHONPATH=root),
+            capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+@bench_cli.command("startup")
+@click.option("--runs", type=int, default=5, show_default=True)
+def startup_command(runs):
+    """Time `import main` and create_app() in fresh worker processes."""
+    samples = measure_startup(current_app.root_path, runs)
+    for key in ("import", "create_app"):
+        values = [sample[key] * 1000 for sample in samples]
+        print(f"{key:<11} median {statistics.median(values):7.1f} ms   max {max(values):7.1f} ms")
+    print(f"max RSS     {max(sample['max_rss_kb'] for sample in samples) / 1024:.1f} MB")
+    print(f"Gemini SDK imported at startup: {any(sample['gemini_loaded'] for sample in samples)}")
+
+
+# ================= WRITE CONCURRENCY =================
+# Each writer mimics a play-count flush: append a row and bump one hot counter.
+def write_worker(url, pragmas, connect_args, seconds, results):
+    engine = create_engine(url, connect_args=connect_args)
+    if pragmas:
+        apply_sqlite_pragmas(engine, pragmas)
+
+    commits, errors, latencies = 0, 0, []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("INSERT INTO bench_writes (worker, written_at) VALUES (:w, :t)"),
+                                   {"w": os.getpid(), "t": time.time()})
+                connection.execute(text("UPDATE bench_counter SET total = total + 1 WHERE id = 1"))
+            commits += 1
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    results.put((commits, errors, latencies))
+
+
+def run_write_benchmark(url, pragmas, connect_args, workers, seconds):
+    engine = create_engine(url, connect_args=connect_args)
+    if pragmas:
+        apply_sqlite_pragmas(engine, pragmas)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS bench_writes"))
+        connection.execute(text("DROP TABLE IF EXISTS bench_counter"))
+        connection.execute(text(
+            "CREATE TABLE bench_writes (id INTEGER PRIMARY KEY, worker INTEGER, written_at FLOAT)"
+            if engine.dialect.name == "sqlite" else
+            "CREATE TABLE bench_writes (id SERIAL PRIMARY KEY, worker INTEGER, written_at FLOAT)"
+        ))
+        connection.execute(text("CREATE TABLE bench_counter (id INTEGER PRIMARY KEY, total INTEGER)"))
+        connection.execute(text("INSERT INTO bench_counter VALUES (1, 0)"))
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=write_worker, args=(url, pragmas, connect_args, seconds, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE bench_writes"))
+        connection.execute(text("DROP TABLE bench_counter"))
+    engine.dispose()
+
+    latencies = sorted(latency for _, _, sample in samples for latency in sample)
+    commits = sum(sample[0] for sample in samples)
+    return {
+        "commits": commits,
+        "errors": sum(sample[1] for sample in samples),
+        "per_second": commits / seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+    }
+
+
+@bench_cli.command("writes")
+@click.option("--workers", type=int, default=4, show_default=True, help="Concurrent writer processes.")
+@click.option("--seconds", type=float, default=5, show_default=True)
+@click.option("--url", help="Database to hammer (default: a scratch SQLite file). Uses scratch tables only.")
+def writes_command(workers, seconds, url):
+    """Compare write throughput of default SQLite settings with the configured pragmas."""
+    config = current_app.config
+    timeout = {"timeout": config["SQLITE_BUSY_TIMEOUT"] / 1000}
+
+    if url:
+        is_sqlite = url.startswith("sqlite")
+        runs = [("configured", url, sqlite_pragmas(config) if is_sqlite else None, timeout if is_sqlite else {})]
+    else:
+        folder = tempfile.mkdtemp()
+        runs = [
+            ("sqlite default", f"sqlite:///{folder}/default.sqlite3",
+             {"journal_mode": "DELETE", "synchronous": "FULL"}, {"timeout": 0}),
+            ("sqlite + busy_timeout", f"sqlite:///{folder}/timeout.sqlite3",
+             {"journal_mode": "DELETE", "synchronous": "FULL"}, timeout),
+            ("sqlite tuned", f"sqlite:///{folder}/tuned.sqlite3", sqlite_pragmas(config), timeout),
+        ]
+
+    for name, run_url, pragmas, connect_args in runs:
+        report = run_write_benchmark(run_url, pragmas, connect_args, workers, seconds)
+        print(f"{name:<22} {report['per_second']:8.0f} commits/s  {report['errors']:6d} lock errors  "
+              f"p50 {report['p50_ms']:6.2f} ms  p99 {report['p99_ms']:7.2f} ms")
+
+
+# ================= PASSWORD HASHING =================
+def probe_latency(stop, delays, interval=0.01):
+    # Stands in for a cheap API request: how late does a 10 ms tick wake up?
+    while not stop.is_set():
+        started = time.perf_counter()
+        time.sleep(interval)
+        sum(range(1000))
+        delays.append(time.perf_counter() - started - interval)
+
+
+def run_login_benchmark(hasher, threads, seconds):
+    password = "correct horse battery staple"
+    password_hash = hasher.hash(password)
+    stop = threading.Event()
+    latencies, delays, lock = [], [], threading.Lock()
+
+    def login_worker():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                hasher.verify(password_hash, password)
+            except PasswordsBusy:
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=login_worker) for _ in range(threads)]
+    workers.append(threading.Thread(target=probe_latency, args=(stop, delays)))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    latencies.sort()
+    delays.sort()
+    return {
+        "per_second": len(latencies) / seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "probe_p99_ms": delays[int(len(delays) * 0.99)] * 1000 if delays else 0.0,
+    }
+
+
+@bench_cli.command("login")
+@click.option("--threads", type=int, default=8, show_default=True, help="Concurrent request threads logging in.")
+@click.option("--seconds", type=float, default=5, show_default=True)
+@click.option("--method", "methods", multiple=True,
+              help="Hash method to compare, e.g. pbkdf2:sha256:600000 (repeatable; default: configured).")
+@click.option("--workers", type=int, help="Override PASSWORD_WORKERS.")
+def login_command(threads, seconds, methods, workers):
+    """Measure password checks per second and how much they delay other requests."""
+    config = dict(current_app.config)
+    if workers is not None:
+        config["PASSWORD_WORKERS"] = workers
+    print(f"{threads} login threads, PASSWORD_WORKERS={config['PASSWORD_WORKERS']} ({config['PASSWORD_POOL']}), "
+          f"{os.cpu_count()} CPUs")
+
+    for method in methods or (config["PASSWORD_HASH_METHOD"],):
+        hasher = PasswordHasher()
+        hasher.init_app(SimpleNamespace(config=dict(config, PASSWORD_HASH_METHOD=method), extensions={}))
+        report = run_login_benchmark(hasher, threads, seconds)
+        print(f"{method:<24} {report['per_second']:7.1f} logins/s  p50 {report['p50_ms']:7.1f} ms  "
+              f"p99 {report['p99_ms']:7.1f} ms  other requests delayed p99 {report['probe_p99_ms']:6.1f} ms")
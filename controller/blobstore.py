@@ -0,0 +1,173 @@
+import glob
+import hashlib
+import os
+import shutil
+from collections import defaultdict
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, update
+
+from controller.database import db, upsert
+from controller.models import AudioBlob, AudioRendition, Song
+
+READ_SIZE = 1024 * 1024
+
+blobs_cli = AppGroup("blobs", help="Manage the content-addressed audio store.")
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_and_hash(stream, path):
+    # Streams an upload to disk with bounded memory, hashing it on the way
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        for block in iter(lambda: stream.read(READ_SIZE), b""):
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
+
+def blob_path(upload_folder, digest, ext):
+    # ab/cd/abcd....mp3 keeps directories small however large the catalog grows
+    return os.path.join(upload_folder, digest[:2], digest[2:4], f"{digest}.{ext}").replace("\\", "/")
+
+
+def place_file(source, path):
+    # An existing blob already holds these exact bytes, so the source is a duplicate
+    if os.path.exists(path):
+        os.remove(source)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shutil.move(source, path)
+
+
+# ================= REFERENCE COUNTING =================
+def store_blob(temp_path, upload_folder, digest, ext):
+    """Move a finished upload into the store and take a reference on it.
+
+    Files are named by their SHA-256, so identical uploads share one file
+    and different uploads can never overwrite each other. The reference is
+    taken in one INSERT ... ON CONFLICT in the caller's transaction, so
+    concurrent uploads of the same content neither collide nor lose a count.
+    """
+    connection = db.session.connection()
+    stmt = upsert(connection, AudioBlob).values(
+        content_hash=digest,
+        file_path=blob_path(upload_folder, digest, ext),
+        size=os.path.getsize(temp_path),
+        ref_count=1
+    )
+    file_path = connection.execute(
+        stmt.on_conflict_do_update(index_elements=["content_hash"],
+                                   set_={"ref_count": AudioBlob.ref_count + 1})
+        .returning(AudioBlob.file_path)
+    ).scalar()
+    place_file(temp_path, file_path)
+    return file_path
+
+
+def release_blob(song):
+    """Drop the song's reference; returns the file path if nothing uses it any more."""
+    if not song.content_hash:
+        return None
+    connection = db.session.connection()
+    row = connection.execute(
+        update(AudioBlob.__table__)
+        .where(AudioBlob.content_hash == song.content_hash)
+        .values(ref_count=AudioBlob.ref_count - 1)
+        .returning(AudioBlob.ref_count, AudioBlob.file_path)
+    ).first()
+    # The row is locked until commit, so only the release that reaches 0 gets here
+    if row is None or row.ref_count > 0:
+        return None
+    connection.execute(delete(AudioBlob.__table__).where(AudioBlob.content_hash == song.content_hash))
+    connection.execute(delete(AudioRendition.__table__).where(AudioRendition.content_hash == song.content_hash))
+    return row.file_path
+
+
+def remove_orphaned_blob(path):
+    # Called after the commit that released the last reference. An upload of
+    # the same content may have re-created the blob in the meantime.
+    if not path:
+        return
+    if AudioBlob.query.filter_by(file_path=path).first():
+        return
+    # Renditions live next to the blob as <hash>.<quality>.mp3
+    for file_path in [path] + glob.glob(f"{glob.escape(os.path.splitext(path)[0])}.*.mp3"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+# ================= MIGRATION =================
+def migrate_uploads(upload_folder, prune=False):
+    """Rehash every song's file into the sharded store and dedup the tree."""
+    report = {"migrated": 0, "duplicates": 0, "missing": [], "orphans": []}
+
+    songs_by_path = defaultdict(list)
+    for song in Song.query.all():
+        songs_by_path[song.file_path.replace("\\", "/")].append(song)
+
+    for legacy_path, songs in songs_by_path.items():
+        if not os.path.isfile(legacy_path):
+            report["missing"].append(legacy_path)
+            continue
+
+        digest = hash_file(legacy_path)
+        path = blob_path(upload_folder, digest, legacy_path.rsplit(".", 1)[-1].lower())
+        if legacy_path != path:
+            if os.path.exists(path):
+                report["duplicates"] += 1
+            place_file(legacy_path, path)
+            report["migrated"] += 1
+
+        for song in songs:
+            song.file_path = path
+            song.content_hash = digest
+        if not db.session.get(AudioBlob, digest):
+            db.session.add(AudioBlob(content_hash=digest, file_path=path, size=os.path.getsize(path)))
+        db.session.flush()
+
+    # Recount references from scratch so the table matches the catalog
+    counts = dict(
+        db.session.query(Song.content_hash, func.count())
+        .filter(Song.content_hash.isnot(None))
+        .group_by(Song.content_hash)
+    )
+    for blob in AudioBlob.query.all():
+        blob.ref_count = counts.get(blob.content_hash, 0)
+        if blob.ref_count == 0:
+            AudioRendition.query.filter_by(content_hash=blob.content_hash).delete()
+            db.session.delete(blob)
+    db.session.commit()
+
+    # Renditions sit beside their blob and are referenced through audio_renditions
+    referenced = {blob.file_path for blob in AudioBlob.query.all()}
+    referenced.update(file_path for file_path, in db.session.query(AudioRendition.file_path))
+    for root, _, files in os.walk(upload_folder):
+        for name in files:
+            path = os.path.join(root, name).replace("\\", "/")
+            if path not in referenced:
+                report["orphans"].append(path)
+                if prune:
+                    os.remove(path)
+    return report
+
+
+@blobs_cli.command("migrate")
+@click.option("--prune", is_flag=True, help="Delete files no song refers to.")
+def migrate_command(prune):
+    """Move legacy uploads into the sharded store and merge duplicates."""
+    report = migrate_uploads(current_app.config["UPLOAD_FOLDER"], prune=prune)
+    print(f"Migrated {report['migrated']} files ({report['duplicates']} duplicates merged)")
+    for path in report["missing"]:
+        print(f"Missing: {path}")
+    for path in report["orphans"]:
+        print(f"{'Removed' if prune else 'Unreferenced'}: {path}")
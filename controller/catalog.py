@@ -0,0 +1,114 @@
+import base64
+import binascii
+
+from flask import current_app, url_for
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, lazyload
+
+from controller.cache import TTLCache
+from controller.database import db
+from controller.models import Song
+
+SORTS = ("id", "popular")
+
+# song_id -> True for songs known to exist; deletions invalidate their entry
+known_songs = TTLCache(ttl=0)
+
+
+def init_song_cache(app):
+    known_songs.ttl = app.config["KNOWN_SONGS_TTL"]
+
+
+def song_exists(song_id):
+    # Misses are not cached, so a new song is found on its first request
+    return known_songs.get_or_set(
+        song_id, lambda: db.session.query(Song.query.filter_by(song_id=song_id).exists()).scalar() or None
+    ) is not None
+
+
+# ================= CURSORS =================
+# A cursor is the sort key of the last row on the previous page, so the next
+# page is a range scan on the index instead of an OFFSET over the catalog.
+def encode_cursor(song, sort):
+    if sort == "popular":
+        raw = f"{song.play_count or 0}:{song.song_id}"
+    else:
+        raw = str(song.song_id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        if sort == "popular":
+            play_count, song_id = raw.split(":")
+            return int(play_count), int(song_id)
+        return int(raw)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def page_size(requested):
+    default = current_app.config["SONGS_PAGE_SIZE"]
+    maximum = current_app.config["SONGS_MAX_PAGE_SIZE"]
+    try:
+        limit = int(requested) if requested else default
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+# ================= CATALOG PAGES =================
+def song_page(sort="id", cursor=None, limit=None, genre_id=None):
+    if sort not in SORTS:
+        raise ValueError("Invalid sort")
+
+    limit = page_size(limit)
+    query = Song.query.options(
+        joinedload(Song.creator),
+        joinedload(Song.genre),
+        lazyload(Song.artists)
+    )
+    if genre_id is not None:
+        query = query.filter(Song.genre_id == genre_id)
+
+    if sort == "popular":
+        play_count = Song.play_count
+        if cursor:
+            last_count, last_id = decode_cursor(cursor, sort)
+            query = query.filter(or_(
+                play_count < last_count,
+                and_(play_count == last_count, Song.song_id < last_id)
+            ))
+        query = query.order_by(play_count.desc(), Song.song_id.desc())
+    else:
+        if cursor:
+            query = query.filter(Song.song_id > decode_cursor(cursor, sort))
+        query = query.order_by(Song.song_id)
+
+    # Fetch one extra row to know whether another page exists without a COUNT(*)
+    rows = query.limit(limit + 1).all()
+    songs = rows[:limit]
+    next_cursor = encode_cursor(songs[-1], sort) if len(rows) > limit else None
+    return songs, next_cursor
+
+
+def song_url(song):
+    path = song.file_path.replace("\\", "/")
+    if path.startswith("static/"):
+        path = path[len("static/"):]
+    return url_for("static", filename=path)
+
+
+def serialize_song(song):
+    return {
+        "song_id": song.song_id,
+        "title": song.title,
+        "artist": song.creator.username if song.creator else "Unknown",
+        "genre": song.genre.genre_name if song.genre else "Unknown",
+        "duration": song.duration,
+        "play_count": song.play_count,
+        "file_path": song_url(song),
+        "stream_url": url_for("tunex.stream_song", song_id=song.song_id)
+    }
@@ -0,0 +1,228 @@
+import time
+from collections import Counter
+from datetime import timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import joinedload
+
+from controller.cache import TTLCache
+from controller.catalog import serialize_song
+from controller.database import db, upsert
+from controller.models import ChartEntry, PlayEvent, RollupState, Song, SongTrend
+
+charts_cli = AppGroup("charts", help="Maintain the top and trending charts.")
+
+# chart -> (table, score column); "top" ranks by all-time plays, "trending" by decayed plays
+CHARTS = {
+    "top": (Song, Song.play_count),
+    "trending": (SongTrend, SongTrend.score),
+}
+SCOPES = ("global", "genre", "creator")
+
+# Trending scores are rebased before 2 ** (age / half-life) can lose precision
+REBASE_HALF_LIVES = 64
+
+# (chart, scope, scope_id, limit) -> serialized songs
+charts_cache = TTLCache(ttl=0)
+
+
+def init_charts(app):
+    charts_cache.ttl = app.config["CHARTS_CACHE_TTL"]
+
+
+def read_state(connection, name):
+    connection.execute(
+        upsert(connection, RollupState)
+        .values(name=name, last_event_id=0)
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    return connection.execute(select(RollupState.last_event_id).where(RollupState.name == name)).scalar()
+
+
+def write_state(connection, name, value):
+    connection.execute(update(RollupState.__table__).where(RollupState.name == name).values(last_event_id=value))
+
+
+# ================= TRENDING SCORES =================
+def trending_landmark(connection, half_life):
+    """The unix time trending scores are relative to, moved forward when it gets old.
+
+    A play at time t adds 2 ** ((t - landmark) / half_life), so every
+    existing score decays at the same rate and the ranking only changes
+    where plays were added. Rebasing rescales all scores once.
+    """
+    now = int(time.time())
+    landmark = read_state(connection, "trending_landmark")
+    if not landmark:
+        write_state(connection, "trending_landmark", now)
+        return now
+    if now - landmark < REBASE_HALF_LIVES * half_life:
+        return landmark
+
+    factor = 2 ** ((landmark - now) / half_life)
+    connection.execute(update(SongTrend.__table__).values(score=SongTrend.score * factor))
+    connection.execute(delete(SongTrend.__table__).where(SongTrend.score < 1e-6))
+    connection.execute(
+        update(ChartEntry.__table__).where(ChartEntry.chart == "trending").values(score=ChartEntry.score * factor)
+    )
+    write_state(connection, "trending_landmark", now)
+    return now
+
+
+def add_plays(connection, events, landmark, half_life):
+    """Add the events' decayed weights to song_trends; returns the (song, creator, genre) rows touched."""
+    weights = Counter()
+    for event in events:
+        played_at = event.played_at.replace(tzinfo=timezone.utc).timestamp()
+        weights[event.song_id] += 2 ** ((played_at - landmark) / half_life)
+
+    songs = connection.execute(
+        select(Song.song_id, Song.creator_id, Song.genre_id).where(Song.song_id.in_(weights))
+    ).all()
+    if songs:
+        stmt = upsert(connection, SongTrend)
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["song_id"],
+                set_={"score": SongTrend.score + stmt.excluded.score,
+                      "creator_id": stmt.excluded.creator_id, "genre_id": stmt.excluded.genre_id}
+            ),
+            [
+                {"song_id": song_id, "creator_id": creator_id, "genre_id": genre_id, "score": weights[song_id]}
+                for song_id, creator_id, genre_id in songs
+            ]
+        )
+    return songs
+
+
+# ================= MATERIALIZING =================
+def ranked_songs(connection, chart, scope, scope_id, size):
+    # Each chart and scope reads one index range: ix_songs_*popular or ix_song_trends_*score
+    table, score = CHARTS[chart]
+    query = select(table.song_id, score).where(score > 0)
+    if scope != "global":
+        query = query.where(getattr(table, f"{scope}_id") == scope_id)
+    return connection.execute(query.order_by(score.desc(), table.song_id.desc()).limit(size)).all()
+
+
+def rewrite_scope(connection, scope, scope_id, size):
+    for chart in CHARTS:
+        connection.execute(
+            delete(ChartEntry.__table__)
+            .where(ChartEntry.chart == chart, ChartEntry.scope == scope, ChartEntry.scope_id == scope_id)
+        )
+        rows = ranked_songs(connection, chart, scope, scope_id, size)
+        if rows:
+            connection.execute(insert(ChartEntry.__table__), [
+                {"chart": chart, "scope": scope, "scope_id": scope_id, "rank": rank,
+                 "song_id": song_id, "score": score}
+                for rank, (song_id, score) in enumerate(rows)
+            ])
+
+
+def refresh_charts(connection, half_life, size, batch_size=5000):
+    """Fold play events past the charts watermark into the trending scores,
+    then rewrite the charts of every scope those plays touched.
+
+    Runs in the caller's transaction and serializes on the watermark row,
+    like the rollup compaction. Returns the number of events read.
+    """
+    read_state(connection, "charts")
+    connection.execute(
+        update(RollupState.__table__)
+        .where(RollupState.name == "charts")
+        .values(last_event_id=RollupState.last_event_id)
+    )
+    watermark = read_state(connection, "charts")
+    landmark = trending_landmark(connection, half_life)
+
+    events = connection.execute(
+        select(PlayEvent.id, PlayEvent.song_id, PlayEvent.played_at)
+        .where(PlayEvent.id > watermark)
+        .order_by(PlayEvent.id)
+        .limit(batch_size)
+    ).all()
+    if not events:
+        return 0
+
+    songs = add_plays(connection, events, landmark, half_life)
+    scopes = {("global", 0)}
+    for _, creator_id, genre_id in songs:
+        scopes.update({("genre", genre_id), ("creator", creator_id)})
+    for scope, scope_id in sorted(scopes):
+        rewrite_scope(connection, scope, scope_id, size)
+
+    write_state(connection, "charts", events[-1].id)
+    return len(events)
+
+
+def run_chart_refresh(app):
+    total = 0
+    with app.app_context():
+        config = app.config
+        while True:
+            with db.engine.begin() as connection:
+                refreshed = refresh_charts(connection, config["TRENDING_HALF_LIFE"], config["CHART_SIZE"])
+            total += refreshed
+            if not refreshed:
+                break
+    return total
+
+
+def rebuild_charts(connection, size):
+    """Rewrite every chart, e.g. after deletions or a change of CHART_SIZE."""
+    connection.execute(delete(ChartEntry.__table__))
+    scopes = [("global", 0)]
+    scopes += [("genre", genre_id) for genre_id, in connection.execute(select(Song.genre_id).distinct())]
+    scopes += [("creator", creator_id) for creator_id, in connection.execute(select(Song.creator_id).distinct())]
+    for scope, scope_id in scopes:
+        rewrite_scope(connection, scope, scope_id, size)
+    return len(scopes)
+
+
+# ================= QUERIES =================
+def chart_songs(chart, scope, scope_id, limit):
+    """(song, score) pairs of a materialized chart, best first; trending scores are decayed to now."""
+    rows = (
+        db.session.query(Song, ChartEntry.score)
+        .options(joinedload(Song.creator), joinedload(Song.genre))
+        .join(ChartEntry, ChartEntry.song_id == Song.song_id)
+        .filter(ChartEntry.chart == chart, ChartEntry.scope == scope,
+                ChartEntry.scope_id == scope_id, ChartEntry.rank < limit)
+        .order_by(ChartEntry.rank)
+        .all()
+    )
+    if chart == "trending" and rows:
+        landmark = db.session.query(RollupState.last_event_id).filter_by(name="trending_landmark").scalar()
+        factor = 2 ** ((landmark - time.time()) / current_app.config["TRENDING_HALF_LIFE"])
+        rows = [(song, score * factor) for song, score in rows]
+    return rows
+
+
+def cached_chart(chart, scope, scope_id, limit):
+    return charts_cache.get_or_set(
+        (chart, scope, scope_id, limit),
+        lambda: [dict(serialize_song(song), score=round(score, 3))
+                 for song, score in chart_songs(chart, scope, scope_id, limit)]
+    )
+
+
+# ================= CLI =================
+@charts_cli.command("refresh")
+def refresh_command():
+    """Fold new plays into the charts now instead of waiting for the compactor."""
+    started = time.monotonic()
+    events = run_chart_refresh(current_app._get_current_object())
+    print(f"Folded {events} play events into the charts in {time.monotonic() - started:.1f}s")
+
+
+@charts_cli.command("rebuild")
+@click.option("--size", type=int, help="Songs per chart (default CHART_SIZE).")
+def rebuild_command(size):
+    """Rewrite every chart from the current play counts and trending scores."""
+    with db.engine.begin() as connection:
+        scopes = rebuild_charts(connection, size or current_app.config["CHART_SIZE"])
+    print(f"Rebuilt charts for {scopes} scopes")
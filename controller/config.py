@@ -2,6 +2,122 @@ import os
 
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
-    SQLALCHEMY_DATABASE_URI = "sqlite:///msa.sqlite3"
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///msa.sqlite3")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool; DATABASE_URL may point at Postgres (postgresql://...) instead
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+    # SQLite pragmas applied to every connection (cache_size < 0 is in KiB)
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    UPLOAD_FOLDER = "static/uploads"
+
+    # Werkzeug hash method, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"; hashes made
+    # with other settings are upgraded at the user's next login (`flask bench login` sizes the cost)
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_SALT_LENGTH = int(os.getenv("PASSWORD_SALT_LENGTH", 16))
+    # 0 hashes on the request thread; otherwise a bounded "thread" or "process" pool per worker
+    PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", 0))
+    PASSWORD_POOL = os.getenv("PASSWORD_POOL", "thread")
+    PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", 32))
+
+    # Per-process caches for the play counter: block status and known song ids
+    BLOCK_STATUS_TTL = float(os.getenv("BLOCK_STATUS_TTL", 5))
+    KNOWN_SONGS_TTL = float(os.getenv("KNOWN_SONGS_TTL", 300))
+
+    SONGS_PAGE_SIZE = int(os.getenv("SONGS_PAGE_SIZE", 50))
+    SONGS_MAX_PAGE_SIZE = int(os.getenv("SONGS_MAX_PAGE_SIZE", 100))
+
+    # Playlist positions are spaced this far apart so a drag rewrites one row (at least 2)
+    PLAYLIST_POSITION_GAP = int(os.getenv("PLAYLIST_POSITION_GAP", 1024))
+
+    # Notification inboxes are paged; old notifications are pruned by `flask notifications prune`
+    NOTIFICATIONS_PAGE_SIZE = int(os.getenv("NOTIFICATIONS_PAGE_SIZE", 20))
+    NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 180))
+
+    # Server-sent events: each worker tails the stream_events table at this interval
+    EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", 1))
+    EVENTS_RETENTION = int(os.getenv("EVENTS_RETENTION", 600))
+    EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", 15))
+
+    # Song-to-song recommendations from playlist co-occurrence (item-item cosine)
+    RECOMMEND_TOP_K = int(os.getenv("RECOMMEND_TOP_K", 20))
+    RECOMMEND_MAX_PLAYLIST = int(os.getenv("RECOMMEND_MAX_PLAYLIST", 500))
+    RECOMMEND_GENRE_BOOST = float(os.getenv("RECOMMEND_GENRE_BOOST", 0.1))
+    RECOMMEND_SEED_SONGS = int(os.getenv("RECOMMEND_SEED_SONGS", 50))
+    RECOMMEND_INTERVAL = float(os.getenv("RECOMMEND_INTERVAL", 3600))
+
+    # Catalog JSON responses: ETags from version counters and a per-process LRU of serialized bodies
+    CATALOG_VERSION_TTL = float(os.getenv("CATALOG_VERSION_TTL", 1))
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 256))
+
+    # Admin dashboard counts are cached per process; genre listings are paged
+    ADMIN_STATS_TTL = float(os.getenv("ADMIN_STATS_TTL", 60))
+    ADMIN_GENRE_PAGE_SIZE = int(os.getenv("ADMIN_GENRE_PAGE_SIZE", 20))
+    ADMIN_USER_PAGE_SIZE = int(os.getenv("ADMIN_USER_PAGE_SIZE", 50))
+
+    # Play counts are buffered per process and written behind in batches
+    PLAY_FLUSH_INTERVAL = float(os.getenv("PLAY_FLUSH_INTERVAL", 5))
+    PLAY_FLUSH_THRESHOLD = int(os.getenv("PLAY_FLUSH_THRESHOLD", 500))
+    PLAY_JOURNAL_DIR = os.getenv("PLAY_JOURNAL_DIR")
+
+    # Background folding of play events into hourly/daily analytics rollups
+    ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", 60))
+    PLAY_EVENT_RETENTION_DAYS = int(os.getenv("PLAY_EVENT_RETENTION_DAYS", 90))
+
+    # Top and trending charts, refreshed with the rollups; trending plays halve in weight every half-life
+    CHART_SIZE = int(os.getenv("CHART_SIZE", 50))
+    TRENDING_HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE", 86400))
+    CHARTS_CACHE_TTL = float(os.getenv("CHARTS_CACHE_TTL", 60))
+
+    # Audio streaming: X-Sendfile (Apache/lighttpd) or X-Accel-Redirect (nginx) offload
+    STREAM_MAX_AGE = int(os.getenv("STREAM_MAX_AGE", 3600))
+    USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", "").lower() in ("1", "true", "yes")
+    STREAM_ACCEL_REDIRECT = os.getenv("STREAM_ACCEL_REDIRECT")
+
+    # Uploads are streamed in chunks to a temp folder; metadata is read by background workers
+    UPLOAD_TEMP_FOLDER = os.getenv("UPLOAD_TEMP_FOLDER", "instance/upload_tmp")
+    MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 200 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+    BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", 2))
+
+    # Waveform peaks: (min, max) pairs per bucket; WAV is decoded natively, other formats with ffmpeg
+    WAVEFORM_BUCKETS = int(os.getenv("WAVEFORM_BUCKETS", 1000))
+    WAVEFORM_FRAMES_PER_SECOND = int(os.getenv("WAVEFORM_FRAMES_PER_SECOND", 100))
+    WAVEFORM_DECODE_RATE = int(os.getenv("WAVEFORM_DECODE_RATE", 8000))
+    WAVEFORM_MAX_AGE = int(os.getenv("WAVEFORM_MAX_AGE", 86400))
+    FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+    # MP3 renditions transcoded with ffmpeg after upload ("quality:kbit/s", lowest first);
+    # renditions at or above the original's bitrate are skipped
+    RENDITIONS = os.getenv("RENDITIONS", "low:64,medium:128,high:192")
+    TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", 1))
+
+    # Lyrics are transcribed by a background job queue ("gemini" or the offline "stub")
+    LYRICS_TRANSCRIBER = os.getenv("LYRICS_TRANSCRIBER", "gemini")
+    LYRICS_CONCURRENCY = int(os.getenv("LYRICS_CONCURRENCY", 2))
+    LYRICS_MAX_ATTEMPTS = int(os.getenv("LYRICS_MAX_ATTEMPTS", 3))
+    LYRICS_RETRY_BACKOFF = float(os.getenv("LYRICS_RETRY_BACKOFF", 5))
+    LYRICS_JOB_TIMEOUT = int(os.getenv("LYRICS_JOB_TIMEOUT", 300))
+    LYRICS_RETRY_FAILED_AFTER = int(os.getenv("LYRICS_RETRY_FAILED_AFTER", 600))
+    LYRICS_MAX_WAIT = float(os.getenv("LYRICS_MAX_WAIT", 25))
+
+    # Request metrics served at /metrics (Prometheus text format, per worker process).
+    # METRICS_TOKEN lets a scraper in with "Authorization: Bearer <token>"; admins can always read them.
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+
+    # Sampled cProfile dumps of slow requests (0 disables profiling)
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", 1))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "instance/profiles")
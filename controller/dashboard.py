@@ -0,0 +1,120 @@
+from sqlalchemy import case, func, select, union_all
+from sqlalchemy.orm import joinedload, lazyload
+
+from controller.cache import TTLCache
+from controller.catalog import encode_cursor
+from controller.database import db
+from controller.models import Genre, Role, Song, User, UserRole
+
+stats_cache = TTLCache(ttl=0)
+
+# The aggregates read whole tables by design and are cached for ADMIN_STATS_TTL;
+# `flask db check-plans` skips statements carrying this option
+CACHED_AGGREGATE = {"full_scan": "cached aggregate"}
+
+
+def init_stats_cache(app):
+    stats_cache.ttl = app.config["ADMIN_STATS_TTL"]
+
+
+def invalidate_dashboard_stats():
+    # Called after registrations, uploads and deletions
+    stats_cache.invalidate()
+
+
+# ================= AGGREGATES =================
+def role_counts():
+    """Count creators, and users who are not also creators, in one pass over user_roles."""
+    per_user = (
+        select(
+            UserRole.user_id,
+            func.max(case((Role.role_name == "CREATOR", 1), else_=0)).label("is_creator"),
+            func.max(case((Role.role_name == "USER", 1), else_=0)).label("is_user")
+        )
+        .join(Role, Role.role_id == UserRole.role_id)
+        .group_by(UserRole.user_id)
+        .subquery()
+    )
+    creators, normal_users = db.session.execute(
+        select(
+            func.coalesce(func.sum(per_user.c.is_creator), 0),
+            func.coalesce(func.sum(case(((per_user.c.is_user == 1) & (per_user.c.is_creator == 0), 1), else_=0)), 0)
+        ).execution_options(**CACHED_AGGREGATE)
+    ).one()
+    return int(normal_users), int(creators)
+
+
+def genre_counts():
+    return [
+        {"genre_id": genre_id, "genre_name": name, "songs": count}
+        for genre_id, name, count in db.session.query(Genre.genre_id, Genre.genre_name, func.count(Song.song_id))
+        .outerjoin(Song, Song.genre_id == Genre.genre_id)
+        .group_by(Genre.genre_id, Genre.genre_name)
+        .order_by(Genre.genre_id)
+        .execution_options(**CACHED_AGGREGATE)
+    ]
+
+
+def compute_stats():
+    normal_users, creators = role_counts()
+    return {
+        "normal_users": normal_users,
+        "creators": creators,
+        "total_songs": db.session.query(func.count(Song.song_id)).execution_options(**CACHED_AGGREGATE).scalar(),
+        "genres": genre_counts(),
+    }
+
+
+def dashboard_stats():
+    return stats_cache.get_or_set("stats", compute_stats)
+
+
+# ================= LISTINGS =================
+def users_with_role(role_name, exclude_role=None, after_id=0, limit=50):
+    """One page of users holding `role_name`, in user_id order after `after_id`.
+
+    Walks the (role_id, user_id) index of user_roles, so a page costs the
+    same however many users there are. Returns the users and the id to
+    pass as `after_id` for the next page, or None on the last page.
+    """
+    role_id = select(Role.role_id).where(Role.role_name == role_name).scalar_subquery()
+    query = (
+        User.query.join(UserRole, UserRole.user_id == User.user_id)
+        .filter(UserRole.role_id == role_id, UserRole.user_id > after_id)
+    )
+    if exclude_role:
+        query = query.filter(~User.roles.any(Role.role_name == exclude_role))
+    users = query.order_by(UserRole.user_id).limit(limit + 1).all()
+    if len(users) > limit:
+        return users[:limit], users[limit - 1].user_id
+    return users, None
+
+
+def first_genre_pages(limit):
+    """The first `limit` songs of every genre, with per-genre cursors.
+
+    Each genre reads one LIMITed range of ix_songs_genre_song; the ranges
+    are combined with UNION ALL, so the page costs two queries whatever
+    the size of the catalog.
+    """
+    genre_ids = db.session.execute(select(Genre.genre_id).order_by(Genre.genre_id)).scalars().all()
+    if not genre_ids:
+        return {}, {}
+    firsts = [
+        select(Song.song_id).where(Song.genre_id == genre_id).order_by(Song.song_id).limit(limit + 1).subquery()
+        for genre_id in genre_ids
+    ]
+    ids = db.session.execute(union_all(*[select(first.c.song_id) for first in firsts])).scalars().all()
+
+    pages = {}
+    songs = (Song.query.options(joinedload(Song.creator), lazyload(Song.artists))
+             .filter(Song.song_id.in_(ids)).order_by(Song.song_id))
+    for song in songs:
+        pages.setdefault(song.genre_id, []).append(song)
+
+    cursors = {}
+    for genre_id, songs in pages.items():
+        if len(songs) > limit:
+            del songs[limit:]
+            cursors[genre_id] = encode_cursor(songs[-1], "id")
+    return pages, cursors
@@ -0,0 +1,185 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from controller.database import db
+from controller.models import StreamEvent
+
+MAX_QUEUED_EVENTS = 1000
+
+
+def publish(connection, channel, event, data):
+    """Append an event to the log in the caller's transaction.
+
+    It becomes visible to subscribers in every worker process once the
+    transaction commits, so rolled-back changes are never announced.
+    """
+    connection.execute(insert(StreamEvent.__table__).values(
+        channel=channel, event=event, data=json.dumps(data), created_at=datetime.utcnow()
+    ))
+
+
+def publish_many(connection, events):
+    # events: (channel, event, data) tuples
+    if events:
+        now = datetime.utcnow()
+        connection.execute(insert(StreamEvent.__table__), [
+            {"channel": channel, "event": event, "data": json.dumps(data), "created_at": now}
+            for channel, event, data in events
+        ])
+
+
+class Subscription:
+    def __init__(self, channels, after=0):
+        self.channels = set(channels)
+        self.queue = queue.Queue(MAX_QUEUED_EVENTS)
+        self.last_id = 0
+        # Events up to the client's Last-Event-ID were already sent to it
+        self.after = after
+        self.overflowed = False
+
+    def deliver(self, row):
+        if self.overflowed or row.id <= self.after:
+            return
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            # A stalled client: its stream ends once drained, and the browser
+            # reconnects with Last-Event-ID to be replayed the rest in order
+            self.overflowed = True
+
+
+class EventHub:
+    """SQLite-backed pub/sub for server-sent events.
+
+    Publishers append rows to stream_events inside their own transactions.
+    One thread per worker process tails the table and fans new rows out to
+    that process's subscribers, so the database sees one poll per worker
+    however many clients are connected, and no external broker is needed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.last_id = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config["EVENTS_POLL_INTERVAL"]
+        self.retention = timedelta(seconds=app.config["EVENTS_RETENTION"])
+        self.heartbeat = app.config["EVENTS_HEARTBEAT"]
+        app.extensions["event_hub"] = self
+
+    def subscribe(self, channels, last_event_id=None):
+        self._ensure_started()
+        subscription = Subscription(channels, last_event_id or 0)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            subscription.last_id = self.last_id
+
+        # Replay what a reconnecting client missed; the tail thread only
+        # delivers rows after the hub's position at subscription time
+        if last_event_id is not None and last_event_id < subscription.last_id:
+            with self.app.app_context(), db.engine.connect() as connection:
+                rows = connection.execute(
+                    select(StreamEvent.__table__)
+                    .where(StreamEvent.id > last_event_id,
+                           StreamEvent.id <= subscription.last_id,
+                           StreamEvent.channel.in_(subscription.channels))
+                    .order_by(StreamEvent.id)
+                    .limit(MAX_QUEUED_EVENTS)
+                ).all()
+            for row in rows:
+                subscription.deliver(row)
+            if len(rows) == MAX_QUEUED_EVENTS:
+                subscription.overflowed = True  # more to replay after a reconnect
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def _ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.subscriptions = set()
+            with self.app.app_context():
+                self.last_id = db.session.query(func.max(StreamEvent.id)).scalar() or 0
+                db.session.remove()
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name="event-hub", daemon=True).start()
+
+    def _run(self):
+        last_prune = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.poll()
+                    if time.monotonic() - last_prune > 60:
+                        self.prune()
+                        last_prune = time.monotonic()
+            except Exception as e:
+                print(f"Event hub poll failed: {e}")
+
+    def poll(self):
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(StreamEvent.__table__)
+                .where(StreamEvent.id > self.last_id)
+                .order_by(StreamEvent.id)
+                .limit(MAX_QUEUED_EVENTS)
+            ).all()
+        with self.lock:
+            for row in rows:
+                for subscription in self.subscriptions:
+                    if row.channel in subscription.channels:
+                        subscription.deliver(row)
+            if rows:
+                self.last_id = rows[-1].id
+
+    def prune(self):
+        # Events only need to live long enough for clients to reconnect
+        cutoff = datetime.utcnow() - self.retention
+        with db.engine.begin() as connection:
+            connection.execute(StreamEvent.__table__.delete().where(StreamEvent.created_at < cutoff))
+
+    def stream(self, subscription):
+        """Yield a subscription's events as text/event-stream chunks."""
+        try:
+            yield f"retry: {int(self.interval * 1000) + 2000}\n\n"
+            while True:
+                if subscription.overflowed and subscription.queue.empty():
+                    return
+                try:
+                    row = subscription.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {row.id}\nevent: {row.event}\ndata: {row.data}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+event_hub = EventHub()
+
+
+# ================= CHANNELS =================
+def user_channels(user_id, roles):
+    channels = {f"user:{user_id}", "all"}
+    channels.update(f"role:{role}" for role in roles)
+    if "CREATOR" in roles:
+        channels.add(f"creator:{user_id}")
+    return channels
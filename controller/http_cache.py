@@ -0,0 +1,98 @@
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import select
+
+from controller.cache import LRUCache, TTLCache
+from controller.database import db, upsert
+from controller.models import RollupState
+
+# Version counters live in rollup_state as "version:<name>" rows:
+#   catalog - songs added, edited or deleted, genre or creator names changed
+#   plays   - play counts flushed
+#   lyrics  - lyrics stored or songs deleted
+version_cache = TTLCache(ttl=0)
+
+# (path, query, versions) -> serialized body and its gzip copy
+responses = LRUCache(maxsize=0)
+
+
+def init_response_cache(app):
+    version_cache.ttl = app.config["CATALOG_VERSION_TTL"]
+    responses.maxsize = app.config["RESPONSE_CACHE_SIZE"]
+    # Entries are keyed by version numbers, which another app's database reuses
+    version_cache.invalidate()
+    responses.invalidate()
+
+
+def bump_version(*names, connection=None):
+    """Move the named counters on, in the caller's transaction.
+
+    Other workers notice within CATALOG_VERSION_TTL.
+    """
+    connection = connection or db.session.connection()
+    for name in names:
+        stmt = upsert(connection, RollupState).values(name=f"version:{name}", last_event_id=1)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"last_event_id": RollupState.last_event_id + 1}
+        ))
+        version_cache.invalidate(name)
+
+
+def current_version(name):
+    return version_cache.get_or_set(name, lambda: db.session.execute(
+        select(RollupState.last_event_id).where(RollupState.name == f"version:{name}")
+    ).scalar() or 0)
+
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def cached_json(*versions):
+    """Serve a GET view with a strong ETag derived from the named version counters.
+
+    A matching If-None-Match is answered with 304 before the view runs,
+    and 200 responses are kept serialized (plus a gzip copy) in a
+    per-process LRU keyed by the versions and the query string. Only for
+    views whose output depends on nothing else, e.g. not on the session.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            state = ".".join(str(current_version(name)) for name in versions)
+            query = tuple(sorted(request.args.items(multi=True)))
+            digest = hashlib.sha1(repr((request.path, query)).encode()).hexdigest()[:16]
+            compressed = "gzip" in request.accept_encodings
+            # Each encoding is different bytes, so it gets its own strong ETag
+            etag = f"{state}-{digest}{'-gz' if compressed else ''}"
+            if request.if_none_match.contains(etag):
+                return not_modified(etag)
+
+            key = (request.path, query, state)
+            entry = responses.get(key)
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = (body, gzip.compress(body, 6), response.mimetype)
+                responses.set(key, entry)
+
+            body, gzipped, mimetype = entry
+            response = current_app.response_class(gzipped if compressed else body, mimetype=mimetype)
+            if compressed:
+                response.headers["Content-Encoding"] = "gzip"
+            response.set_etag(etag)
+            response.vary.add("Accept-Encoding")
+            response.cache_control.public = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapped
+    return decorator
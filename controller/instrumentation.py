@@ -0,0 +1,190 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from controller.database import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.series = {}
+
+    def observe(self, values, amount):
+        # Cumulative counts per bucket, then sum and count
+        series = self.series.setdefault(values, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if amount <= bound:
+                series[i] += 1
+        series[-2] += amount
+        series[-1] += 1
+
+    def render(self, worker):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("worker",)
+        for values, series in sorted(self.series.items()):
+            values += (worker,)
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-2] + [series[-1]]):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(names, values, le)} {count}")
+            lines.append(f"{self.name}_sum{format_labels(names, values)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(names, values)} {series[-1]}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.series = Counter()
+
+    def inc(self, values, amount=1):
+        self.series[values] += amount
+
+    def render(self, worker):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        names = self.labels + ("worker",)
+        for values, total in sorted(self.series.items()):
+            lines.append(f"{self.name}{format_labels(names, values + (worker,))} {total}")
+        return lines
+
+
+class Instrumentation:
+    """Per-request latency, SQL statement counts and an N+1 detector.
+
+    Statements are counted with engine events while a request context is
+    active, so background threads are not attributed to any endpoint.
+    A request running the same SELECT N_PLUS_ONE_THRESHOLD times or more is
+    reported. Requests are recorded at teardown, so those that raise count
+    as status 500. Metrics are kept per worker process, labelled with its
+    pid, and served by /metrics in the Prometheus text format. With
+    PROFILE_SAMPLE_RATE > 0 a sample of
+    requests runs under cProfile, and those slower than PROFILE_SLOW_SECONDS
+    are dumped to PROFILE_DIR for `python -m pstats` or snakeviz.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.latency = Histogram("tunex_request_duration_seconds", "Request latency by endpoint.",
+                                 ("endpoint", "method"), LATENCY_BUCKETS)
+        self.requests = CounterMetric("tunex_requests_total", "Requests by endpoint and status.",
+                                      ("endpoint", "method", "status"))
+        self.statements = Histogram("tunex_sql_statements_per_request", "SQL statements run by one request.",
+                                    ("endpoint",), STATEMENT_BUCKETS)
+        self.sql_time = CounterMetric("tunex_sql_duration_seconds_total", "Time spent in SQL by endpoint.",
+                                      ("endpoint",))
+        self.repeated = CounterMetric("tunex_repeated_statement_requests_total",
+                                      "Requests that ran one SELECT N_PLUS_ONE_THRESHOLD times or more.",
+                                      ("endpoint",))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config["METRICS_ENABLED"]
+        self.threshold = app.config["N_PLUS_ONE_THRESHOLD"]
+        self.profile_rate = app.config["PROFILE_SAMPLE_RATE"]
+        self.profile_slow = app.config["PROFILE_SLOW_SECONDS"]
+        self.profile_dir = app.config["PROFILE_DIR"]
+        app.extensions["instrumentation"] = self
+        if not self.enabled:
+            return
+
+        if self.profile_rate > 0:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._before_statement)
+            event.listen(db.engine, "after_cursor_execute", self._after_statement)
+        app.before_request(self._start)
+        app.after_request(self._status)
+        app.teardown_request(self._finish)
+
+    # ================= SQL =================
+    def _before_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "request_started" in g:
+            conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    def _after_statement(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("statement_started")
+        if not started or not has_request_context() or "request_started" not in g:
+            return
+        g.sql_time += time.perf_counter() - started.pop()
+        g.sql_count += 1
+        if not executemany and statement.lstrip()[:6].upper() == "SELECT":
+            g.sql_selects[statement] += 1
+
+    # ================= REQUESTS =================
+    def _start(self):
+        g.request_started = time.perf_counter()
+        g.sql_count, g.sql_time, g.sql_selects = 0, 0.0, Counter()
+        if self.profile_rate > 0 and random.random() < self.profile_rate:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    def _status(self, response):
+        g.response_status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        # Runs whether or not the view raised, so errors and profilers are never missed
+        if "request_started" not in g:
+            return
+        elapsed = time.perf_counter() - g.pop("request_started")
+        endpoint = request.endpoint or "unmatched"
+        status = 500 if exc is not None else g.get("response_status", 500)
+
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed >= self.profile_slow:
+                self._dump(profiler, endpoint, elapsed)
+
+        repeated = [(statement, count) for statement, count in g.sql_selects.items() if count >= self.threshold]
+        for statement, count in repeated:
+            print(f"Possible N+1 in {endpoint}: {count}x {' '.join(statement.split())[:200]}")
+
+        with self.lock:
+            self.latency.observe((endpoint, request.method), elapsed)
+            self.requests.inc((endpoint, request.method, status))
+            self.statements.observe((endpoint,), g.sql_count)
+            self.sql_time.inc((endpoint,), g.sql_time)
+            if repeated:
+                self.repeated.inc((endpoint,))
+
+    def _dump(self, profiler, endpoint, elapsed):
+        name = f"{endpoint.replace('.', '-')}-{int(time.time() * 1000)}-{os.getpid()}-{elapsed * 1000:.0f}ms.prof"
+        try:
+            profiler.dump_stats(os.path.join(self.profile_dir, name))
+        except OSError as e:
+            print(f"Could not write profile {name}: {e}")
+
+    # ================= EXPOSITION =================
+    def render(self):
+        # Each worker reports its own series; sum them without(worker) when querying
+        worker = os.getpid()
+        with self.lock:
+            lines = []
+            for metric in (self.latency, self.requests, self.statements, self.sql_time, self.repeated):
+                lines.extend(metric.render(worker))
+        return "\n".join(lines) + "\n"
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,365 @@
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from controller.database import db, upsert
+from controller.http_cache import bump_version
+from controller.models import LyricsJob, Song
+
+lyrics_cli = AppGroup("lyrics", help="Transcribe song lyrics ahead of time.")
+
+INSTRUMENTAL = "♪ Instrumental ♪\n(No lyrics detected)"
+
+PROMPT = (
+    "Transcribe only the sung lyrics from this audio. "
+    "Return clean lyrics with proper line breaks (\\n). "
+    "Do not add timestamps, explanations, or extra text."
+)
+
+
+def clean_lyrics(text):
+    lyrics = (text or "").strip()
+
+    # Clean common Gemini artifacts
+    if lyrics.startswith("```"):
+        lyrics = lyrics.split("```", 1)[1].rsplit("```", 1)[0].strip()
+
+    if not lyrics or lyrics.lower() in ["no lyrics", "instrumental", ""]:
+        lyrics = INSTRUMENTAL
+    return lyrics
+
+
+# ================= TRANSCRIBERS =================
+# A transcriber is any object with transcribe(path) -> lyrics text.
+class GeminiTranscriber:
+    """Transcribes with Gemini; the SDK is imported and configured on first use."""
+
+    def __init__(self, api_key, model_name):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.genai = None
+        self.model = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.model is None:
+                if not self.api_key:
+                    raise RuntimeError("GEMINI_API_KEY is not set in environment variables")
+                import google.generativeai as genai  # Gemini AI
+                genai.configure(api_key=self.api_key)
+                self.model = genai.GenerativeModel(self.model_name)
+                self.genai = genai
+                print(f"Gemini model loaded: {self.model_name}")
+        return self.genai, self.model
+
+    def transcribe(self, path):
+        genai, model = self.load()
+        uploaded_file = genai.upload_file(path=path)
+        try:
+            response = model.generate_content([uploaded_file, PROMPT])
+            return clean_lyrics(response.text)
+        finally:
+            genai.delete_file(uploaded_file.name)
+
+
+class StubTranscriber:
+    """Offline stand-in for development, tests and backfill dry runs."""
+
+    def __init__(self, lyrics=None, delay=0):
+        self.lyrics = lyrics
+        self.delay = delay
+
+    def transcribe(self, path):
+        if self.delay:
+            time.sleep(self.delay)
+        name = os.path.splitext(os.path.basename(path))[0]
+        return clean_lyrics(self.lyrics or f"Lyrics for {name}\n(transcribed offline)")
+
+
+# ================= JOB QUEUE =================
+class LyricsQueue:
+    """Database-backed transcription queue with a bounded per-process pool.
+
+    The lyrics_jobs row for a song is the single-flight lock: whichever
+    worker flips it from queued to running does the transcription, and
+    everyone else just waits for songs.lyrics to be filled in. Failed
+    attempts are retried with exponential backoff; jobs whose worker died
+    are picked up again once LYRICS_JOB_TIMEOUT has passed.
+    """
+
+    def __init__(self, app=None, transcriber=None):
+        self.app = None
+        self.transcriber = transcriber
+        self.executor = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.submitted = set()
+        self.finished = threading.Condition(self.lock)
+        if app is not None:
+            self.init_app(app, transcriber)
+
+    def init_app(self, app, transcriber=None):
+        self.app = app
+        if transcriber is not None:
+            self.transcriber = transcriber
+        self.concurrency = app.config["LYRICS_CONCURRENCY"]
+        self.max_attempts = app.config["LYRICS_MAX_ATTEMPTS"]
+        self.backoff = app.config["LYRICS_RETRY_BACKOFF"]
+        self.timeout = timedelta(seconds=app.config["LYRICS_JOB_TIMEOUT"])
+        self.retry_failed_after = timedelta(seconds=app.config["LYRICS_RETRY_FAILED_AFTER"])
+        app.extensions["lyrics_queue"] = self
+
+    # ================= PRODUCERS =================
+    def enqueue(self, song_id):
+        now = datetime.utcnow()
+        connection = db.session.connection()
+        connection.execute(
+            upsert(connection, LyricsJob)
+            .values(song_id=song_id, status="queued", attempts=0, next_attempt_at=now, updated_at=now)
+            .on_conflict_do_nothing()
+        )
+
+        job = db.session.get(LyricsJob, song_id)
+        if job.status == "failed" and job.updated_at < now - self.retry_failed_after:
+            job.status, job.attempts, job.next_attempt_at = "queued", 0, now
+        elif job.status == "running" and job.started_at and job.started_at < now - self.timeout:
+            job.status, job.next_attempt_at = "queued", now  # its worker died
+        elif job.status == "done" and not db.session.query(Song.lyrics).filter_by(song_id=song_id).scalar():
+            # A leftover job for a deleted song whose id was reused
+            job.status, job.attempts, job.next_attempt_at = "queued", 0, now
+        db.session.commit()
+
+        if job.status == "queued" and job.next_attempt_at <= now:
+            self.submit(song_id)
+        return job
+
+    def wait(self, song_id, timeout):
+        # Woken early when this process finishes the job; other workers' results
+        # are picked up by re-reading the row
+        deadline = time.monotonic() + timeout
+        while True:
+            db.session.expire_all()
+            lyrics = db.session.query(Song.lyrics).filter_by(song_id=song_id).scalar()
+            job = db.session.get(LyricsJob, song_id)
+            if lyrics or not job or job.status == "failed":
+                return lyrics
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self.finished:
+                self.finished.wait(min(remaining, 1.0))
+
+    # ================= WORKERS =================
+    def submit(self, song_id):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix="lyrics")
+                self.submitted = set()
+                self.pid = os.getpid()
+            if song_id in self.submitted:
+                return
+            self.submitted.add(song_id)
+        self.executor.submit(self._run, song_id)
+
+    def _run(self, song_id):
+        try:
+            with self.app.app_context():
+                try:
+                    self.process(song_id)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            print(f"Lyrics job for song {song_id} failed: {e}")
+        finally:
+            with self.finished:
+                self.submitted.discard(song_id)
+                self.finished.notify_all()
+
+    def process(self, song_id, reschedule=True):
+        """Run the song's job if it is due; returns the job's new status."""
+        now = datetime.utcnow()
+        claimed = (LyricsJob.query
+                   .filter(LyricsJob.song_id == song_id,
+                           LyricsJob.status == "queued",
+                           LyricsJob.next_attempt_at <= now)
+                   .update({"status": "running", "attempts": LyricsJob.attempts + 1, "started_at": now}))
+        db.session.commit()
+        if not claimed:
+            return None
+
+        job = db.session.get(LyricsJob, song_id)
+        song = db.session.get(Song, song_id)
+        if song is None:
+            db.session.delete(job)
+            db.session.commit()
+            return None
+
+        if not song.lyrics:
+            try:
+                lyrics = self.transcriber.transcribe(song.file_path.replace("\\", "/"))
+            except Exception as e:
+                self.fail(job, e, reschedule)
+                return job.status
+            song.lyrics = lyrics
+            bump_version("lyrics")
+
+        job.status = "done"
+        job.error = None
+        db.session.commit()
+        return job.status
+
+    def fail(self, job, error, reschedule=True):
+        print(f"Lyrics transcription failed for song {job.song_id}: {error}")
+        job.error = str(error)
+        if job.attempts >= self.max_attempts:
+            job.status = "failed"
+            db.session.commit()
+            return
+
+        delay = self.backoff * 2 ** (job.attempts - 1)
+        job.status = "queued"
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+        if not reschedule:
+            return
+
+        retry = threading.Timer(delay, self.submit, [job.song_id])
+        retry.daemon = True
+        retry.start()
+
+
+lyrics_queue = LyricsQueue()
+
+
+# ================= BACKFILL =================
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_at, now)
+            self.next_at = slot + self.interval
+        time.sleep(slot - now)
+
+
+def pending_songs(batch_size=500, retry_failed=False):
+    """Yield ids of songs without lyrics, in id order.
+
+    Progress lives in the songs and lyrics_jobs tables, so an interrupted
+    backfill resumes where it stopped. Songs whose job already failed are
+    skipped unless retry_failed is set.
+    """
+    last_id = 0
+    while True:
+        query = (db.session.query(Song.song_id)
+                 .outerjoin(LyricsJob, LyricsJob.song_id == Song.song_id)
+                 .filter(Song.lyrics.is_(None), Song.song_id > last_id))
+        if not retry_failed:
+            query = query.filter(db.or_(LyricsJob.status.is_(None), LyricsJob.status != "failed"))
+        ids = [song_id for song_id, in query.order_by(Song.song_id).limit(batch_size)]
+        if not ids:
+            return
+        yield from ids
+        last_id = ids[-1]
+
+
+def backfill_song(queue, song_id, limiter):
+    # Retries happen inline so the backfill finishes with every job settled
+    now = datetime.utcnow()
+    connection = db.session.connection()
+    connection.execute(
+        upsert(connection, LyricsJob)
+        .values(song_id=song_id, status="queued", attempts=0, next_attempt_at=now, updated_at=now)
+        .on_conflict_do_nothing()
+    )
+    LyricsJob.query.filter_by(song_id=song_id, status="failed").update(
+        {"status": "queued", "attempts": 0, "next_attempt_at": now}
+    )
+    db.session.commit()
+
+    while True:
+        limiter.wait()
+        status = queue.process(song_id, reschedule=False)
+        if status != "queued":
+            return status or "skipped"
+        job = db.session.get(LyricsJob, song_id)
+        time.sleep(max((job.next_attempt_at - datetime.utcnow()).total_seconds(), 0))
+
+
+def backfill(app, queue, workers, rate=None, limit=None, retry_failed=False, progress=None):
+    """Transcribe every song that has no lyrics yet; returns a summary report."""
+    limiter = RateLimiter(rate)
+    results = Counter()
+    started = time.monotonic()
+
+    def run(song_id):
+        with app.app_context():
+            try:
+                return backfill_song(queue, song_id, limiter)
+            except Exception as e:
+                print(f"Lyrics backfill failed for song {song_id}: {e}")
+                return "failed"
+            finally:
+                db.session.remove()
+
+    with app.app_context():
+        song_ids = list(islice(pending_songs(retry_failed=retry_failed), limit))
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="lyrics-backfill") as pool:
+        for status in pool.map(run, song_ids):
+            results[status] += 1
+            if progress:
+                progress(sum(results.values()), len(song_ids), time.monotonic() - started)
+
+    elapsed = time.monotonic() - started
+    return {
+        "total": len(song_ids),
+        "done": results["done"],
+        "failed": results["failed"],
+        "skipped": results["skipped"],
+        "elapsed": elapsed,
+        "rate": len(song_ids) / elapsed if elapsed else 0.0,
+    }
+
+
+# ================= CLI =================
+@lyrics_cli.command("backfill")
+@click.option("--workers", type=int, help="Concurrent transcriptions (default LYRICS_CONCURRENCY).")
+@click.option("--rate", type=float, help="Maximum transcription requests per second.")
+@click.option("--limit", type=int, help="Stop after this many songs.")
+@click.option("--retry-failed", is_flag=True, help="Also retry songs whose job already failed.")
+@click.option("--stub", is_flag=True, help="Use the offline stub transcriber.")
+@click.option("--stub-delay", type=float, default=0, help="Simulated latency per song for --stub.")
+def backfill_command(workers, rate, limit, retry_failed, stub, stub_delay):
+    """Transcribe lyrics for every song that has none, resuming where a previous run stopped."""
+    app = current_app._get_current_object()
+    queue = app.extensions["lyrics_queue"]
+    if stub:
+        queue.transcriber = StubTranscriber(delay=stub_delay)
+    workers = workers or app.config["LYRICS_CONCURRENCY"]
+
+    def progress(count, total, elapsed):
+        if count % 25 == 0 or count == total:
+            print(f"{count}/{total} songs, {count / elapsed:.2f} songs/s")
+
+    report = backfill(app, queue, workers, rate, limit, retry_failed, progress)
+    print(f"Transcribed {report['done']} of {report['total']} songs "
+          f"({report['failed']} failed, {report['skipped']} skipped) "
+          f"in {report['elapsed']:.1f}s, {report['rate']:.2f} songs/s with {workers} workers")
@@ -0,0 +1,108 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+
+from controller.database import db
+from controller.models import Genre, Role, User
+from controller.notifications import create_missing_counters
+from controller.passwords import passwords
+from controller.query_plans import find_full_scans
+from controller.search import create_search_index
+
+db_cli = AppGroup("db", help="Create, upgrade and seed the database.")
+
+DEFAULT_ROLES = ["ADMIN", "CREATOR", "USER"]
+DEFAULT_GENRES = ["Pop", "Rock", "Hip-Hop", "Classical"]
+
+
+def upgrade_schema():
+    """Add columns and indexes that were introduced after a table was first created.
+
+    db.create_all() only creates missing tables, so existing databases get
+    new (nullable) columns here with ALTER TABLE ... ADD COLUMN.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            if index.unique:
+                remove_duplicates(table, [column.name for column in index.columns])
+            index.create(db.engine, checkfirst=True)
+
+
+def remove_duplicates(table, columns):
+    # A unique index cannot be built over duplicate rows; keep the oldest of each
+    key = ", ".join(columns)
+    primary_key = table.primary_key.columns.values()[0].name
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            f"DELETE FROM {table.name} WHERE {primary_key} NOT IN "
+            f"(SELECT MIN({primary_key}) FROM {table.name} GROUP BY {key})"
+        ))
+
+
+def seed_data():
+    # Safe to run repeatedly: only rows that are missing get inserted
+    for r in DEFAULT_ROLES:
+        if not Role.query.filter_by(role_name=r).first():
+            db.session.add(Role(role_name=r))
+
+    if not Genre.query.first():
+        db.session.add_all([Genre(genre_name=name) for name in DEFAULT_GENRES])
+
+    db.session.commit()
+
+    admin = User.query.filter_by(email="admin@tunex.com").first()
+    if not admin:
+        admin = User(
+            username="TUNEX_ADMIN",
+            email="admin@tunex.com",
+            password_hash=passwords.hash("admin123")
+        )
+        admin.roles.append(Role.query.filter_by(role_name="ADMIN").first())
+        db.session.add(admin)
+        db.session.commit()
+
+
+def init_db():
+    db.create_all()
+    upgrade_schema()
+    create_search_index()
+    seed_data()
+    # Unread counters start from the notifications that existed before them
+    create_missing_counters()
+
+
+@db_cli.command("init")
+def init_command():
+    """Create missing tables, columns and indexes, then seed roles, genres and the admin."""
+    init_db()
+    print("Database is up to date")
+
+
+@db_cli.command("check-plans")
+def check_plans_command():
+    """Fail if a route runs a query that scans a whole table instead of using an index."""
+    problems = find_full_scans(current_app._get_current_object())
+    for problem in problems:
+        print(f"{problem['url']}: full scan of {problem['table']}")
+        print(f"  {problem['statement']}")
+        for detail in problem["plan"]:
+            print(f"    {detail}")
+    if problems:
+        raise click.ClickException(f"{len(problems)} queries fall back to a full table scan")
+    print("No full table scans")
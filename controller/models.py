@@ -5,7 +5,7 @@ from datetime import datetime
 class User(db.Model):
     __tablename__ = 'users'
     user_id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), nullable=False)
+    username = db.Column(db.String(80), nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
 
@@ -30,6 +30,11 @@ class UserRole(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     role_id = db.Column(db.Integer, db.ForeignKey('roles.role_id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_user_roles_user_role', 'user_id', 'role_id'),
+        db.Index('ix_user_roles_role_user', 'role_id', 'user_id'),
+    )
+
 
 class Genre(db.Model):
     __tablename__ = 'genres'
@@ -55,18 +60,40 @@ class Song(db.Model):
     creator_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     genre_id = db.Column(db.Integer, db.ForeignKey('genres.genre_id'), nullable=False)
     lyrics = db.Column(db.Text, nullable=True)
+    bitrate = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
 
     genre = db.relationship('Genre', backref=db.backref('songs', lazy=True))
     creator = db.relationship('User', backref=db.backref('uploaded_songs', lazy=True))
+    # Songs with the same audio share one blob and therefore one set of renditions
+    renditions = db.relationship(
+        'AudioRendition',
+        primaryjoin='foreign(AudioRendition.content_hash) == Song.content_hash',
+        viewonly=True,
+        lazy=True
+    )
 
     artists = db.relationship(
         'Artist',
         secondary='song_artists',
-        backref=db.backref('songs', lazy='joined', overlaps="song_artists"),
-        lazy='joined',
+        backref=db.backref('songs', lazy=True, overlaps="song_artists"),
+        # A joined eager load of a many-to-many makes SQLite materialize the whole
+        # song_artists table; selectin reads only the loaded songs' rows by index
+        lazy='selectin',
         overlaps="song_artists"
     )
 
+    __table_args__ = (
+        db.Index('ix_songs_creator', 'creator_id'),
+        db.Index('ix_songs_genre_song', 'genre_id', 'song_id'),
+        db.Index('ix_songs_popular', 'play_count', 'song_id'),
+        db.Index('ix_songs_genre_popular', 'genre_id', 'play_count', 'song_id'),
+        db.Index('ix_songs_creator_popular', 'creator_id', 'play_count', 'song_id'),
+        # Ids of deleted songs are never handed out again, so nothing keyed by
+        # song_id can carry over to a new upload (databases created from now on)
+        {'sqlite_autoincrement': True},
+    )
+
 
 class SongArtist(db.Model):
     __tablename__ = 'song_artists'
@@ -74,15 +101,36 @@ class SongArtist(db.Model):
     song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.artist_id'), nullable=False)
 
-    song = db.relationship('Song', backref=db.backref('song_artists', lazy=True))
+    __table_args__ = (
+        db.Index('ix_song_artists_song_artist', 'song_id', 'artist_id'),
+        db.Index('ix_song_artists_artist', 'artist_id'),
+    )
+
+    # Link rows are written through Song.artists, which also removes them when a song is deleted
+    song = db.relationship('Song', backref=db.backref('song_artists', lazy=True, viewonly=True))
     artist = db.relationship('Artist', backref=db.backref('song_artists', lazy=True))
 
 
+# Top-K neighbours of each song by playlist co-occurrence, rebuilt by `flask recommendations build`.
+# Deleting a song removes its rows from both sides; readers join songs.
+class SongSimilarity(db.Model):
+    __tablename__ = 'song_similarities'
+    song_id = db.Column(db.Integer, primary_key=True)
+    similar_song_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_song_similarities_song_rank', 'song_id', 'rank'),
+        db.Index('ix_song_similarities_similar', 'similar_song_id'),
+    )
+
+
 class Playlist(db.Model):
     __tablename__ = 'playlists'
     playlist_id = db.Column(db.Integer, primary_key=True)
     playlist_name = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False, index=True)
 
     user = db.relationship('User', backref=db.backref('playlists', lazy=True))
 
@@ -94,6 +142,13 @@ class PlaylistSong(db.Model):
     song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), nullable=False)
     position = db.Column(db.Integer, nullable=False)
 
+    # A unique index rather than a constraint so existing SQLite tables can gain it
+    __table_args__ = (
+        db.Index('uq_playlist_songs_playlist_song', 'playlist_id', 'song_id', unique=True),
+        db.Index('ix_playlist_songs_playlist_position', 'playlist_id', 'position'),
+        db.Index('ix_playlist_songs_song', 'song_id'),
+    )
+
     playlist = db.relationship('Playlist', backref=db.backref('playlist_songs', lazy=True))
     song = db.relationship('Song', backref=db.backref('playlist_songs', lazy=True))
 
@@ -102,4 +157,164 @@ class Notification(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    user = db.relationship('User', backref='notifications')
\ No newline at end of file
+    read_at = db.Column(db.DateTime, nullable=True)
+    user = db.relationship('User', backref='notifications')
+
+    # Inboxes are paged newest first by id; retention pruning goes by timestamp
+    __table_args__ = (
+        db.Index('ix_notification_user_id', 'user_id', 'id'),
+        db.Index('ix_notification_timestamp', 'timestamp'),
+    )
+
+
+# Unread notifications per user, kept in step with inserts, reads and pruning
+class NotificationCounter(db.Model):
+    __tablename__ = 'notification_counters'
+    user_id = db.Column(db.Integer, primary_key=True)
+    unread = db.Column(db.Integer, default=0, nullable=False)
+
+# One stored audio file, shared by every song whose content hashes the same
+class AudioBlob(db.Model):
+    __tablename__ = 'audio_blobs'
+    content_hash = db.Column(db.String(64), primary_key=True)
+    file_path = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=True)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+
+
+# Lower-bitrate MP3 copies of a blob, stored next to it as <hash>.<quality>.mp3
+class AudioRendition(db.Model):
+    __tablename__ = 'audio_renditions'
+    content_hash = db.Column(db.String(64), primary_key=True)
+    quality = db.Column(db.String(16), primary_key=True)
+    bitrate = db.Column(db.Integer, nullable=False)  # kbit/s
+    file_path = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+# In-progress resumable upload; chunks are appended to a temp file until complete
+class UploadSession(db.Model):
+    __tablename__ = 'upload_sessions'
+    upload_id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.genre_id'), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# One transcription job per song; the primary key gives single-flight across workers
+class LyricsJob(db.Model):
+    __tablename__ = 'lyrics_jobs'
+    song_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(16), default='queued', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# Downsampled min/max peaks for drawing a song's waveform without downloading it
+class SongWaveform(db.Model):
+    __tablename__ = 'song_waveforms'
+    song_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(16), nullable=False)  # ready / failed
+    buckets = db.Column(db.Integer, nullable=True)
+    peaks = db.Column(db.LargeBinary, nullable=True)  # int8 (min, max) pairs
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Append-only log behind the server-sent event streams; every worker tails it
+class StreamEvent(db.Model):
+    __tablename__ = 'stream_events'
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(64), nullable=False)
+    event = db.Column(db.String(32), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_stream_events_channel_id', 'channel', 'id'),
+    )
+
+
+# ================= PLAY ANALYTICS =================
+# Append-only log of individual plays, written in batches by the play buffer.
+# Rows outlive the song they refer to, so song_id is not a foreign key.
+class PlayEvent(db.Model):
+    __tablename__ = 'play_events'
+    id = db.Column(db.Integer, primary_key=True)
+    song_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    played_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+# Hourly and daily play totals per song, maintained by the rollup compactor
+class SongPlayRollup(db.Model):
+    __tablename__ = 'song_play_rollups'
+    song_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(8), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    creator_id = db.Column(db.Integer, nullable=False)
+    plays = db.Column(db.Integer, default=0, nullable=False)
+    listeners = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_rollups_creator_window', 'creator_id', 'period', 'bucket', 'song_id', 'plays'),
+    )
+
+
+# One row per listener per song per day, for exact unique-listener counts
+class SongListener(db.Model):
+    __tablename__ = 'song_listeners'
+    song_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    creator_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_listeners_creator_day', 'creator_id', 'day', 'user_id'),
+    )
+
+
+# Exponentially decayed plays per song. Scores are relative to the landmark time kept in
+# rollup_state ("trending_landmark"), so a new play only adds to its song's row.
+class SongTrend(db.Model):
+    __tablename__ = 'song_trends'
+    song_id = db.Column(db.Integer, primary_key=True)
+    creator_id = db.Column(db.Integer, nullable=False)
+    genre_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_song_trends_score', 'score', 'song_id'),
+        db.Index('ix_song_trends_genre_score', 'genre_id', 'score', 'song_id'),
+        db.Index('ix_song_trends_creator_score', 'creator_id', 'score', 'song_id'),
+    )
+
+
+# Materialized top-N charts ("top" by play count, "trending" by decayed plays) for the
+# whole catalog (scope "global", scope_id 0), each genre and each creator
+class ChartEntry(db.Model):
+    __tablename__ = 'chart_entries'
+    chart = db.Column(db.String(16), primary_key=True)
+    scope = db.Column(db.String(16), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    song_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_chart_entries_song', 'song_id'),
+    )
+
+
+class RollupState(db.Model):
+    __tablename__ = 'rollup_state'
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, default=0, nullable=False)
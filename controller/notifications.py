@@ -0,0 +1,232 @@
+import base64
+import binascii
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func, insert, select, update
+
+from controller.database import db, upsert
+from controller.events import publish
+from controller.models import Notification, NotificationCounter, Role, User, UserRole
+
+notifications_cli = AppGroup("notifications", help="Maintain user notification inboxes.")
+
+BROADCAST_BATCH_SIZE = 1000
+
+
+# ================= COUNTERS =================
+def adjust_unread(connection, deltas):
+    """Add {user_id: delta} to the unread counters in the caller's transaction."""
+    increments = [{"user_id": user_id, "unread": delta} for user_id, delta in deltas.items() if delta > 0]
+    decrements = [{"uid": user_id, "delta": delta} for user_id, delta in deltas.items() if delta < 0]
+
+    if increments:
+        stmt = upsert(connection, NotificationCounter)
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={"unread": NotificationCounter.unread + stmt.excluded.unread}
+            ),
+            increments
+        )
+    if decrements:
+        # Two-argument max() is SQLite's spelling of greatest()
+        floor = func.max if connection.dialect.name == "sqlite" else func.greatest
+        connection.execute(
+            update(NotificationCounter.__table__)
+            .where(NotificationCounter.user_id == bindparam("uid"))
+            .values(unread=floor(NotificationCounter.unread + bindparam("delta"), 0)),
+            decrements
+        )
+
+
+def unread_count(user_id):
+    # Read-only: counters are created by the first notification and by `flask db init`
+    return db.session.execute(
+        select(NotificationCounter.unread).where(NotificationCounter.user_id == user_id)
+    ).scalar() or 0
+
+
+def create_missing_counters():
+    """Give every user without an unread counter one, counted from their inbox."""
+    unread = (select(func.count())
+              .select_from(Notification.__table__)
+              .where(Notification.user_id == User.user_id, Notification.read_at.is_(None))
+              .scalar_subquery())
+    has_counter = select(NotificationCounter.user_id).where(NotificationCounter.user_id == User.user_id).exists()
+    with db.engine.begin() as connection:
+        connection.execute(
+            insert(NotificationCounter.__table__).from_select(
+                ["user_id", "unread"], select(User.user_id, unread).where(~has_counter)
+            )
+        )
+
+
+# ================= SENDING =================
+def notify(user_id, message):
+    """Queue a notification in the current session; it is sent with the caller's commit."""
+    connection = db.session.connection()
+    now = datetime.utcnow()
+    result = connection.execute(insert(Notification.__table__).values(
+        user_id=user_id, message=message, timestamp=now
+    ))
+    adjust_unread(connection, {user_id: 1})
+    publish(connection, f"user:{user_id}", "notification", {
+        "id": result.inserted_primary_key[0],
+        "message": message,
+        "timestamp": now.isoformat(),
+        "read": False
+    })
+
+
+def broadcast(message, role_name=None, batch_size=BROADCAST_BATCH_SIZE):
+    """Send one message to every user (or every user with a role) in batched inserts."""
+    users = select(UserRole.user_id).distinct()
+    if role_name:
+        users = users.join(Role, Role.role_id == UserRole.role_id).where(Role.role_name == role_name)
+
+    sent = 0
+    last_id = 0
+    now = datetime.utcnow()
+    while True:
+        with db.engine.begin() as connection:
+            user_ids = connection.execute(
+                users.where(UserRole.user_id > last_id).order_by(UserRole.user_id).limit(batch_size)
+            ).scalars().all()
+            if not user_ids:
+                # One event for the whole audience rather than one per recipient
+                publish(connection, f"role:{role_name}" if role_name else "all", "notification", {
+                    "message": message, "timestamp": now.isoformat(), "read": False
+                })
+                return sent
+            connection.execute(
+                insert(Notification.__table__),
+                [{"user_id": user_id, "message": message, "timestamp": now} for user_id in user_ids]
+            )
+            adjust_unread(connection, {user_id: 1 for user_id in user_ids})
+        sent += len(user_ids)
+        last_id = user_ids[-1]
+
+
+# ================= INBOX =================
+def encode_cursor(notification_id):
+    return base64.urlsafe_b64encode(str(notification_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def inbox_page(user_id, cursor=None, limit=None, unread_only=False):
+    """Newest-first page of a user's notifications and the cursor for the next one."""
+    default = current_app.config["NOTIFICATIONS_PAGE_SIZE"]
+    try:
+        limit = int(limit) if limit else default
+    except ValueError:
+        limit = default
+    limit = max(1, min(limit, 100))
+
+    query = Notification.query.filter(Notification.user_id == user_id)
+    if unread_only:
+        query = query.filter(Notification.read_at.is_(None))
+    if cursor:
+        query = query.filter(Notification.id < decode_cursor(cursor))
+
+    rows = query.order_by(Notification.id.desc()).limit(limit + 1).all()
+    notifications = rows[:limit]
+    next_cursor = encode_cursor(notifications[-1].id) if len(rows) > limit else None
+    return notifications, next_cursor
+
+
+def mark_read(user_id, ids=None):
+    """Mark some (or all) of a user's notifications read; returns the new unread count."""
+    connection = db.session.connection()
+    stmt = (update(Notification.__table__)
+            .where(Notification.user_id == user_id, Notification.read_at.is_(None))
+            .values(read_at=datetime.utcnow()))
+    if ids is not None:
+        stmt = stmt.where(Notification.id.in_(ids))
+    marked = connection.execute(stmt).rowcount
+    adjust_unread(connection, {user_id: -marked})
+    db.session.commit()
+    return unread_count(user_id)
+
+
+def inbox_context(user_id):
+    # Template variables for the notification bell on every dashboard
+    notifications, next_cursor = inbox_page(user_id)
+    return {
+        "notifications": notifications,
+        "notifications_cursor": next_cursor,
+        "unread_notifications": unread_count(user_id)
+    }
+
+
+def serialize_notification(notification):
+    return {
+        "id": notification.id,
+        "message": notification.message,
+        "timestamp": notification.timestamp.isoformat(),
+        "read": notification.read_at is not None
+    }
+
+
+# ================= RETENTION =================
+def prune_notifications(retention_days, batch_size=5000):
+    """Delete notifications older than the retention window in small transactions."""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    removed = 0
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(Notification.id, Notification.user_id, Notification.read_at)
+                .where(Notification.timestamp < cutoff)
+                .order_by(Notification.timestamp)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return removed
+            connection.execute(
+                Notification.__table__.delete().where(Notification.id.in_([row.id for row in rows]))
+            )
+            deltas = {}
+            for row in rows:
+                if row.read_at is None:
+                    deltas[row.user_id] = deltas.get(row.user_id, 0) - 1
+            adjust_unread(connection, deltas)
+        removed += len(rows)
+
+
+def recount_unread():
+    with db.engine.begin() as connection:
+        connection.execute(NotificationCounter.__table__.delete())
+        connection.execute(
+            insert(NotificationCounter.__table__).from_select(
+                ["user_id", "unread"],
+                select(Notification.user_id, func.count())
+                .where(Notification.read_at.is_(None))
+                .group_by(Notification.user_id)
+            )
+        )
+
+
+# ================= CLI =================
+@notifications_cli.command("prune")
+@click.option("--days", type=int, help="Retention window (default NOTIFICATION_RETENTION_DAYS).")
+def prune_command(days):
+    """Delete old notifications; run it daily from cron."""
+    days = days or current_app.config["NOTIFICATION_RETENTION_DAYS"]
+    print(f"Removed {prune_notifications(days)} notifications older than {days} days")
+
+
+@notifications_cli.command("recount")
+def recount_command():
+    """Rebuild the unread counters from the notification table."""
+    recount_unread()
+    print("Unread counters rebuilt")
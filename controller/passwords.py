@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordsBusy(Exception):
+    """More password checks are waiting than PASSWORD_MAX_PENDING allows."""
+
+
+class PasswordHasher:
+    """Password hashing with the cost taken from Config.
+
+    With PASSWORD_WORKERS > 0, hashing runs in a bounded per-process pool
+    (threads by default; hashlib releases the GIL while it works). The
+    request thread still blocks until its own hash is done; the pool only
+    caps how many hashes burn CPU at once, so a burst of logins waits in
+    line instead of starving every other request of CPU. Once
+    PASSWORD_MAX_PENDING checks are waiting, new ones fail fast with
+    PasswordsBusy rather than tying up more request threads.
+    """
+
+    def __init__(self, app=None):
+        self.executor = None
+        self.pid = None
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.current_prefix = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self.salt_length = app.config["PASSWORD_SALT_LENGTH"]
+        self.workers = app.config["PASSWORD_WORKERS"]
+        self.pool = app.config["PASSWORD_POOL"]
+        self.max_pending = app.config["PASSWORD_MAX_PENDING"]
+        self.current_prefix = None
+        app.extensions["password_hasher"] = self
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a hash was made with a different method, cost or salt length."""
+        method, _, rest = password_hash.partition("$")
+        salt = rest.partition("$")[0]
+        return method != self._method_prefix() or len(salt) != self.salt_length
+
+    def _method_prefix(self):
+        # Werkzeug stores the expanded method ("scrypt" -> "scrypt:32768:8:1");
+        # hashing an empty password with a 1-character salt reveals it
+        if self.current_prefix is None:
+            self.current_prefix = generate_password_hash("", self.method, 1).partition("$")[0]
+        return self.current_prefix
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise PasswordsBusy("Too many password checks in progress")
+            self.pending += 1
+            # Pools do not survive a fork, so each worker process creates its own
+            if self.pid != os.getpid():
+                if self.pool == "process":
+                    self.executor = ProcessPoolExecutor(self.workers)
+                else:
+                    self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="passwords")
+                self.pid = os.getpid()
+            executor = self.executor
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+
+passwords = PasswordHasher()
@@ -0,0 +1,245 @@
+import atexit
+import glob
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select, text
+
+from controller.database import db
+from controller.http_cache import bump_version
+from controller.events import publish_many
+from controller.models import PlayEvent, Song
+
+try:
+    import fcntl
+except ImportError:  # Windows: no journal, buffered plays are flushed at exit only
+    fcntl = None
+
+FLUSH_SQL = text("UPDATE songs SET play_count = COALESCE(play_count, 0) + :plays WHERE song_id = :song_id")
+
+
+def same_file(journal, path):
+    try:
+        return os.path.samestat(os.fstat(journal.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def parse_journal_line(line):
+    # "<song_id> <user_id or -> <unix time>"; older journals only hold the song_id
+    parts = line.split()
+    song_id = int(parts[0])
+    user_id = int(parts[1]) if len(parts) > 1 and parts[1] != "-" else None
+    played_at = float(parts[2]) if len(parts) > 2 else time.time()
+    return song_id, user_id, played_at
+
+
+class PlayCountBuffer:
+    """Buffers play events per process and writes them behind in batches.
+
+    A flush adds the coalesced per-song counts to songs.play_count and appends
+    the individual events to play_events in one transaction.
+
+    Each process also appends events to a journal file that it holds an
+    exclusive lock on. Journals whose lock can be taken belong to a process
+    that died before flushing, so they are replayed at startup. Journal names
+    are unique per open, since a restarted container hands out the same pids.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.lock = threading.Lock()
+        self.pending = []
+        self.inflight = 0
+        self.flushed_events = 0
+        self.last_flush = None
+        self.pid = None
+        self.journal = None
+        self.wakeup = threading.Event()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config["PLAY_FLUSH_INTERVAL"]
+        self.threshold = app.config["PLAY_FLUSH_THRESHOLD"]
+        self.journal_dir = app.config["PLAY_JOURNAL_DIR"] or os.path.join(app.instance_path, "play_journal")
+        app.extensions["play_buffer"] = self
+        atexit.register(self.flush)
+
+    # ================= RECORDING =================
+    def record(self, song_id, user_id=None):
+        self._ensure_started()
+        event = (song_id, user_id, time.time())
+        with self.lock:
+            self.pending.append(event)
+            self._journal_write([event])
+            buffered = len(self.pending)
+
+        if self.interval <= 0:
+            self.flush()
+        elif buffered >= self.threshold:
+            self.wakeup.set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "buffered_events": len(self.pending) + self.inflight,
+                "buffered_songs": len({song_id for song_id, _, _ in self.pending}),
+                "flushed_events": self.flushed_events,
+                "last_flush": self.last_flush
+            }
+
+    # ================= FLUSHING =================
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return 0
+            batch, self.pending = self.pending, []
+            self.inflight += len(batch)
+            # The batch keeps its (still locked) journal until the transaction
+            # commits, while new plays go to a fresh one
+            flushing = self._rotate_journal()
+
+        try:
+            self._apply(batch)
+        except Exception:
+            with self.lock:
+                self.pending = batch + self.pending
+                self.inflight -= len(batch)
+                self._journal_write(batch)
+                self._discard(flushing)
+            raise
+
+        with self.lock:
+            self.inflight -= len(batch)
+            self.flushed_events += len(batch)
+            self.last_flush = time.time()
+            self._discard(flushing)
+        return len(batch)
+
+    def _apply(self, batch):
+        counts = Counter(song_id for song_id, _, _ in batch)
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                creators = dict(connection.execute(
+                    select(Song.song_id, Song.creator_id).where(Song.song_id.in_(counts))
+                ).all())
+                # Plays recorded against a song deleted since are dropped
+                batch = [event for event in batch if event[0] in creators]
+                counts = {song_id: plays for song_id, plays in counts.items() if song_id in creators}
+                if not counts:
+                    return
+
+                connection.execute(FLUSH_SQL, [
+                    {"song_id": song_id, "plays": plays}
+                    for song_id, plays in sorted(counts.items())
+                ])
+                connection.execute(insert(PlayEvent.__table__), [
+                    {
+                        "song_id": song_id,
+                        "user_id": user_id,
+                        "played_at": datetime.fromtimestamp(played_at, timezone.utc).replace(tzinfo=None)
+                    }
+                    for song_id, user_id, played_at in batch
+                ])
+                bump_version("plays", connection=connection)
+
+                # Tell each creator's open dashboards how much their songs moved
+                deltas = {}
+                for song_id, plays in counts.items():
+                    deltas.setdefault(creators[song_id], {})[song_id] = plays
+                publish_many(connection, [
+                    (f"creator:{creator_id}", "plays", {"counts": songs})
+                    for creator_id, songs in deltas.items()
+                ])
+
+    def _journal_write(self, events):
+        if self.journal:
+            for song_id, user_id, played_at in events:
+                self.journal.write(f"{song_id} {user_id if user_id is not None else '-'} {played_at:.3f}\n")
+            self.journal.flush()
+
+    def _open_journal(self):
+        # Locked under a temporary name first, so a replayer never finds it unlocked
+        path = os.path.join(self.journal_dir, f"{self.pid}.{uuid.uuid4().hex}.log")
+        journal = open(path + ".new", "x")
+        fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(journal.name, path)
+        return journal
+
+    def _rotate_journal(self):
+        if not self.journal:
+            return None
+        flushing = self.journal
+        self.journal = self._open_journal()
+        return flushing
+
+    def _discard(self, journal):
+        if journal:
+            os.remove(journal.name.removesuffix(".new"))  # renamed to .log once locked
+            journal.close()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Play count flush failed: {e}")
+
+    # ================= LIFECYCLE =================
+    def _ensure_started(self):
+        # Threads and file locks do not survive a fork, so each worker starts its own
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            if fcntl is not None:
+                self.replay_journals()
+                self.journal = self._open_journal()
+            if self.interval > 0:
+                threading.Thread(target=self._run, name="play-count-flusher", daemon=True).start()
+
+    def _reset_after_fork(self):
+        # The parent's buffered plays and journal stay with the parent
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = []
+        self.inflight = 0
+        self.journal = None
+        self.pid = None
+
+    def replay_journals(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        recovered = 0
+        for path in glob.glob(os.path.join(self.journal_dir, "*.log")):
+            try:
+                journal = open(path, "r")
+            except FileNotFoundError:
+                continue
+            with journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # owned by a live process
+                if not same_file(journal, path):
+                    continue  # replayed and removed by another worker since the glob
+                batch = [parse_journal_line(line) for line in journal if line.strip()]
+                if batch:
+                    self._apply(batch)
+                    recovered += len(batch)
+                os.remove(path)
+        return recovered
+
+
+play_buffer = PlayCountBuffer()
@@ -0,0 +1,308 @@
+import json
+import os
+import re
+
+from flask import current_app, url_for
+from sqlalchemy import bindparam, delete, func, select, update
+
+from controller.database import db, upsert
+from controller.models import PlaylistSong, Song, User
+
+# ================= POSITIONS =================
+# Positions are spaced POSITION_GAP apart so moving one song only rewrites
+# that song's row: it takes the midpoint of its new neighbours. When two
+# neighbours end up adjacent the playlist is renumbered in one statement.
+
+
+class PlaylistChanged(Exception):
+    """The client's idea of the playlist no longer matches the database."""
+
+
+def position_gap():
+    return current_app.config["PLAYLIST_POSITION_GAP"]
+
+
+def add_song(connection, playlist_id, song_id):
+    # MAX(position) is a single seek on the (playlist_id, position) index
+    last = connection.execute(
+        select(func.max(PlaylistSong.position)).where(PlaylistSong.playlist_id == playlist_id)
+    ).scalar() or 0
+
+    # The unique (playlist_id, song_id) index turns a duplicate add into a no-op
+    connection.execute(
+        upsert(connection, PlaylistSong)
+        .values(playlist_id=playlist_id, song_id=song_id, position=last + position_gap())
+        .on_conflict_do_nothing(index_elements=["playlist_id", "song_id"])
+    )
+
+
+def song_ids(connection, playlist_id):
+    return connection.execute(
+        select(PlaylistSong.song_id)
+        .where(PlaylistSong.playlist_id == playlist_id)
+        .order_by(PlaylistSong.position, PlaylistSong.id)
+    ).scalars().all()
+
+
+def reorder(connection, playlist_id, order):
+    """Apply a full ordering of the playlist's songs with one executemany UPDATE."""
+    if sorted(order) != sorted(song_ids(connection, playlist_id)):
+        raise PlaylistChanged("The order must list every song in the playlist exactly once")
+
+    gap = position_gap()
+    connection.execute(
+        update(PlaylistSong.__table__)
+        .where(PlaylistSong.playlist_id == playlist_id,
+               PlaylistSong.song_id == bindparam("moved_song_id"))
+        .values(position=bindparam("new_position")),
+        [{"moved_song_id": song_id, "new_position": (index + 1) * gap}
+         for index, song_id in enumerate(order)]
+    )
+
+
+def rebalance(connection, playlist_id):
+    # Renumber in the current order, gap apart, with a single UPDATE ... FROM
+    ranked = (
+        select(PlaylistSong.id,
+               func.row_number().over(order_by=(PlaylistSong.position, PlaylistSong.id)).label("rank"))
+        .where(PlaylistSong.playlist_id == playlist_id)
+        .subquery()
+    )
+    connection.execute(
+        update(PlaylistSong.__table__)
+        .where(PlaylistSong.id == ranked.c.id)
+        .values(position=ranked.c.rank * position_gap())
+    )
+
+
+def neighbour_positions(connection, playlist_id, song_id, after_song_id):
+    """Positions between which song_id should land to follow after_song_id (None = first)."""
+    others = (PlaylistSong.playlist_id == playlist_id, PlaylistSong.song_id != song_id)
+    if after_song_id is None:
+        low = None
+    else:
+        low = connection.execute(
+            select(PlaylistSong.position).where(*others, PlaylistSong.song_id == after_song_id)
+        ).scalar()
+        if low is None:
+            raise PlaylistChanged("Song to move after is not in the playlist")
+
+    following = select(func.min(PlaylistSong.position)).where(*others)
+    if low is not None:
+        following = following.where(PlaylistSong.position > low)
+    return low, connection.execute(following).scalar()
+
+
+def move_song(connection, playlist_id, song_id, after_song_id=None):
+    """Move one song to just after another, normally rewriting only its own row."""
+    moved = connection.execute(
+        select(PlaylistSong.id).where(PlaylistSong.playlist_id == playlist_id,
+                                      PlaylistSong.song_id == song_id)
+    ).scalar()
+    if moved is None:
+        raise PlaylistChanged("Song is not in the playlist")
+
+    for attempt in range(2):
+        low, high = neighbour_positions(connection, playlist_id, song_id, after_song_id)
+        if high is None:
+            position = (low or 0) + position_gap()
+        elif low is None:
+            position = high - position_gap() if high > position_gap() else high // 2
+        else:
+            position = (low + high) // 2
+
+        if position not in (low, high) and position > 0:
+            break
+        # No room left between the neighbours
+        rebalance(connection, playlist_id)
+
+    connection.execute(
+        update(PlaylistSong.__table__).where(PlaylistSong.id == moved).values(position=position)
+    )
+    return position
+
+
+# ================= BULK EDITS =================
+# Song ids are bound in chunks to stay under SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+
+def chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def unique(song_ids):
+    return list(dict.fromkeys(song_ids))
+
+
+def add_songs(connection, playlist_id, song_ids):
+    """Append songs in the given order, skipping unknown ids and songs already present.
+
+    Returns (added, missing) lists of song ids.
+    """
+    song_ids = unique(song_ids)
+    known, present = set(), set()
+    for chunk in chunks(song_ids):
+        known.update(connection.execute(
+            select(Song.song_id).where(Song.song_id.in_(chunk))
+        ).scalars())
+        present.update(connection.execute(
+            select(PlaylistSong.song_id).where(PlaylistSong.playlist_id == playlist_id,
+                                               PlaylistSong.song_id.in_(chunk))
+        ).scalars())
+
+    added = [song_id for song_id in song_ids if song_id in known and song_id not in present]
+    if added:
+        last = connection.execute(
+            select(func.max(PlaylistSong.position)).where(PlaylistSong.playlist_id == playlist_id)
+        ).scalar() or 0
+        gap = position_gap()
+        # ON CONFLICT still guards against a concurrent add of the same song
+        connection.execute(
+            upsert(connection, PlaylistSong).on_conflict_do_nothing(index_elements=["playlist_id", "song_id"]),
+            [{"playlist_id": playlist_id, "song_id": song_id, "position": last + (index + 1) * gap}
+             for index, song_id in enumerate(added)]
+        )
+    return added, [song_id for song_id in song_ids if song_id not in known]
+
+
+def remove_songs(connection, playlist_id, song_ids):
+    removed = 0
+    for chunk in chunks(unique(song_ids)):
+        removed += connection.execute(
+            delete(PlaylistSong.__table__).where(PlaylistSong.playlist_id == playlist_id,
+                                                 PlaylistSong.song_id.in_(chunk))
+        ).rowcount
+    return removed
+
+
+# ================= IMPORT / EXPORT =================
+STREAM_URL = re.compile(r"/stream/(\d+)(?:[?#]|$)")
+
+
+def playlist_rows(playlist_id):
+    """The playlist's songs in order, fetched in batches rather than all at once."""
+    result = db.session.execute(
+        select(PlaylistSong.song_id, Song.title, Song.duration, User.username.label("artist"))
+        .join(Song, Song.song_id == PlaylistSong.song_id)
+        .join(User, User.user_id == Song.creator_id)
+        .where(PlaylistSong.playlist_id == playlist_id)
+        .order_by(PlaylistSong.position, PlaylistSong.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    yield from result
+
+
+def export_m3u(playlist):
+    yield "#EXTM3U\n"
+    yield f"#PLAYLIST:{playlist.playlist_name}\n"
+    for row in playlist_rows(playlist.playlist_id):
+        url = url_for("tunex.stream_song", song_id=row.song_id, _external=True)
+        yield f"#EXTINF:{row.duration or -1},{row.artist} - {row.title}\n{url}\n"
+
+
+def export_json(playlist):
+    yield '{"playlist": %s, "songs": [' % json.dumps(playlist.playlist_name)
+    for index, row in enumerate(playlist_rows(playlist.playlist_id)):
+        yield ("," if index else "") + json.dumps({
+            "song_id": row.song_id,
+            "title": row.title,
+            "artist": row.artist,
+            "duration": row.duration,
+            "stream_url": url_for("tunex.stream_song", song_id=row.song_id, _external=True),
+        })
+    yield "]}"
+
+
+def parse_m3u(lines):
+    """Yield {"song_id"} or {"title", "artist"} entries from M3U lines, lazily."""
+    label = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            label = line.partition(",")[2]
+        elif line and not line.startswith("#"):
+            match = STREAM_URL.search(line)
+            if match:
+                yield {"song_id": int(match.group(1))}
+            else:
+                # A foreign file: fall back to the "Artist - Title" label, then the file name
+                text = label or os.path.splitext(os.path.basename(line))[0]
+                artist, _, title = text.rpartition(" - ")
+                yield {"title": title.strip(), "artist": artist.strip() or None}
+            label = None
+
+
+def entry_key(entry):
+    """(song id, title, artist) of an entry, lower-cased; values of the wrong type count as missing."""
+    if not isinstance(entry, dict):
+        return None, None, None
+    song_id = entry.get("song_id")
+    if song_id is not None:
+        try:
+            song_id = int(song_id)
+        except (TypeError, ValueError, OverflowError):
+            return None, None, None
+        # An id SQLite can't bind resolves to nothing rather than failing the import
+        return (song_id if 0 < song_id < 2 ** 63 else None), None, None
+    title, artist = entry.get("title"), entry.get("artist")
+    title = title.lower() if isinstance(title, str) else None
+    artist = artist.lower() if isinstance(artist, str) else ""
+    return None, title or None, artist
+
+
+def resolve_entries(entries):
+    """Map entries to song ids with one query per batch; unmatched entries come back as None."""
+    keys = [entry_key(entry) for entry in entries]
+    ids = [song_id for song_id, _, _ in keys if song_id is not None]
+    titles = {title for _, title, _ in keys if title}
+
+    known = set()
+    for chunk in chunks(ids):
+        known.update(db.session.execute(select(Song.song_id).where(Song.song_id.in_(chunk))).scalars())
+
+    by_title, by_artist_title = {}, {}
+    for chunk in chunks(sorted(titles)):
+        rows = db.session.execute(
+            select(Song.song_id, Song.title, User.username)
+            .join(User, User.user_id == Song.creator_id)
+            .where(func.lower(Song.title).in_(chunk))
+            .order_by(Song.song_id)
+        )
+        for song_id, title, username in rows:
+            by_title.setdefault(title.lower(), song_id)
+            by_artist_title.setdefault((username.lower(), title.lower()), song_id)
+
+    resolved = []
+    for song_id, title, artist in keys:
+        if song_id is not None:
+            resolved.append(song_id if song_id in known else None)
+        elif title:
+            resolved.append(by_artist_title.get((artist, title)) or by_title.get(title))
+        else:
+            resolved.append(None)
+    return resolved
+
+
+def import_entries(playlist_id, entries):
+    """Resolve and append entries batch by batch; returns (added count, unresolved entries)."""
+    added, unresolved, batch = 0, [], []
+
+    def flush():
+        nonlocal added
+        song_ids = resolve_entries(batch)
+        unresolved.extend(entry for entry, song_id in zip(batch, song_ids) if song_id is None)
+        added += len(add_songs(db.session.connection(), playlist_id,
+                               [song_id for song_id in song_ids if song_id is not None])[0])
+        batch.clear()
+
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return added, unresolved
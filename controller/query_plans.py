@@ -0,0 +1,148 @@
+import re
+
+from flask import has_request_context
+from sqlalchemy import event
+
+from controller.database import db
+from controller.models import Genre, Playlist, Role, Song, User
+
+# Tables small enough that scanning them is cheaper than an index lookup
+SMALL_TABLES = {"roles", "genres", "rollup_state"}
+
+# Routes whose job is to list a whole table
+FULL_LISTINGS = {
+    ("/api/users", "users"),
+}
+
+# Any full pass over a table, whether it reads the rows or walks an index
+# ("SCAN t", "SCAN t USING INDEX i", "SCAN t USING COVERING INDEX i")
+SCAN = re.compile(r"^SCAN (\w+)\b")
+# SQLAlchemy aliases a table as <table>_<n>, and SQLite reports the alias
+ALIAS = re.compile(r"^(\w+?)_\d+$")
+
+
+def sample_requests():
+    """Requests covering the read routes, as (url, session, form) triples; a form is POSTed.
+
+    POSTs only take paths that write nothing, as the check may run on a live database.
+    """
+    def user_with_role(name):
+        return User.query.filter(User.roles.any(Role.role_name == name)).order_by(User.user_id).first()
+
+    admin = user_with_role("ADMIN")
+    creator = user_with_role("CREATOR")
+    listener = user_with_role("USER") or creator
+    song = Song.query.order_by(Song.song_id).first()
+    genre = Genre.query.order_by(Genre.genre_id).first()
+    playlist = Playlist.query.order_by(Playlist.playlist_id).first()
+    other = User.query.filter(User.user_id != listener.user_id).first() if listener else None
+
+    requests = [
+        ("/dashboard/admin", admin),
+        ("/api/users", admin),
+        ("/dashboard/creator", creator),
+        ("/dashboard/analytics", creator),
+        ("/dashboard/user", listener),
+        ("/profile", listener),
+        ("/api/songs", listener),
+        ("/api/songs?sort=popular", listener),
+        ("/api/search?q=love", listener),
+        ("/api/recommendations", listener),
+        ("/api/charts/top", listener),
+        ("/api/charts/trending", listener),
+    ]
+    if genre:
+        requests.append((f"/api/charts/trending/genre/{genre.genre_id}", listener))
+        requests.append((f"/api/admin/genre/{genre.genre_id}/songs", admin))
+    if song:
+        requests.append((f"/api/analytics/song/{song.song_id}", song.creator))
+        requests.append((f"/api/song/{song.song_id}/similar", listener))
+        requests.append((f"/api/charts/top/creator/{song.creator_id}", listener))
+    if playlist:
+        requests.append((f"/playlist/{playlist.playlist_id}", playlist.user))
+    forms = {}
+    if other:
+        # A taken username is turned down before anything is written
+        requests.append(("/profile/edit", listener))
+        forms["/profile/edit"] = {"username": other.username}
+    return [
+        (url, {"user_id": user.user_id, "username": user.username,
+               "roles": [role.role_name for role in user.roles]}, forms.get(url))
+        for url, user in requests if user is not None
+    ]
+
+
+def capture_queries(app, requests):
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return  # background jobs started by the requests run on their own threads
+        if context.execution_options.get("full_scan"):
+            return  # explicitly allowed, e.g. the dashboard's cached aggregates
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.setdefault((statement, tuple(parameters or ())), url)
+
+    client = app.test_client()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for url, user_session, form in requests:
+            with client.session_transaction() as session:
+                session.update(user_session)
+            if form is None:
+                client.get(url)
+            else:
+                client.post(url, data=form)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def is_bounded(statement, plan):
+    # Rows read in index order can stop at the LIMIT, so the scan never reaches
+    # the end of the table. Not when rows are filtered on the way (a missing
+    # index: .first() on an unmatched value reads every row) or sorted first.
+    words = f" {' '.join(statement.upper().split())} "
+    return (" LIMIT " in words and " WHERE " not in words
+            and not any("TEMP B-TREE" in row.detail for row in plan))
+
+
+def scanned_tables(plan, tables):
+    """Tables in `tables` that an EXPLAIN QUERY PLAN (detail strings) passes over in full."""
+    scanned = []
+    for detail in plan:
+        match = SCAN.match(detail)
+        if not match:
+            continue
+        name = match.group(1)
+        alias = ALIAS.match(name)
+        if name not in tables and alias:
+            name = alias.group(1)
+        if name in tables:
+            scanned.append(name)
+    return scanned
+
+
+def find_full_scans(app):
+    """Run each route's queries through EXPLAIN QUERY PLAN and report full table scans."""
+    with app.app_context():
+        if db.engine.dialect.name != "sqlite":
+            raise RuntimeError("Query plans are checked against SQLite")
+        requests = sample_requests()
+
+    tables = set(db.metadata.tables)
+    statements = capture_queries(app, requests)
+
+    problems = []
+    with app.app_context(), db.engine.connect() as connection:
+        for (statement, parameters), url in statements.items():
+            plan = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            if is_bounded(statement, plan):
+                continue
+            for table in scanned_tables([row.detail for row in plan], tables):
+                if table not in SMALL_TABLES and (url, table) not in FULL_LISTINGS:
+                    problems.append({"url": url, "table": table, "statement": statement,
+                                     "plan": [r.detail for r in plan]})
+    return problems
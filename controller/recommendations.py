@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import joinedload
+
+from controller.database import db, upsert
+from controller.models import Playlist, PlaylistSong, RollupState, Song, SongSimilarity
+
+recommendations_cli = AppGroup("recommendations", help="Build song-to-song recommendations.")
+
+BATCH_SIZE = 500
+# Song pairs materialized at once while counting co-occurrences (8 bytes each)
+PAIR_BUDGET = 1 << 22
+
+
+# ================= SCORING =================
+def cooccurrence(playlist_ids, song_index, songs, pair_budget=PAIR_BUDGET):
+    """Count, for every ordered pair of distinct songs, the playlists holding both.
+
+    Playlists of equal length are stacked into (playlists x length) arrays,
+    so the pairs of many playlists come from one broadcast instead of a
+    Python loop per playlist. Each stack holds at most pair_budget pairs,
+    and its counts are merged into the running totals before the next one
+    is built, so memory follows the distinct pairs rather than all of them.
+    Returns (i, j, count) arrays of dense song indices.
+    """
+    order = np.argsort(playlist_ids, kind="stable")
+    playlist_ids, song_index = playlist_ids[order], song_index[order]
+    starts = np.flatnonzero(np.r_[True, playlist_ids[1:] != playlist_ids[:-1]])
+    lengths = np.diff(np.r_[starts, len(playlist_ids)])
+
+    pair_keys, counts = np.empty(0, np.int64), np.empty(0, np.int64)
+    for length in np.unique(lengths):
+        if length < 2:
+            continue
+        off_diagonal = ~np.eye(length, dtype=bool)
+        class_starts = starts[lengths == length]
+        step = max(1, pair_budget // (length * (length - 1)))
+        for chunk in range(0, len(class_starts), step):
+            rows = class_starts[chunk:chunk + step, None] + np.arange(length)
+            members = song_index[rows]
+            pairs = members[:, :, None] * songs + members[:, None, :]
+            keys, chunk_counts = np.unique(pairs[:, off_diagonal], return_counts=True)
+            pair_keys, counts = merge_counts(pair_keys, counts, keys, chunk_counts)
+    return pair_keys // songs, pair_keys % songs, counts
+
+
+def merge_counts(keys, counts, new_keys, new_counts):
+    # Both key arrays are sorted and unique: add to the keys already there, insert the rest in order
+    at = np.searchsorted(keys, new_keys)
+    found = at < len(keys)
+    found[found] = keys[at[found]] == new_keys[found]
+    counts[at[found]] += new_counts[found]
+    return np.insert(keys, at[~found], new_keys[~found]), np.insert(counts, at[~found], new_counts[~found])
+
+
+def similarities(playlist_ids, song_ids, song_genres, top_k, max_length, genre_boost):
+    """Top-K neighbours per song by item-item cosine over playlist membership.
+
+    cosine(a, b) = playlists with both / sqrt(playlists with a * playlists with b),
+    raised by genre_boost when the two songs share a genre. Playlists longer
+    than max_length say little about any one pair and are left out.
+    song_genres maps song id to genre id. Returns (song_id, similar_song_id,
+    score, rank) arrays.
+    """
+    _, membership, lengths = np.unique(playlist_ids, return_inverse=True, return_counts=True)
+    kept = lengths[membership] <= max_length
+    playlist_ids, song_ids = playlist_ids[kept], song_ids[kept]
+
+    unique_songs, song_index = np.unique(song_ids, return_inverse=True)
+    i, j, together = cooccurrence(playlist_ids, song_index, len(unique_songs))
+    if not len(i):
+        empty = np.empty(0, np.int64)
+        return empty, empty, np.empty(0), empty
+
+    appearances = np.bincount(song_index, minlength=len(unique_songs))
+    genres = np.array([song_genres.get(song_id, -1) for song_id in unique_songs.tolist()])
+    scores = together / np.sqrt(appearances[i] * appearances[j])
+    scores *= np.where(genres[i] == genres[j], 1 + genre_boost, 1.0)
+
+    order = np.lexsort((-scores, i))
+    i, j, scores = i[order], j[order], scores[order]
+    group_starts = np.flatnonzero(np.r_[True, i[1:] != i[:-1]])
+    ranks = np.arange(len(i)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(i)]))
+    keep = ranks < top_k
+    return unique_songs[i[keep]], unique_songs[j[keep]], scores[keep], ranks[keep]
+
+
+# ================= BUILD =================
+def neighbour_lists(song_ids, similar_ids, scores):
+    lists = {}
+    for song_id, similar_id, score in zip(song_ids, similar_ids, scores):
+        lists.setdefault(song_id, []).append((similar_id, round(score, 6)))
+    return lists
+
+
+def build_similarities():
+    """Recompute every song's neighbours and rewrite only the songs whose list changed."""
+    config = current_app.config
+    memberships = np.array(
+        db.session.execute(select(PlaylistSong.playlist_id, PlaylistSong.song_id)).all(), dtype=np.int64
+    ).reshape(-1, 2)
+    song_genres = dict(db.session.execute(select(Song.song_id, Song.genre_id)).all())
+
+    song_ids, similar_ids, scores, _ = similarities(
+        memberships[:, 0], memberships[:, 1], song_genres,
+        config["RECOMMEND_TOP_K"], config["RECOMMEND_MAX_PLAYLIST"], config["RECOMMEND_GENRE_BOOST"]
+    )
+    fresh = neighbour_lists(song_ids.tolist(), similar_ids.tolist(), scores.tolist())
+
+    stored = db.session.execute(
+        select(SongSimilarity.song_id, SongSimilarity.similar_song_id, SongSimilarity.score)
+        .order_by(SongSimilarity.song_id, SongSimilarity.rank)
+    ).all()
+    existing = neighbour_lists(*zip(*stored)) if stored else {}
+
+    changed = [song_id for song_id in fresh.keys() | existing.keys()
+               if fresh.get(song_id) != existing.get(song_id)]
+    connection = db.session.connection()
+    for start in range(0, len(changed), BATCH_SIZE):
+        chunk = changed[start:start + BATCH_SIZE]
+        connection.execute(delete(SongSimilarity.__table__).where(SongSimilarity.song_id.in_(chunk)))
+        rows = [
+            {"song_id": song_id, "similar_song_id": similar_id, "score": score, "rank": rank}
+            for song_id in chunk
+            for rank, (similar_id, score) in enumerate(fresh.get(song_id, []))
+        ]
+        if rows:
+            connection.execute(insert(SongSimilarity.__table__), rows)
+    db.session.commit()
+    return {"songs": len(fresh), "pairs": len(song_ids), "changed": len(changed)}
+
+
+def claim_build(interval):
+    """Let one worker process rebuild per interval.
+
+    The "recommendations" rollup_state row keeps the unix time of the last
+    build in last_event_id; only the worker whose UPDATE moves it forward
+    runs the build.
+    """
+    now = int(time.time())
+    connection = db.session.connection()
+    connection.execute(
+        upsert(connection, RollupState).values(name="recommendations", last_event_id=0)
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    claimed = connection.execute(
+        update(RollupState.__table__)
+        .where(RollupState.name == "recommendations", RollupState.last_event_id <= now - interval)
+        .values(last_event_id=now)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+class RecommendationBuilder:
+    """Background thread that rebuilds the similarity table every RECOMMEND_INTERVAL."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.pid = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config["RECOMMEND_INTERVAL"]
+        app.extensions["recommendation_builder"] = self
+        if self.interval > 0:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name="recommendations", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    if claim_build(self.interval):
+                        build_similarities()
+                    db.session.remove()
+            except Exception as e:
+                print(f"Recommendation build failed: {e}")
+            time.sleep(min(self.interval, 300))
+
+
+recommendation_builder = RecommendationBuilder()
+
+
+# ================= QUERIES =================
+def similar_songs(song_id, limit):
+    """A song's precomputed neighbours, best first, from one range read of the (song_id, rank) index."""
+    return (
+        Song.query.options(joinedload(Song.creator), joinedload(Song.genre))
+        .join(SongSimilarity, SongSimilarity.similar_song_id == Song.song_id)
+        .filter(SongSimilarity.song_id == song_id, SongSimilarity.rank < limit)
+        .order_by(SongSimilarity.rank)
+        .all()
+    )
+
+
+def recommended_for(user_id, limit):
+    """Neighbours of the user's most recently added playlist songs, summed and ranked.
+
+    Songs already in one of the user's playlists are left out.
+    """
+    owned = (select(PlaylistSong.song_id)
+             .join(Playlist, Playlist.playlist_id == PlaylistSong.playlist_id)
+             .where(Playlist.user_id == user_id))
+    seeds = owned.order_by(PlaylistSong.id.desc()).limit(current_app.config["RECOMMEND_SEED_SONGS"])
+    score = func.sum(SongSimilarity.score)
+    ranked = db.session.execute(
+        select(SongSimilarity.similar_song_id, score)
+        .where(SongSimilarity.song_id.in_(seeds.scalar_subquery()),
+               SongSimilarity.similar_song_id.not_in(owned.scalar_subquery()))
+        .group_by(SongSimilarity.similar_song_id)
+        .order_by(score.desc(), SongSimilarity.similar_song_id)
+        .limit(limit)
+    ).all()
+    if not ranked:
+        return []
+
+    songs = {song.song_id: song for song in
+             Song.query.options(joinedload(Song.creator), joinedload(Song.genre))
+             .filter(Song.song_id.in_([song_id for song_id, _ in ranked]))}
+    return [songs[song_id] for song_id, _ in ranked if song_id in songs]
+
+
+# ================= CLI =================
+@recommendations_cli.command("build")
+def build_command():
+    """Recompute song neighbours from playlist co-occurrence."""
+    started = time.monotonic()
+    report = build_similarities()
+    print(f"{report['pairs']} neighbours for {report['songs']} songs, "
+          f"{report['changed']} songs rewritten in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,193 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import mutagen
+from flask import current_app
+from flask.cli import AppGroup
+
+from controller.database import db, upsert
+from controller.models import AudioBlob, AudioRendition
+from controller.workers import transcoder
+
+renditions_cli = AppGroup("renditions", help="Transcode songs into lower-bitrate renditions.")
+
+TRANSCODE_TIMEOUT = 600
+
+# Client hints: Save-Data and slow effective connection types get the lowest rendition
+SLOW_CONNECTIONS = {"slow-2g", "2g"}
+
+
+def ladder():
+    """Configured renditions as (quality, kbit/s) pairs, lowest first."""
+    pairs = []
+    for item in current_app.config["RENDITIONS"].split(","):
+        quality, _, kbps = item.strip().partition(":")
+        if quality and kbps:
+            pairs.append((quality, int(kbps)))
+    return sorted(pairs, key=lambda pair: pair[1])
+
+
+def ffmpeg_binary():
+    return shutil.which(current_app.config["FFMPEG_BINARY"])
+
+
+def rendition_path(blob_path, quality):
+    return f"{os.path.splitext(blob_path)[0]}.{quality}.mp3"
+
+
+def source_kbps(path):
+    try:
+        audio = mutagen.File(path)
+    except mutagen.MutagenError:
+        return None
+    bitrate = getattr(getattr(audio, "info", None), "bitrate", None)
+    return bitrate // 1000 if bitrate else None
+
+
+# ================= TRANSCODING =================
+def transcode(binary, source, target, kbps):
+    # Written beside the target and renamed, so a reader never sees half a file
+    partial = target + ".part"
+    subprocess.run(
+        [binary, "-v", "error", "-y", "-i", source, "-vn", "-map_metadata", "-1",
+         "-codec:a", "libmp3lame", "-b:a", f"{kbps}k", "-f", "mp3", partial],
+        check=True, capture_output=True, timeout=TRANSCODE_TIMEOUT
+    )
+    os.replace(partial, target)
+
+
+def transcode_blob(content_hash):
+    """Create a blob's missing renditions; returns the qualities created."""
+    binary = ffmpeg_binary()
+    blob = db.session.get(AudioBlob, content_hash)
+    if not binary or blob is None:
+        return []
+
+    root = current_app.root_path
+    source = os.path.join(root, blob.file_path)
+    original = source_kbps(source)
+    existing = {quality for quality, in
+                db.session.query(AudioRendition.quality).filter_by(content_hash=content_hash)}
+
+    created = []
+    for quality, kbps in ladder():
+        if quality in existing or (original and kbps >= original):
+            continue
+        file_path = rendition_path(blob.file_path, quality)
+        try:
+            transcode(binary, source, os.path.join(root, file_path), kbps)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            print(f"Transcoding {content_hash} to {quality} failed: {e}")
+            continue
+
+        connection = db.session.connection()
+        connection.execute(
+            upsert(connection, AudioRendition)
+            .values(content_hash=content_hash, quality=quality, bitrate=kbps, file_path=file_path,
+                    size=os.path.getsize(os.path.join(root, file_path)))
+            .on_conflict_do_nothing(index_elements=["content_hash", "quality"])
+        )
+        db.session.commit()
+        created.append(quality)
+    return created
+
+
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def queue_renditions(content_hash):
+    # Identical uploads share a blob, so one transcode serves all of them
+    if not content_hash:
+        return
+    with _queued_lock:
+        if content_hash in _queued:
+            return
+        _queued.add(content_hash)
+    transcoder.submit(_transcode_queued, content_hash)
+
+
+def _transcode_queued(content_hash):
+    try:
+        transcode_blob(content_hash)
+    finally:
+        with _queued_lock:
+            _queued.discard(content_hash)
+
+
+# ================= DELIVERY =================
+def requested_quality(args, headers):
+    """The quality asked for by ?quality= or client hints, or None for the default."""
+    names = [quality for quality, _ in ladder()]
+    quality = args.get("quality")
+    if quality in names or quality == "original":
+        return quality
+    if not names:
+        return None
+    if headers.get("Save-Data", "").lower() == "on" or headers.get("ECT") in SLOW_CONNECTIONS:
+        return names[0]
+    if headers.get("ECT") == "3g":
+        return names[len(names) // 2]
+    downlink = headers.get("Downlink", type=float)  # Mbit/s
+    if downlink is not None:
+        # Leave headroom: a rendition may use a quarter of the measured bandwidth
+        fitting = [quality for quality, kbps in ladder() if kbps <= downlink * 1000 / 4]
+        return fitting[-1] if fitting else names[0]
+    return None
+
+
+def pick_rendition(renditions, quality, original_kbps):
+    """Choose the rendition to stream; None means the original file.
+
+    The highest option at or under the requested bitrate wins (the top of
+    the ladder when nothing was asked for), falling back to the smallest
+    available. A WAV upload is therefore never streamed raw by default.
+    """
+    if quality == "original" or not renditions:
+        return None
+
+    bitrates = dict(ladder())
+    target = bitrates[quality] if quality else max(bitrates.values())
+    options = [(rendition.bitrate, rendition) for rendition in renditions]
+    options.append((original_kbps or float("inf"), None))
+    fitting = [option for option in options if option[0] <= target]
+    if fitting:
+        return max(fitting, key=lambda option: option[0])[1]
+    return min(options, key=lambda option: option[0])[1]
+
+
+# ================= BACKFILL =================
+@renditions_cli.command("backfill")
+@click.option("--workers", type=int, help="Concurrent ffmpeg processes (default TRANSCODE_WORKERS).")
+@click.option("--limit", type=int, help="Stop after this many blobs.")
+def backfill_command(workers, limit):
+    """Transcode renditions for every stored blob that is missing some."""
+    if not ffmpeg_binary():
+        raise click.ClickException(f"{current_app.config['FFMPEG_BINARY']} is not installed")
+
+    app = current_app._get_current_object()
+    wanted = len(ladder())
+    counts = dict(db.session.query(AudioRendition.content_hash, db.func.count())
+                  .group_by(AudioRendition.content_hash).all())
+    hashes = [content_hash for content_hash, in
+              db.session.query(AudioBlob.content_hash).order_by(AudioBlob.content_hash)
+              if counts.get(content_hash, 0) < wanted][:limit]
+    started = time.monotonic()
+
+    def run(content_hash):
+        with app.app_context():
+            try:
+                return len(transcode_blob(content_hash))
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(workers or app.config["TRANSCODE_WORKERS"] or 1,
+                            thread_name_prefix="transcode-backfill") as pool:
+        created = sum(pool.map(run, hashes))
+
+    print(f"Created {created} renditions for {len(hashes)} blobs in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,212 @@
+import re
+
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, joinedload, lazyload
+
+from controller.catalog import page_size
+from controller.database import db
+from controller.models import Song, SongArtist, User
+
+search_cli = AppGroup("search", help="Manage the song search index.")
+
+# Column weights for bm25(): title, artists, genre, lyrics
+RANK_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+INDEXED_SONG_FIELDS = ("title", "lyrics", "genre_id", "creator_id")
+
+# The creator's username is indexed alongside the credited artists because
+# it is what the dashboard shows as "Artist".
+INDEX_ROW_SQL = """
+    INSERT INTO song_search (rowid, title, artists, genre, lyrics)
+    SELECT s.song_id,
+           s.title,
+           COALESCE((SELECT group_concat(a.artist_name, ' ')
+                     FROM song_artists sa JOIN artists a ON a.artist_id = sa.artist_id
+                     WHERE sa.song_id = s.song_id), '') || ' ' || COALESCE(u.username, ''),
+           COALESCE(g.genre_name, ''),
+           COALESCE(s.lyrics, '')
+    FROM songs s
+    LEFT JOIN genres g ON g.genre_id = s.genre_id
+    LEFT JOIN users u ON u.user_id = s.creator_id
+"""
+
+
+def fts_enabled(connection):
+    return connection.dialect.name == "sqlite"
+
+
+# ================= INDEX MAINTENANCE =================
+def create_search_index():
+    connection = db.session.connection()
+    if not fts_enabled(connection):
+        return
+
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'song_search'"
+    )).first()
+    if exists:
+        return
+
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE song_search USING fts5("
+        "title, artists, genre, lyrics, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    connection.execute(text(INDEX_ROW_SQL))
+    db.session.commit()
+
+
+def rebuild_search_index():
+    connection = db.session.connection()
+    if not fts_enabled(connection):
+        return 0
+
+    connection.execute(text("DELETE FROM song_search"))
+    connection.execute(text(INDEX_ROW_SQL))
+    count = connection.execute(text("SELECT count(*) FROM song_search")).scalar()
+    db.session.commit()
+    return count
+
+
+def reindex_song(connection, song_id):
+    if not fts_enabled(connection):
+        return
+    connection.execute(text("DELETE FROM song_search WHERE rowid = :id"), {"id": song_id})
+    connection.execute(text(INDEX_ROW_SQL + " WHERE s.song_id = :id"), {"id": song_id})
+
+
+def reindex_creator(connection, user_id):
+    # Every song of a renamed creator; both statements read ix_songs_creator
+    if not fts_enabled(connection):
+        return
+    connection.execute(text(
+        "DELETE FROM song_search WHERE rowid IN (SELECT song_id FROM songs WHERE creator_id = :id)"
+    ), {"id": user_id})
+    connection.execute(text(INDEX_ROW_SQL + " WHERE s.creator_id = :id"), {"id": user_id})
+
+
+def unindex_song(connection, song_id):
+    if not fts_enabled(connection):
+        return
+    connection.execute(text("DELETE FROM song_search WHERE rowid = :id"), {"id": song_id})
+
+
+# Keep the index in step with the catalog inside the same flush/transaction,
+# so uploads, edits, deletes and lyrics transcription never drift from it.
+@event.listens_for(Song, "after_insert")
+def _index_new_song(mapper, connection, song):
+    reindex_song(connection, song.song_id)
+
+
+@event.listens_for(Song, "after_update")
+def _index_updated_song(mapper, connection, song):
+    state = inspect(song)
+    if any(state.attrs[field].history.has_changes() for field in INDEXED_SONG_FIELDS):
+        reindex_song(connection, song.song_id)
+
+
+@event.listens_for(Song, "after_delete")
+def _unindex_deleted_song(mapper, connection, song):
+    unindex_song(connection, song.song_id)
+
+
+@event.listens_for(SongArtist, "after_insert")
+@event.listens_for(SongArtist, "after_delete")
+def _index_song_artists(mapper, connection, song_artist):
+    reindex_song(connection, song_artist.song_id)
+
+
+# Links written through Song.artists go straight to the secondary table, after
+# the songs themselves, and a username is only indexed with the songs; neither
+# raises a mapper event on Song, so they are picked up once the flush is done.
+@event.listens_for(Session, "after_flush")
+def _index_changed_links(session, flush_context):
+    song_ids, creator_ids = set(), set()
+    for obj in session.new | session.dirty:
+        if obj in session.deleted:
+            continue
+        state = inspect(obj)
+        if isinstance(obj, Song) and state.attrs.artists.history.has_changes():
+            song_ids.add(obj.song_id)
+        elif isinstance(obj, User) and not state.pending and state.attrs.username.history.has_changes():
+            creator_ids.add(obj.user_id)
+    if not song_ids and not creator_ids:
+        return
+
+    connection = session.connection()
+    for song_id in song_ids:
+        reindex_song(connection, song_id)
+    for user_id in creator_ids:
+        reindex_creator(connection, user_id)
+
+
+# ================= QUERIES =================
+def match_expression(query):
+    # Every term must match, and the last one may be a partial word
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return ""
+
+    phrases = [f'"{term}"' for term in terms]
+    # One-letter prefixes are not covered by the prefix index, so match them whole
+    if len(terms[-1]) > 1:
+        phrases[-1] += "*"
+    return " ".join(phrases)
+
+
+def search_songs(query, cursor=None, limit=None):
+    limit = page_size(limit)
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+
+    expression = match_expression(query)
+    if not expression:
+        return [], None
+
+    connection = db.session.connection()
+    if fts_enabled(connection):
+        song_ids = [row[0] for row in connection.execute(text(
+            "SELECT rowid FROM song_search WHERE song_search MATCH :match "
+            "ORDER BY bm25(song_search, :w_title, :w_artists, :w_genre, :w_lyrics) "
+            "LIMIT :limit OFFSET :offset"
+        ), {
+            "match": expression,
+            "w_title": RANK_WEIGHTS[0],
+            "w_artists": RANK_WEIGHTS[1],
+            "w_genre": RANK_WEIGHTS[2],
+            "w_lyrics": RANK_WEIGHTS[3],
+            "limit": limit + 1,
+            "offset": offset
+        })]
+    else:
+        pattern = f"%{query.strip()}%"
+        song_ids = [row[0] for row in db.session.query(Song.song_id)
+                    .filter(Song.title.ilike(pattern))
+                    .order_by(Song.song_id)
+                    .limit(limit + 1).offset(offset)]
+
+    next_cursor = str(offset + limit) if len(song_ids) > limit else None
+    song_ids = song_ids[:limit]
+    if not song_ids:
+        return [], None
+
+    songs = Song.query.options(
+        joinedload(Song.creator),
+        joinedload(Song.genre),
+        lazyload(Song.artists)
+    ).filter(Song.song_id.in_(song_ids)).all()
+
+    by_id = {song.song_id: song for song in songs}
+    return [by_id[i] for i in song_ids if i in by_id], next_cursor
+
+
+# ================= CLI =================
+@search_cli.command("rebuild")
+def rebuild_command():
+    """Rebuild the song search index from the catalog."""
+    count = rebuild_search_index()
+    print(f"Indexed {count} songs")
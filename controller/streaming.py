@@ -0,0 +1,114 @@
+import mimetypes
+import os
+import uuid
+
+from flask import Response, current_app, request, send_file
+from werkzeug.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16
+
+
+def file_etag(stat):
+    return f"{int(stat.st_mtime)}-{stat.st_size}"
+
+
+def satisfiable_ranges(ranges, size):
+    result = []
+    for start, stop in ranges:
+        if start < 0:  # suffix range: the last -start bytes
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            result.append((start, stop))
+    return result
+
+
+def read_range(path, start, stop):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def multipart_ranges(path, ranges, size, mimetype, etag, stat):
+    boundary = uuid.uuid4().hex
+    heads = [
+        (f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+         f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode()
+        for start, stop in ranges
+    ]
+    tail = f"--{boundary}--\r\n".encode()
+    length = sum(len(h) + (stop - start) + 2 for h, (start, stop) in zip(heads, ranges)) + len(tail)
+
+    def body():
+        for head, (start, stop) in zip(heads, ranges):
+            yield head
+            yield from read_range(path, start, stop)
+            yield b"\r\n"
+        yield tail
+
+    response = Response(body(), status=206, mimetype=f"multipart/byteranges; boundary={boundary}")
+    response.content_length = length
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.headers["Accept-Ranges"] = "bytes"
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["STREAM_MAX_AGE"]
+    return response
+
+
+def if_range_matches(etag, stat):
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    return if_range.strip('"') == etag or if_range == http_date(stat.st_mtime)
+
+
+def stream_file(path, relative_path):
+    """Serve an audio file with conditional GET and byte-range support.
+
+    Full and single-range responses go through send_file, which honours
+    USE_X_SENDFILE and hands whole files to the server's sendfile-capable
+    file wrapper. Multi-range requests are answered as multipart/byteranges.
+    With STREAM_ACCEL_REDIRECT set, nginx serves the bytes instead.
+    """
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    accel_prefix = current_app.config["STREAM_ACCEL_REDIRECT"]
+    if accel_prefix:
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + relative_path
+        return response
+
+    stat = os.stat(path)
+    etag = file_etag(stat)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    ranges = request.range.ranges if request.range and request.range.units == "bytes" else []
+    if 1 < len(ranges) <= MAX_RANGES and if_range_matches(etag, stat):
+        ranges = satisfiable_ranges(ranges, stat.st_size)
+        if not ranges:
+            response = Response(status=416)
+            response.headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+        return multipart_ranges(path, ranges, stat.st_size, mimetype, etag, stat)
+
+    return send_file(
+        path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag,
+        last_modified=stat.st_mtime,
+        max_age=current_app.config["STREAM_MAX_AGE"]
+    )
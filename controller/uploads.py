@@ -0,0 +1,214 @@
+import hashlib
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import mutagen
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from controller.blobstore import READ_SIZE, hash_file, store_blob
+from controller.database import db
+from controller.http_cache import bump_version
+from controller.models import Artist, Genre, Song, SongArtist, UploadSession
+from controller.renditions import queue_renditions
+from controller.waveforms import queue_waveform
+from controller.workers import background
+
+ALLOWED_EXTENSIONS = {"mp3", "wav"}
+SESSION_TTL = timedelta(hours=24)
+
+# Running hashes of uploads whose chunks have so far arrived at this process
+# in order; anything else is rehashed from the temp file on completion.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def allowed_file(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def file_extension(filename):
+    return filename.rsplit(".", 1)[1].lower()
+
+
+def temp_path(upload_id):
+    folder = current_app.config["UPLOAD_TEMP_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{upload_id}.part")
+
+
+def parse_int(value, message):
+    # JSON clients send numbers or numeric strings; anything else is the client's mistake
+    if isinstance(value, bool):
+        raise UploadError(message)
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise UploadError(message)
+
+
+# ================= RESUMABLE SESSIONS =================
+def create_session(user_id, filename, title, genre_id, size):
+    filename = secure_filename(filename if isinstance(filename, str) else "")
+    if not allowed_file(filename):
+        raise UploadError("Invalid file type")
+    if not isinstance(title, str) or not title.strip():
+        raise UploadError("Missing title")
+    title = title.strip()
+    genre_id = parse_int(genre_id, "Invalid genre")
+    if not db.session.get(Genre, genre_id):
+        raise UploadError("Invalid genre")
+    size = parse_int(size, "Invalid file size")
+    if size <= 0 or size > current_app.config["MAX_UPLOAD_SIZE"]:
+        raise UploadError("Invalid file size", 413 if size > 0 else 400)
+
+    expire_sessions()
+
+    upload = UploadSession(
+        upload_id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        title=title,
+        genre_id=genre_id,
+        size=size
+    )
+    open(temp_path(upload.upload_id), "wb").close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    if offset != upload.received:
+        raise UploadError(f"Expected offset {upload.received}", 409)
+    if length > current_app.config["UPLOAD_CHUNK_SIZE"] or offset + length > upload.size:
+        raise UploadError("Chunk too large", 413)
+
+    with _hashers_lock:
+        hasher, hashed = _hashers.get(upload.upload_id, (None, None))
+    if hasher is None and offset == 0:
+        hasher, hashed = hashlib.sha256(), 0
+    if hashed != offset:
+        hasher = None
+
+    written = 0
+    with open(temp_path(upload.upload_id), "r+b") as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(READ_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            if hasher:
+                hasher.update(block)
+            written += len(block)
+
+    if written != length:
+        raise UploadError("Incomplete chunk")
+
+    # Only one request may advance a session from a given offset
+    advanced = (UploadSession.query
+                .filter_by(upload_id=upload.upload_id, received=offset)
+                .update({"received": offset + written}))
+    db.session.commit()
+    if not advanced:
+        raise UploadError("Concurrent chunk for this offset", 409)
+
+    with _hashers_lock:
+        if hasher:
+            _hashers[upload.upload_id] = (hasher, offset + written)
+        else:
+            _hashers.pop(upload.upload_id, None)
+    return offset + written
+
+
+def complete_session(upload):
+    if upload.received != upload.size:
+        raise UploadError(f"Upload incomplete: {upload.received} of {upload.size} bytes", 409)
+
+    path = temp_path(upload.upload_id)
+    with _hashers_lock:
+        hasher, hashed = _hashers.pop(upload.upload_id, (None, None))
+    digest = hasher.hexdigest() if hasher and hashed == upload.size else hash_file(path)
+
+    song = ingest_upload(
+        path, digest, file_extension(upload.filename),
+        upload.title, upload.genre_id, upload.user_id
+    )
+    db.session.delete(upload)
+    db.session.commit()
+    return song
+
+
+def abort_session(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.upload_id, None)
+    if os.path.exists(temp_path(upload.upload_id)):
+        os.remove(temp_path(upload.upload_id))
+    db.session.delete(upload)
+    db.session.commit()
+
+
+def expire_sessions():
+    cutoff = datetime.utcnow() - SESSION_TTL
+    for upload in UploadSession.query.filter(UploadSession.created_at < cutoff).all():
+        abort_session(upload)
+
+
+# ================= INGEST =================
+def ingest_upload(temp_file, digest, ext, title, genre_id, creator_id):
+    """Store a fully received upload and queue its metadata extraction."""
+    path = store_blob(temp_file, current_app.config["UPLOAD_FOLDER"], digest, ext)
+    song = Song(
+        title=title,
+        file_path=path,
+        content_hash=digest,
+        creator_id=creator_id,
+        genre_id=genre_id
+    )
+    db.session.add(song)
+    bump_version("catalog")
+    db.session.commit()
+
+    background.submit(extract_metadata, song.song_id)
+    queue_waveform(song.song_id)
+    queue_renditions(digest)
+    return song
+
+
+def extract_metadata(song_id):
+    song = db.session.get(Song, song_id)
+    if not song:
+        return
+
+    audio = mutagen.File(song.file_path.replace("\\", "/"), easy=True)
+    if audio is None:
+        return
+
+    song.duration = int(audio.info.length)
+    bitrate = getattr(audio.info, "bitrate", None)
+    song.bitrate = int(bitrate) if bitrate else None
+
+    tags = audio.tags if audio.tags is not None and hasattr(audio.tags, "get") else {}
+    for name in tags.get("artist", []):
+        name = name.strip()[:100]
+        if not name:
+            continue
+        artist = Artist.query.filter_by(artist_name=name).first()
+        if not artist:
+            artist = Artist(artist_name=name)
+            db.session.add(artist)
+            db.session.flush()
+        if not SongArtist.query.filter_by(song_id=song_id, artist_id=artist.artist_id).first():
+            db.session.add(SongArtist(song_id=song_id, artist_id=artist.artist_id))
+
+    bump_version("catalog")
+    db.session.commit()
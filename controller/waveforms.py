@@ -0,0 +1,207 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+
+from controller.database import db, upsert
+from controller.models import Song, SongWaveform
+from controller.workers import background
+
+waveforms_cli = AppGroup("waveforms", help="Generate waveform peaks for the player.")
+
+READ_FRAMES = 1 << 16
+
+
+class WaveformUnavailable(Exception):
+    """The audio could not be decoded."""
+
+
+# ================= DECODING =================
+# Both decoders yield mono int16 NumPy chunks, so a whole song is never in memory.
+def wav_samples(path):
+    with wave.open(path, "rb") as audio:
+        channels, width = audio.getnchannels(), audio.getsampwidth()
+        yield audio.getframerate()
+        while True:
+            raw = audio.readframes(READ_FRAMES)
+            if not raw:
+                return
+            if width == 1:
+                samples = (np.frombuffer(raw, np.uint8).astype(np.int32) - 128) << 8
+            elif width == 2:
+                samples = np.frombuffer(raw, "<i2").astype(np.int32)
+            elif width == 3:
+                octets = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+                samples = ((octets[:, 2] << 24) | (octets[:, 1] << 16) | (octets[:, 0] << 8)) >> 16
+            elif width == 4:
+                samples = np.frombuffer(raw, "<i4") >> 16
+            else:
+                raise WaveformUnavailable(f"Unsupported WAV sample width {width}")
+            yield samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+
+
+def ffmpeg_samples(path, rate):
+    # ffmpeg downmixes and resamples; peaks do not need the full sample rate
+    binary = shutil.which(current_app.config["FFMPEG_BINARY"])
+    if not binary:
+        raise WaveformUnavailable("ffmpeg is not installed")
+    process = subprocess.Popen(
+        [binary, "-v", "error", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(rate), "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        yield rate
+        while True:
+            raw = process.stdout.read(READ_FRAMES * 2)
+            if not raw:
+                break
+            yield np.frombuffer(raw[:len(raw) // 2 * 2], "<i2")
+        if process.wait() != 0:
+            raise WaveformUnavailable(process.stderr.read().decode(errors="replace").strip() or "ffmpeg failed")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def decode(path):
+    """Yield the sample rate, then mono int16 sample chunks."""
+    if path.lower().endswith(".wav"):
+        return wav_samples(path)
+    return ffmpeg_samples(path, current_app.config["WAVEFORM_DECODE_RATE"])
+
+
+# ================= PEAKS =================
+def frame_peaks(chunks, frame):
+    """Min and max of every `frame` samples, reduced chunk by chunk with NumPy."""
+    mins, maxs = [], []
+    carry = np.empty(0, np.int16)
+    for chunk in chunks:
+        samples = np.concatenate((carry, chunk)) if len(carry) else chunk
+        usable = len(samples) - len(samples) % frame
+        if usable:
+            blocks = samples[:usable].reshape(-1, frame)
+            mins.append(blocks.min(axis=1))
+            maxs.append(blocks.max(axis=1))
+        carry = samples[usable:]
+    if len(carry):
+        mins.append(carry.min(keepdims=True))
+        maxs.append(carry.max(keepdims=True))
+    if not mins:
+        raise WaveformUnavailable("No audio samples")
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def bucket_peaks(mins, maxs, buckets):
+    """Fold per-frame peaks into `buckets` (min, max) pairs, interleaved as int8."""
+    buckets = min(buckets, len(mins))
+    starts = np.arange(buckets) * len(mins) // buckets
+    low = np.minimum.reduceat(mins, starts) >> 8
+    high = np.maximum.reduceat(maxs, starts) >> 8
+    return np.column_stack((low, high)).astype(np.int8)
+
+
+def compute_peaks(path, buckets, frames_per_second):
+    samples = decode(path)
+    rate = next(samples)
+    mins, maxs = frame_peaks(samples, max(1, rate // frames_per_second))
+    return bucket_peaks(mins, maxs, buckets)
+
+
+def generate_waveform(song_id):
+    """Compute and store a song's peaks; failures are recorded so they are not retried forever."""
+    file_path = db.session.query(Song.file_path).filter_by(song_id=song_id).scalar()
+    if not file_path:
+        return None
+
+    config = current_app.config
+    values = {"song_id": song_id, "created_at": datetime.utcnow()}
+    try:
+        peaks = compute_peaks(os.path.join(current_app.root_path, file_path.replace("\\", "/")),
+                              config["WAVEFORM_BUCKETS"], config["WAVEFORM_FRAMES_PER_SECOND"])
+        values.update(status="ready", buckets=len(peaks), peaks=peaks.tobytes(), error=None)
+    except (WaveformUnavailable, OSError, wave.Error, EOFError) as e:
+        values.update(status="failed", buckets=None, peaks=None, error=str(e)[:500])
+
+    connection = db.session.connection()
+    connection.execute(
+        upsert(connection, SongWaveform).values(**values)
+        .on_conflict_do_update(index_elements=["song_id"],
+                               set_={key: value for key, value in values.items() if key != "song_id"})
+    )
+    db.session.commit()
+    return values["status"]
+
+
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def queue_waveform(song_id):
+    # Players polling a song that is still pending share one background job
+    with _queued_lock:
+        if song_id in _queued:
+            return
+        _queued.add(song_id)
+    background.submit(_generate_queued, song_id)
+
+
+def _generate_queued(song_id):
+    try:
+        generate_waveform(song_id)
+    finally:
+        with _queued_lock:
+            _queued.discard(song_id)
+
+
+# ================= BACKFILL =================
+def pending_songs(batch_size=500, retry_failed=False):
+    """Yield ids of songs without waveform peaks, in id order."""
+    last_id = 0
+    while True:
+        query = (db.session.query(Song.song_id)
+                 .outerjoin(SongWaveform, SongWaveform.song_id == Song.song_id)
+                 .filter(Song.song_id > last_id))
+        if retry_failed:
+            query = query.filter(db.or_(SongWaveform.status.is_(None), SongWaveform.status == "failed"))
+        else:
+            query = query.filter(SongWaveform.status.is_(None))
+        ids = [song_id for song_id, in query.order_by(Song.song_id).limit(batch_size)]
+        if not ids:
+            return
+        yield from ids
+        last_id = ids[-1]
+
+
+@waveforms_cli.command("backfill")
+@click.option("--workers", type=int, default=2, show_default=True, help="Songs decoded at once.")
+@click.option("--limit", type=int, help="Stop after this many songs.")
+@click.option("--retry-failed", is_flag=True, help="Also retry songs whose decoding failed.")
+def backfill_command(workers, limit, retry_failed):
+    """Generate peaks for every song that has none, resuming where a previous run stopped."""
+    app = current_app._get_current_object()
+    song_ids = list(islice(pending_songs(retry_failed=retry_failed), limit))
+    started = time.monotonic()
+
+    def run(song_id):
+        with app.app_context():
+            try:
+                return generate_waveform(song_id)
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="waveforms") as pool:
+        statuses = list(pool.map(run, song_ids))
+
+    print(f"Generated peaks for {statuses.count('ready')} of {len(song_ids)} songs "
+          f"({statuses.count('failed')} failed) in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,57 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from controller.database import db
+
+
+class BackgroundPool:
+    """Per-process thread pool for work that should not hold up a request.
+
+    Jobs run inside an application context with their own database session.
+    With BACKGROUND_WORKERS = 0 jobs run inline, which keeps tests and the
+    CLI deterministic.
+    """
+
+    def __init__(self, app=None, setting="BACKGROUND_WORKERS", name="background"):
+        self.setting = setting
+        self.name = name
+        self.app = None
+        self.executor = None
+        self.pid = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config[self.setting]
+        app.extensions[f"{self.name}_pool"] = self
+
+    def submit(self, fn, *args, **kwargs):
+        if self.max_workers <= 0:
+            self._run(fn, *args, **kwargs)
+            return None
+
+        # Pools do not survive a fork, so each worker process creates its own
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.name)
+                    self.pid = os.getpid()
+        return self.executor.submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        with self.app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                print(f"{self.name.capitalize()} job {fn.__name__} failed: {e}")
+                raise
+            finally:
+                db.session.remove()
+
+
+background = BackgroundPool()
+# Transcodes are long and CPU-heavy, so they get their own pool
+transcoder = BackgroundPool(setting="TRANSCODE_WORKERS", name="transcode")
@@ -1,114 +1,151 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, session, flash, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
+import hmac
 import os
-
-from mutagen.mp3 import MP3
-from mutagen.wave import WAVE
+import uuid
 
 from datetime import datetime
 
 from controller.config import Config
-from controller.database import db
+from controller.database import db, init_database
 from controller.models import (
     User, Role, Genre, Song, Artist,
-    Playlist, PlaylistSong, Notification
+    Playlist, PlaylistSong, UploadSession, LyricsJob, SongWaveform, AudioRendition, SongTrend
 )
-from sqlalchemy.orm import joinedload
-
-import google.generativeai as genai  # Gemini AI
-
-# ================= APP SETUP =================
-app = Flask(__name__)
-app.config.from_object(Config)
-db.init_app(app)
-
-# =============== Gemini Setup ===============
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-if not os.getenv("GEMINI_API_KEY"):
-    raise RuntimeError("GEMINI_API_KEY is not set in environment variables")
-
-# Use stable fast model (supports audio transcription)
-model = genai.GenerativeModel('gemini-2.5-flash')
-
-print("Gemini model loaded: gemini-2.5-flash")
-
-UPLOAD_FOLDER = "static/uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-
-ALLOWED_EXTENSIONS = {"mp3", "wav"}
-
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
-
-
-# ================= DB INIT =================
-with app.app_context():
-    db.create_all()
-
-    for r in ["ADMIN", "CREATOR", "USER"]:
-        if not Role.query.filter_by(role_name=r).first():
-            db.session.add(Role(role_name=r))
+from controller.catalog import init_song_cache, known_songs, page_size, song_exists, song_page, serialize_song
+from controller.auth import (
+    ALL_ROLES, LISTENER_ROLES, current_user, has_role, init_auth, invalidate_block_status, is_blocked,
+    role_required
+)
+from controller.search import search_cli, search_songs
+from controller.play_buffer import play_buffer
+from controller.streaming import stream_file
+from controller.migrations import db_cli, init_db
+from controller.workers import background, transcoder
+from controller.blobstore import blobs_cli, copy_and_hash, release_blob, remove_orphaned_blob
+from controller.uploads import (
+    UploadError, allowed_file, file_extension, create_session, append_chunk,
+    complete_session, abort_session, ingest_upload, parse_int, temp_path
+)
+from controller.analytics import (
+    analytics_cli, rollup_compactor, daily_plays, purge_song_history, song_series, top_songs, unique_listeners
+)
+from controller.lyrics import lyrics_cli, lyrics_queue, GeminiTranscriber, StubTranscriber
+from controller.benchmarks import bench_cli
+from controller.instrumentation import instrumentation
+from controller.http_cache import bump_version, cached_json, init_response_cache
+from controller.charts import CHARTS, cached_chart, charts_cli, init_charts
+from controller.recommendations import recommendation_builder, recommendations_cli, recommended_for, similar_songs
+from controller.passwords import PasswordsBusy, passwords
+from controller.waveforms import queue_waveform, waveforms_cli
+from controller.renditions import pick_rendition, renditions_cli, requested_quality
+from controller.notifications import (
+    notifications_cli, notify, broadcast, inbox_page, inbox_context, unread_count, mark_read,
+    serialize_notification
+)
+from controller.events import event_hub, user_channels
+from controller.playlists import (
+    PlaylistChanged, add_song, add_songs, export_json, export_m3u, import_entries, move_song,
+    parse_m3u, remove_songs, reorder
+)
+from controller.dashboard import (
+    init_stats_cache, invalidate_dashboard_stats, dashboard_stats, users_with_role, first_genre_pages
+)
+from sqlalchemy.orm import joinedload, selectinload
 
-    if not Genre.query.first():
-        db.session.add_all([
-            Genre(genre_name="Pop"),
-            Genre(genre_name="Rock"),
-            Genre(genre_name="Hip-Hop"),
-            Genre(genre_name="Classical")
-        ])
+bp = Blueprint("tunex", __name__)
 
-    db.session.commit()
 
-    admin = User.query.filter_by(email="admin@tunex.com").first()
-    if not admin:
-        admin = User(
-            username="TUNEX_ADMIN",
-            email="admin@tunex.com",
-            password_hash=generate_password_hash("admin123")
-        )
-        admin.roles.append(Role.query.filter_by(role_name="ADMIN").first())
-        db.session.add(admin)
-        db.session.commit()
+# ================= APP SETUP =================
+def create_app(config=Config):
+    """Build the app without touching the database or the Gemini SDK.
+
+    Tables and seed data are created by `flask db init`; the Gemini client
+    is configured on the first transcription.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    init_database(app)
+    instrumentation.init_app(app)
+    background.init_app(app)
+    transcoder.init_app(app)
+    play_buffer.init_app(app)
+    rollup_compactor.init_app(app)
+    init_stats_cache(app)
+    init_auth(app)
+    passwords.init_app(app)
+    init_song_cache(app)
+    init_charts(app)
+    init_response_cache(app)
+    event_hub.init_app(app)
+    recommendation_builder.init_app(app)
+
+    # =============== Lyrics Transcription ===============
+    if app.config["LYRICS_TRANSCRIBER"] == "stub":
+        lyrics_queue.init_app(app, StubTranscriber())
+    else:
+        lyrics_queue.init_app(app, GeminiTranscriber(app.config["GEMINI_API_KEY"], app.config["GEMINI_MODEL"]))
+
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+
+    for command in (db_cli, search_cli, analytics_cli, blobs_cli, lyrics_cli, notifications_cli, waveforms_cli,
+                    renditions_cli, recommendations_cli, charts_cli, bench_cli):
+        app.cli.add_command(command)
+
+    app.register_blueprint(bp)
+    return app
 
 
 # ================= AUTH =================
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html")
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
-        user = User.query.filter_by(email=request.form["email"]).first()
+        user = User.query.options(selectinload(User.roles)).filter_by(email=request.form["email"]).first()
+
+        password = request.form["password"]
+        try:
+            valid = user is not None and passwords.verify(user.password_hash, password)
+        except PasswordsBusy:
+            flash("Too many sign-ins right now, please try again in a moment", "error")
+            return redirect(url_for("tunex.login"))
+
+        if valid:
+            # Hashes made with older settings are replaced while the password is at hand
+            if passwords.needs_rehash(user.password_hash):
+                try:
+                    user.password_hash = passwords.hash(password)
+                    db.session.commit()
+                except PasswordsBusy:
+                    pass  # the old hash still works; it is upgraded on a later login
 
-        if user and check_password_hash(user.password_hash, request.form["password"]):
             session["user_id"] = user.user_id
             session["username"] = user.username
             roles = [r.role_name for r in user.roles]
             session["roles"] = roles
 
             if 'ADMIN' in roles:
-                return redirect(url_for("admin_dashboard"))
+                return redirect(url_for("tunex.admin_dashboard"))
             elif 'CREATOR' in roles:
-                return redirect(url_for("creator_dashboard"))
+                return redirect(url_for("tunex.creator_dashboard"))
             elif 'USER' in roles:
-                return redirect(url_for("user_dashboard"))
+                return redirect(url_for("tunex.user_dashboard"))
             else:
                 flash("No valid role assigned", "error")
-                return redirect(url_for("login"))
+                return redirect(url_for("tunex.login"))
 
         else:
             flash("Invalid email or password", "error")
-            return redirect(url_for("login"))
+            return redirect(url_for("tunex.login"))
 
     return render_template("login.html")
 
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         email = request.form.get("email")
@@ -122,10 +159,15 @@ def register():
         if User.query.filter_by(email=email).first():
             return "Email already exists"
 
+        try:
+            password_hash = passwords.hash(password)
+        except PasswordsBusy:
+            return "Server busy, please try again", 503
+
         user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password)
+            password_hash=password_hash
         )
 
         role = Role.query.filter_by(role_name=role_name).first()
@@ -135,102 +177,134 @@ def register():
         user.roles.append(role)
         db.session.add(user)
         db.session.commit()
+        invalidate_dashboard_stats()
 
-        return redirect(url_for("login"))
+        return redirect(url_for("tunex.login"))
 
     return render_template("register.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()
-    return redirect(url_for("index"))
+    return redirect(url_for("tunex.index"))
 
 
 # ================= ADMIN =================
-@app.route("/dashboard/admin")
+@bp.route("/dashboard/admin")
+@role_required("ADMIN")
 def admin_dashboard():
-    if 'ADMIN' not in session.get('roles', []):
-        return redirect(url_for("login"))
+    user = current_user()
 
-    user = User.query.get(session["user_id"])
-
-    all_users = User.query.all()
-
-    normal_user_list = [
-        u for u in all_users
-        if 'USER' in [r.role_name for r in u.roles] and 'CREATOR' not in [r.role_name for r in u.roles]
-    ]
-
-    creator_list = [
-        u for u in all_users
-        if 'CREATOR' in [r.role_name for r in u.roles]
-    ]
-
-    normal_users = len(normal_user_list)
-    creators = len(creator_list)
-    total_songs = Song.query.count()
-
-    songs_by_genre = {}
-    for song in Song.query.options(joinedload(Song.creator)).all():
-        g = song.genre.genre_name
-        songs_by_genre.setdefault(g, []).append(song)
+    # Counts come from cached GROUP BY aggregates; each genre shows its first page
+    stats = dashboard_stats()
+    page_size = current_app.config["ADMIN_GENRE_PAGE_SIZE"]
+    genre_pages, genre_cursors = first_genre_pages(page_size)
+    user_page_size = current_app.config["ADMIN_USER_PAGE_SIZE"]
+    normal_user_list, normal_users_after = users_with_role("USER", exclude_role="CREATOR", limit=user_page_size)
+    creator_list, creators_after = users_with_role("CREATOR", limit=user_page_size)
 
     return render_template(
         "admin_dashboard.html",
         user=user,
-        normal_users=normal_users,
-        creators=creators,
-        total_songs=total_songs,
-        songs_by_genre=songs_by_genre,
+        normal_users=stats["normal_users"],
+        creators=stats["creators"],
+        total_songs=stats["total_songs"],
+        genres=[genre for genre in stats["genres"] if genre["genre_id"] in genre_pages],
+        genre_pages=genre_pages,
+        genre_cursors=genre_cursors,
         normal_user_list=normal_user_list,
-        creator_list=creator_list
+        normal_users_after=normal_users_after,
+        creator_list=creator_list,
+        creators_after=creators_after
     )
 
 
-@app.route("/admin/block/user/<int:user_id>", methods=["POST"])
-def admin_block_user(user_id):
-    if 'ADMIN' not in session.get('roles', []):
-        return "Unauthorized", 403
+@bp.route("/api/admin/users")
+@role_required("ADMIN", denied=({"error": "Admin access required"}, 403))
+def admin_user_page():
+    # Next page of the dashboard's user or creator list: ?role=USER|CREATOR&after=<user_id>
+    role = request.args.get("role")
+    if role not in ("USER", "CREATOR"):
+        return jsonify({"error": "Invalid role"}), 400
+    users, after = users_with_role(
+        role,
+        exclude_role="CREATOR" if role == "USER" else None,
+        after_id=request.args.get("after", 0, type=int),
+        limit=current_app.config["ADMIN_USER_PAGE_SIZE"]
+    )
+    return jsonify({
+        "users": [
+            {"user_id": user.user_id, "username": user.username, "email": user.email, "is_blocked": user.is_blocked}
+            for user in users
+        ],
+        "next_after": after
+    })
 
+
+@bp.route("/api/admin/genre/<int:genre_id>/songs")
+@role_required("ADMIN", denied=({"error": "Admin access required"}, 403))
+def admin_genre_songs(genre_id):
+    try:
+        songs, next_cursor = song_page(
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit", current_app.config["ADMIN_GENRE_PAGE_SIZE"]),
+            genre_id=genre_id
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "songs": [serialize_song(song) for song in songs],
+        "next_cursor": next_cursor
+    })
+
+
+@bp.route("/admin/block/user/<int:user_id>", methods=["POST"])
+@role_required("ADMIN", denied=("Unauthorized", 403))
+def admin_block_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_blocked = True
+    notify(user_id, "Your account has been blocked by admin.")
     db.session.commit()
-
-    notif = Notification(
-        user_id=user_id,
-        message="Your account has been blocked by admin."
-    )
-    db.session.add(notif)
-    db.session.commit()
+    invalidate_block_status(user_id)
 
     return '', 204
 
 
-@app.route("/admin/unblock/user/<int:user_id>", methods=["POST"])
+@bp.route("/admin/unblock/user/<int:user_id>", methods=["POST"])
+@role_required("ADMIN", denied=("Unauthorized", 403))
 def admin_unblock_user(user_id):
-    if 'ADMIN' not in session.get('roles', []):
-        return "Unauthorized", 403
-
     user = User.query.get_or_404(user_id)
     user.is_blocked = False
+    notify(user_id, "Your account has been unblocked.")
     db.session.commit()
-
-    notif = Notification(
-        user_id=user_id,
-        message="Your account has been unblocked."
-    )
-    db.session.add(notif)
-    db.session.commit()
+    invalidate_block_status(user_id)
 
     return '', 204
 
 
-@app.route("/admin/delete/song/<int:song_id>", methods=["POST"])
-def admin_delete_song(song_id):
-    if 'ADMIN' not in session.get('roles', []):
-        return "Unauthorized", 403
+def remove_song(song):
+    """Delete a song and every row keyed by its id; its file goes once no other song shares it."""
+    song_id = song.song_id
+    PlaylistSong.query.filter_by(song_id=song_id).delete()
+    SongWaveform.query.filter_by(song_id=song_id).delete()
+    SongTrend.query.filter_by(song_id=song_id).delete()
+    LyricsJob.query.filter_by(song_id=song_id).delete()
+    orphaned_file = release_blob(song)
+    db.session.delete(song)
+    db.session.flush()
+    purge_song_history(db.session.connection(), song_id, current_app.config["CHART_SIZE"])
+    bump_version("catalog", "lyrics")
+    db.session.commit()
+    remove_orphaned_blob(orphaned_file)
+    known_songs.invalidate(song_id)
+    invalidate_dashboard_stats()
 
+
+@bp.route("/admin/delete/song/<int:song_id>", methods=["POST"])
+@role_required("ADMIN", denied=("Unauthorized", 403))
+def admin_delete_song(song_id):
     reason = request.form.get("reason", "No reason provided").strip()
     if not reason:
         reason = "No reason provided"
@@ -238,57 +312,37 @@ def admin_delete_song(song_id):
     song = Song.query.get_or_404(song_id)
     creator_id = song.creator_id
 
-    notif = Notification(
-        user_id=creator_id,
-        message=f"Your song '{song.title}' was deleted by admin. Reason: {reason}"
-    )
-    db.session.add(notif)
+    notify(creator_id, f"Your song '{song.title}' was deleted by admin. Reason: {reason}")
 
-    PlaylistSong.query.filter_by(song_id=song_id).delete()
-    db.session.delete(song)
-    db.session.commit()
+    remove_song(song)
 
     flash("Song deleted successfully and creator notified.", "success")
-    return redirect(url_for("admin_dashboard"))
+    return redirect(url_for("tunex.admin_dashboard"))
 
 
 # ================= CREATOR =================
-@app.route("/dashboard/creator")
+@bp.route("/dashboard/creator")
+@role_required("CREATOR")
 def creator_dashboard(blocked_upload=None):
-    if 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
-    user = User.query.get(session["user_id"])
-
-    is_blocked = user.is_blocked if user else False
-
+    # Totals and the top song are on the analytics page, read from ix_songs_creator_popular
     songs = Song.query.options(joinedload(Song.genre)).filter_by(creator_id=session["user_id"]).all()
-    total_songs = len(songs)
-    top_song = max(songs, key=lambda s: s.play_count, default=None) if songs else None
-
-    notifications = Notification.query.filter_by(user_id=session["user_id"]).order_by(Notification.timestamp.desc()).all()
 
     return render_template(
         "creator_dashboard.html",
         username=session["username"],
         genres=Genre.query.all(),
         songs=songs,
-        total_songs=total_songs,
-        top_song=top_song,
-        notifications=notifications,
         blocked_upload=blocked_upload,
-        is_blocked=is_blocked
+        is_blocked=is_blocked(),
+        **inbox_context(session["user_id"])
     )
 
 
-@app.route("/creator/upload", methods=["POST"])
+@bp.route("/creator/upload", methods=["POST"])
+@role_required("CREATOR")
 def creator_upload():
-    if 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
-    user = User.query.get(session["user_id"])
-    if user.is_blocked:
-        return redirect(url_for("creator_dashboard", blocked_upload=1))
+    if is_blocked():
+        return redirect(url_for("tunex.creator_dashboard", blocked_upload=1))
 
     file = request.files["song"]
     title = request.form["title"]
@@ -296,134 +350,192 @@ def creator_upload():
 
     if not allowed_file(file.filename):
         flash("Invalid file type", "error")
-        return redirect(url_for("creator_dashboard"))
+        return redirect(url_for("tunex.creator_dashboard"))
 
-    filename = secure_filename(file.filename)
-    path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(path)
+    # Copied to a temp file in bounded blocks and hashed on the way; duration
+    # and tags are read in the background
+    temp_file = temp_path(uuid.uuid4().hex)
+    digest = copy_and_hash(file.stream, temp_file)
+    ingest_upload(temp_file, digest, file_extension(file.filename),
+                  title, genre_id, session["user_id"])
+    invalidate_dashboard_stats()
 
-    duration = (
-        int(MP3(path).info.length)
-        if filename.endswith(".mp3")
-        else int(WAVE(path).info.length)
-    )
+    flash("Song uploaded successfully!", "success")
+    return redirect(url_for("tunex.creator_dashboard"))
 
-    song = Song(
-        title=title,
-        file_path=path,
-        duration=duration,
-        creator_id=session["user_id"],
-        genre_id=genre_id
-    )
 
-    db.session.add(song)
-    db.session.commit()
+# ================= RESUMABLE UPLOADS =================
+def get_upload_session(upload_id):
+    upload = UploadSession.query.get_or_404(upload_id)
+    if upload.user_id != session["user_id"]:
+        return None
+    return upload
 
-    flash("Song uploaded successfully!", "success")
-    return redirect(url_for("creator_dashboard"))
 
+@bp.route("/creator/upload/session", methods=["POST"])
+@role_required("CREATOR", denied=({"error": "Creator access required"}, 403))
+def create_upload_session():
+    if is_blocked():
+        return jsonify({"error": "Account blocked"}), 403
 
-@app.route("/creator/edit/<int:song_id>", methods=["POST"])
-def edit_song(song_id):
-    if 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected {\"filename\", \"title\", \"genre_id\", \"size\"}"}), 400
+    try:
+        upload = create_session(
+            session["user_id"],
+            data.get("filename"),
+            data.get("title"),
+            data.get("genre_id"),
+            data.get("size")
+        )
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    return jsonify({
+        "upload_id": upload.upload_id,
+        "chunk_size": current_app.config["UPLOAD_CHUNK_SIZE"]
+    }), 201
+
+
+@bp.route("/creator/upload/<upload_id>", methods=["GET", "PUT", "DELETE"])
+@role_required("CREATOR", denied=({"error": "Creator access required"}, 403))
+def upload_chunk(upload_id):
+    upload = get_upload_session(upload_id)
+    if not upload:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if request.method == "GET":
+        return jsonify({"received": upload.received, "size": upload.size})
+
+    if request.method == "DELETE":
+        abort_session(upload)
+        return '', 204
+
+    try:
+        offset = parse_int(request.args.get("offset", upload.received), "Invalid offset")
+        received = append_chunk(upload, offset, request.stream, request.content_length or 0)
+    except UploadError as e:
+        return jsonify({"error": str(e), "received": upload.received}), e.status
+
+    return jsonify({"received": received, "size": upload.size})
+
+
+@bp.route("/creator/upload/<upload_id>/complete", methods=["POST"])
+@role_required("CREATOR", denied=({"error": "Creator access required"}, 403))
+def complete_upload(upload_id):
+    upload = get_upload_session(upload_id)
+    if not upload:
+        return jsonify({"error": "Unauthorized"}), 403
 
+    try:
+        song = complete_session(upload)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    invalidate_dashboard_stats()
+
+    return jsonify({"song_id": song.song_id, "status": "processing"}), 201
+
+
+@bp.route("/creator/edit/<int:song_id>", methods=["POST"])
+@role_required("CREATOR")
+def edit_song(song_id):
     song = Song.query.get_or_404(song_id)
     if song.creator_id != session["user_id"]:
         return "Unauthorized", 403
 
     song.title = request.form["title"]
+    bump_version("catalog")
     db.session.commit()
 
-    return redirect(url_for("creator_dashboard"))
+    return redirect(url_for("tunex.creator_dashboard"))
 
 
-@app.route("/creator/delete/<int:song_id>", methods=["POST"])
+@bp.route("/creator/delete/<int:song_id>", methods=["POST"])
+@role_required("CREATOR")
 def delete_song(song_id):
-    if 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
     song = Song.query.get_or_404(song_id)
     if song.creator_id != session["user_id"]:
         return "Unauthorized", 403
 
-    PlaylistSong.query.filter_by(song_id=song_id).delete()
-    db.session.delete(song)
-    db.session.commit()
+    remove_song(song)
 
-    return redirect(url_for("creator_dashboard"))
+    return redirect(url_for("tunex.creator_dashboard"))
 
 
-@app.route("/dashboard/analytics")
+@bp.route("/dashboard/analytics")
+@role_required("CREATOR")
 def creator_analytics():
-    if 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
+    creator_id = session["user_id"]
+    days = 7 if request.args.get("days") == "7" else 30
 
-    user = User.query.get(session["user_id"])
-    songs = Song.query.filter_by(creator_id=session["user_id"]).all()
-    total_songs = len(songs)
-    top_song = max(songs, key=lambda s: s.play_count, default=None) if songs else None
-    notifications = Notification.query.filter_by(user_id=session["user_id"]).order_by(Notification.timestamp.desc()).all()
+    total_songs = Song.query.filter_by(creator_id=creator_id).count()
+    top_song = (Song.query.filter_by(creator_id=creator_id)
+                .order_by(Song.play_count.desc()).first())
 
+    # Windowed figures come from the hourly/daily rollups, not from scanning plays
     return render_template("creator_analytics.html",
                            username=session["username"],
                            total_songs=total_songs,
                            top_song=top_song,
-                           notifications=notifications)
+                           days=days,
+                           daily=daily_plays(creator_id, days),
+                           window_top_songs=top_songs(creator_id, days),
+                           listeners=unique_listeners(creator_id, days),
+                           **inbox_context(creator_id))
 
 
-# ================= USER DASHBOARD (FOR BOTH REGULAR USERS AND CREATORS IN USER MODE) =================
-@app.route("/dashboard/user")
-def user_dashboard():
-    # Allow both USER and CREATOR roles
-    roles = session.get('roles', [])
-    if 'USER' not in roles and 'CREATOR' not in roles:
-        return redirect(url_for("login"))
+@bp.route("/api/analytics/song/<int:song_id>")
+@role_required("CREATOR", denied=({"error": "Creator access required"}, 403))
+def api_song_analytics(song_id):
+    song = Song.query.get_or_404(song_id)
+    if song.creator_id != session["user_id"]:
+        return jsonify({"error": "Unauthorized"}), 403
 
-    user_id = session["user_id"]
-    current_user = User.query.get(user_id)
+    period = "hour" if request.args.get("period") == "hour" else "day"
+    buckets = 48 if period == "hour" else 30
 
-    if not current_user:
-        session.clear()
-        flash("Session expired. Please log in again.", "error")
-        return redirect(url_for("login"))
+    return jsonify({
+        "song_id": song_id,
+        "period": period,
+        "series": song_series(song_id, period, buckets)
+    })
 
-    songs = Song.query.options(
-        joinedload(Song.genre),
-        joinedload(Song.artists)
-    ).all()
 
-    notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.timestamp.desc()).all()
+# ================= USER DASHBOARD (FOR BOTH REGULAR USERS AND CREATORS IN USER MODE) =================
+@bp.route("/dashboard/user")
+@role_required(*LISTENER_ROLES, load_user=True)
+def user_dashboard():
+    user_id = session["user_id"]
+
+    # Only the first page is rendered; the rest is fetched from /api/songs on scroll
+    songs, next_cursor = song_page()
 
     return render_template(
         "user_dashboard.html",
         username=session["username"],
         songs=songs,
+        next_cursor=next_cursor,
         playlists=Playlist.query.filter_by(user_id=user_id).all(),
         active_playlist=None,
-        notifications=notifications,
-        is_blocked=current_user.is_blocked
+        is_blocked=current_user().is_blocked,
+        **inbox_context(user_id)
     )
 
 
-@app.route("/playlist/<int:playlist_id>")
+@bp.route("/playlist/<int:playlist_id>")
+@role_required(*LISTENER_ROLES, load_user=True)
 def view_playlist(playlist_id):
     playlist = Playlist.query.get_or_404(playlist_id)
 
-    user_id = session.get("user_id")
+    user_id = session["user_id"]
     if playlist.user_id != user_id:
         return "Unauthorized", 403
 
-    current_user = User.query.get(user_id)
-    if not current_user:
-        session.clear()
-        flash("Session expired. Please log in again.", "error")
-        return redirect(url_for("login"))
-
     songs = (
         Song.query.options(
             joinedload(Song.genre),
-            joinedload(Song.artists)
+            selectinload(Song.artists)
         )
         .join(PlaylistSong)
         .filter(PlaylistSong.playlist_id == playlist_id)
@@ -431,39 +543,33 @@ def view_playlist(playlist_id):
         .all()
     )
 
-    notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.timestamp.desc()).all()
-
     return render_template(
         "user_dashboard.html",
         username=session["username"],
         songs=songs,
         playlists=Playlist.query.filter_by(user_id=user_id).all(),
         active_playlist=playlist,
-        notifications=notifications,
-        is_blocked=current_user.is_blocked
+        is_blocked=current_user().is_blocked,
+        **inbox_context(user_id)
     )
 
 
 # ================= PLAYLIST ROUTES =================
-@app.route("/playlist/create", methods=["POST"])
+@bp.route("/playlist/create", methods=["POST"])
+@role_required(*LISTENER_ROLES)
 def create_playlist():
-    if 'USER' not in session.get('roles', []) and 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
     playlist = Playlist(
         playlist_name=request.form["name"],
         user_id=session["user_id"]
     )
     db.session.add(playlist)
     db.session.commit()
-    return redirect(url_for("user_dashboard"))
+    return redirect(url_for("tunex.user_dashboard"))
 
 
-@app.route("/playlist/add", methods=["POST"])
+@bp.route("/playlist/add", methods=["POST"])
+@role_required(*LISTENER_ROLES)
 def add_song_to_playlist():
-    if 'USER' not in session.get('roles', []) and 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
     playlist_id = int(request.form["playlist_id"])
     song_id = int(request.form["song_id"])
 
@@ -471,37 +577,27 @@ def add_song_to_playlist():
     if playlist.user_id != session["user_id"]:
         return "Unauthorized", 403
 
-    if PlaylistSong.query.filter_by(playlist_id=playlist_id, song_id=song_id).first():
-        return redirect(request.referrer or url_for("user_dashboard"))
-
-    next_position = (db.session.query(db.func.max(PlaylistSong.position))
-                    .filter_by(playlist_id=playlist_id).scalar() or 0) + 1
-
-    db.session.add(PlaylistSong(playlist_id=playlist_id, song_id=song_id, position=next_position))
+    add_song(db.session.connection(), playlist_id, song_id)
     db.session.commit()
 
-    return redirect(request.referrer or url_for("user_dashboard"))
+    return redirect(request.referrer or url_for("tunex.user_dashboard"))
 
 
-@app.route("/playlist/rename/<int:playlist_id>", methods=["POST"])
+@bp.route("/playlist/rename/<int:playlist_id>", methods=["POST"])
+@role_required(*LISTENER_ROLES)
 def rename_playlist(playlist_id):
-    if 'USER' not in session.get('roles', []) and 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
     playlist = Playlist.query.get_or_404(playlist_id)
     if playlist.user_id != session["user_id"]:
         return "Unauthorized", 403
 
     playlist.playlist_name = request.form["name"].strip()
     db.session.commit()
-    return redirect(url_for("user_dashboard"))
+    return redirect(url_for("tunex.user_dashboard"))
 
 
-@app.route("/playlist/delete/<int:playlist_id>", methods=["POST"])
+@bp.route("/playlist/delete/<int:playlist_id>", methods=["POST"])
+@role_required(*LISTENER_ROLES)
 def delete_playlist(playlist_id):
-    if 'USER' not in session.get('roles', []) and 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
     playlist = Playlist.query.get_or_404(playlist_id)
     if playlist.user_id != session["user_id"]:
         return "Unauthorized", 403
@@ -509,14 +605,12 @@ def delete_playlist(playlist_id):
     PlaylistSong.query.filter_by(playlist_id=playlist_id).delete()
     db.session.delete(playlist)
     db.session.commit()
-    return redirect(url_for("user_dashboard"))
+    return redirect(url_for("tunex.user_dashboard"))
 
 
-@app.route('/playlist/remove', methods=['POST'])
+@bp.route('/playlist/remove', methods=['POST'])
+@role_required(*LISTENER_ROLES)
 def remove_from_playlist():
-    if 'USER' not in session.get('roles', []) and 'CREATOR' not in session.get('roles', []):
-        return redirect(url_for("login"))
-
     playlist_id = int(request.form['playlist_id'])
     song_id = int(request.form['song_id'])
 
@@ -526,53 +620,159 @@ def remove_from_playlist():
 
     PlaylistSong.query.filter_by(playlist_id=playlist_id, song_id=song_id).delete()
     db.session.commit()
-    return redirect(request.referrer or url_for('user_dashboard'))
+    return redirect(request.referrer or url_for('tunex.user_dashboard'))
+
+
+@bp.route('/api/playlist/<int:playlist_id>/songs', methods=['POST', 'DELETE'])
+@role_required(*LISTENER_ROLES, denied=({"error": "Unauthorized"}, 403))
+def playlist_songs_batch(playlist_id):
+    playlist = Playlist.query.get_or_404(playlist_id)
+    if playlist.user_id != session['user_id']:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        song_ids = [int(song_id) for song_id in data['song_ids']]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "song_ids must be a list of song ids"}), 400
+
+    # The whole list is applied in one transaction
+    if request.method == 'DELETE':
+        removed = remove_songs(db.session.connection(), playlist_id, song_ids)
+        db.session.commit()
+        return jsonify({"removed": removed})
+
+    added, missing = add_songs(db.session.connection(), playlist_id, song_ids)
+    db.session.commit()
+    return jsonify({"added": added, "missing": missing})
+
 
+@bp.route('/playlist/<int:playlist_id>/export')
+@role_required(*LISTENER_ROLES)
+def export_playlist(playlist_id):
+    playlist = Playlist.query.get_or_404(playlist_id)
+    if playlist.user_id != session['user_id']:
+        return "Unauthorized", 403
 
-@app.route('/playlist/reorder/<int:playlist_id>', methods=['POST'])
+    fmt = request.args.get('format', 'm3u')
+    if fmt == 'json':
+        body, mimetype = export_json(playlist), 'application/json'
+    elif fmt == 'm3u':
+        body, mimetype = export_m3u(playlist), 'audio/x-mpegurl'
+    else:
+        return jsonify({"error": "format must be m3u or json"}), 400
+
+    filename = secure_filename(playlist.playlist_name) or f"playlist-{playlist_id}"
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+@bp.route('/playlist/import', methods=['POST'])
+@role_required(*LISTENER_ROLES, denied=({"error": "Unauthorized"}, 403))
+def import_playlist():
+    name = request.args.get('name')
+    upload = request.files.get('file')
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('songs'), list):
+            return jsonify({"error": "Expected {\"name\": ..., \"songs\": [...]}"}), 400
+        entries = data['songs']
+        name = name or data.get('playlist') or data.get('name')
+    elif upload:
+        # M3U is read line by line as it is resolved
+        entries = parse_m3u(upload.stream)
+        name = name or os.path.splitext(upload.filename or "")[0]
+    else:
+        entries = parse_m3u(request.stream)
+
+    playlist_id = request.args.get('playlist_id', type=int)
+    if playlist_id:
+        playlist = Playlist.query.get_or_404(playlist_id)
+        if playlist.user_id != session['user_id']:
+            return jsonify({"error": "Unauthorized"}), 403
+    else:
+        playlist = Playlist(playlist_name=(name or "Imported playlist")[:100], user_id=session['user_id'])
+        db.session.add(playlist)
+        db.session.flush()
+
+    added, unresolved = import_entries(playlist.playlist_id, entries)
+    db.session.commit()
+    return jsonify({
+        "playlist_id": playlist.playlist_id,
+        "added": added,
+        "unresolved": unresolved[:100],
+        "unresolved_count": len(unresolved)
+    })
+
+
+@bp.route('/playlist/reorder/<int:playlist_id>', methods=['POST'])
+@role_required(*LISTENER_ROLES, denied=('', 403))
 def reorder_playlist(playlist_id):
-    if 'USER' not in session.get('roles', []) and 'CREATOR' not in session.get('roles', []):
+    playlist = Playlist.query.get_or_404(playlist_id)
+    if playlist.user_id != session['user_id']:
         return '', 403
 
+    data = request.get_json(silent=True) or {}
+    order = data.get('order')
+    if not isinstance(order, list):
+        return jsonify({"error": "order must be a list of song ids"}), 400
+
+    try:
+        # Older clients send [{"song_id": ..., "position": ...}]
+        if order and isinstance(order[0], dict):
+            order = [item['song_id'] for item in sorted(order, key=lambda item: int(item['position']))]
+        order = [int(song_id) for song_id in order]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "order must be a list of song ids"}), 400
+
+    try:
+        reorder(db.session.connection(), playlist_id, order)
+    except PlaylistChanged as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 409
+
+    db.session.commit()
+    return '', 204
+
+
+@bp.route('/playlist/<int:playlist_id>/move', methods=['POST'])
+@role_required(*LISTENER_ROLES, denied=('', 403))
+def move_in_playlist(playlist_id):
     playlist = Playlist.query.get_or_404(playlist_id)
     if playlist.user_id != session['user_id']:
         return '', 403
 
-    data = request.get_json()
-    order = data['order']
+    data = request.get_json(silent=True) or {}
+    try:
+        song_id = int(data['song_id'])
+        after = data.get('after')
+        after = int(after) if after is not None else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "song_id is required and after must be a song id or null"}), 400
 
-    for item in order:
-        ps = PlaylistSong.query.filter_by(playlist_id=playlist_id, song_id=item['song_id']).first()
-        if ps:
-            ps.position = item['position']
+    # One drag rewrites one row; positions are renumbered only when a gap runs out
+    try:
+        position = move_song(db.session.connection(), playlist_id, song_id, after)
+    except PlaylistChanged as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 409
 
     db.session.commit()
-    return '', 204
+    return jsonify({"song_id": song_id, "position": position})
 
 
 # ================= PROFILE ROUTES =================
-@app.route("/profile")
+@bp.route("/profile")
+@role_required(*ALL_ROLES, load_user=True)
 def profile():
-    roles = session.get('roles', [])
-    if 'ADMIN' not in roles and 'USER' not in roles and 'CREATOR' not in roles:
-        return redirect(url_for("login"))
-
-    user = User.query.get(session["user_id"])
-    if not user:
-        session.clear()
-        flash("Session expired. Please log in again.", "error")
-        return redirect(url_for("login"))
+    return render_template("profile.html", user=current_user())
 
-    return render_template("profile.html", user=user)
 
-
-@app.route("/profile/edit", methods=["GET", "POST"])
+@bp.route("/profile/edit", methods=["GET", "POST"])
+@role_required(*ALL_ROLES, load_user=True)
 def edit_profile():
-    roles = session.get('roles', [])
-    if 'ADMIN' not in roles and 'USER' not in roles and 'CREATOR' not in roles:
-        return redirect(url_for("login"))
-
-    user = User.query.get(session["user_id"])
+    user = current_user()
 
     if request.method == "POST":
         username = request.form["username"].strip()
@@ -582,131 +782,309 @@ def edit_profile():
             else:
                 user.username = username
                 session["username"] = username
+                # Usernames are shown as the artist of a creator's songs
+                bump_version("catalog")
                 db.session.commit()
                 flash("Profile updated successfully!", "success")
 
-        return redirect(url_for("profile"))
+        return redirect(url_for("tunex.profile"))
 
     return render_template("edit_profile.html", user=user)
 
 
-@app.route("/profile/change-password", methods=["GET", "POST"])
+@bp.route("/profile/change-password", methods=["GET", "POST"])
+@role_required(*ALL_ROLES, load_user=True)
 def change_password():
-    roles = session.get('roles', [])
-    if 'ADMIN' not in roles and 'USER' not in roles and 'CREATOR' not in roles:
-        return redirect(url_for("login"))
-
-    user = User.query.get(session["user_id"])
+    user = current_user()
 
     if request.method == "POST":
         current = request.form["current_password"]
         new = request.form["new_password"]
         confirm = request.form["confirm_password"]
 
-        if not check_password_hash(user.password_hash, current):
-            flash("Current password is incorrect", "error")
-        elif new != confirm:
-            flash("New passwords do not match", "error")
-        elif len(new) < 6:
-            flash("New password must be at least 6 characters", "error")
-        else:
-            user.password_hash = generate_password_hash(new)
-            db.session.commit()
-            flash("Password changed successfully!", "success")
-            return redirect(url_for("profile"))
+        try:
+            if not passwords.verify(user.password_hash, current):
+                flash("Current password is incorrect", "error")
+            elif new != confirm:
+                flash("New passwords do not match", "error")
+            elif len(new) < 6:
+                flash("New password must be at least 6 characters", "error")
+            else:
+                user.password_hash = passwords.hash(new)
+                db.session.commit()
+                flash("Password changed successfully!", "success")
+                return redirect(url_for("tunex.profile"))
+        except PasswordsBusy:
+            flash("Server busy, please try again in a moment", "error")
 
     return render_template("change_password.html", user=user)
 
 
-# ================= GEMINI LYRICS TRANSCRIPTION =================
-@app.route('/api/song/<int:song_id>/lyrics')
-def get_lyrics(song_id):
-    song = Song.query.get_or_404(song_id)
+# ================= NOTIFICATIONS =================
+@bp.route("/api/notifications")
+@role_required(*ALL_ROLES, denied=({"error": "Login required"}, 401))
+def api_notifications():
+    try:
+        notifications, next_cursor = inbox_page(
+            session["user_id"],
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit"),
+            unread_only=request.args.get("unread") == "1"
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Return cached lyrics if available
-    if song.lyrics:
-        return jsonify({"lyrics": song.lyrics})
+    return jsonify({
+        "notifications": [serialize_notification(n) for n in notifications],
+        "next_cursor": next_cursor,
+        "unread": unread_count(session["user_id"])
+    })
 
-    try:
-        uploaded_file = genai.upload_file(path=song.file_path)
 
-        response = model.generate_content([
-            uploaded_file,
-            "Transcribe only the sung lyrics from this audio. "
-            "Return clean lyrics with proper line breaks (\\n). "
-            "Do not add timestamps, explanations, or extra text."
-        ])
+@bp.route("/api/notifications/unread-count")
+@role_required(*ALL_ROLES, denied=({"error": "Login required"}, 401))
+def api_unread_notifications():
+    return jsonify({"unread": unread_count(session["user_id"])})
 
-        lyrics = response.text.strip()
 
-        # Clean common Gemini artifacts
-        if lyrics.startswith("```"):
-            lyrics = lyrics.split("```", 1)[1].rsplit("```", 1)[0].strip()
+@bp.route("/api/notifications/read", methods=["POST"])
+@role_required(*ALL_ROLES, denied=({"error": "Login required"}, 401))
+def api_mark_notifications_read():
+    # {"ids": [...]} marks those notifications; an empty body marks everything
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if ids is not None and not all(isinstance(i, int) for i in ids):
+        return jsonify({"error": "ids must be integers"}), 400
 
-        if not lyrics or lyrics.lower() in ["no lyrics", "instrumental", ""]:
-            lyrics = "♪ Instrumental ♪\n(No lyrics detected)"
+    return jsonify({"unread": mark_read(session["user_id"], ids)})
 
-        song.lyrics = lyrics
-        db.session.commit()
 
-        genai.delete_file(uploaded_file.name)
+@bp.route("/api/events")
+@role_required(*ALL_ROLES, denied=({"error": "Login required"}, 401))
+def event_stream():
+    # Notifications and play-count deltas pushed as server-sent events
+    subscription = event_hub.subscribe(
+        user_channels(session["user_id"], session.get("roles", [])),
+        request.headers.get("Last-Event-ID", type=int)
+    )
+    response = Response(event_hub.stream(subscription), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 
-        return jsonify({"lyrics": lyrics})
+@bp.route("/admin/broadcast", methods=["POST"])
+@role_required("ADMIN", denied=({"error": "Admin access required"}, 403))
+def admin_broadcast():
+    data = request.get_json(silent=True) or request.form
+    message = (data.get("message") or "").strip()
+    role = data.get("role") or None
+    if not message:
+        return jsonify({"error": "Missing message"}), 400
+    if role and role not in ("ADMIN", "CREATOR", "USER"):
+        return jsonify({"error": "Invalid role"}), 400
 
-    except Exception as e:
-        print(f"Gemini Error: {e}")
-        return jsonify({"lyrics": "Unable to transcribe lyrics at this time."}), 500
+    return jsonify({"sent": broadcast(message, role)})
+
+
+# ================= GEMINI LYRICS TRANSCRIPTION =================
+@bp.route('/api/song/<int:song_id>/lyrics')
+@cached_json("lyrics")
+def get_lyrics(song_id):
+    song = db.session.query(Song.song_id, Song.lyrics).filter_by(song_id=song_id).first()
+    if not song:
+        return jsonify({"error": "Song not found"}), 404
+
+    # Return cached lyrics if available
+    if song.lyrics:
+        return jsonify({"lyrics": song.lyrics})
+
+    # Transcription runs in the background; concurrent requests share one job
+    job = lyrics_queue.enqueue(song_id)
+
+    wait = min(request.args.get("wait", 0, type=float), current_app.config["LYRICS_MAX_WAIT"])
+    if wait > 0 and job.status != "failed":
+        lyrics = lyrics_queue.wait(song_id, wait)
+        if lyrics:
+            return jsonify({"lyrics": lyrics})
+        job = db.session.get(LyricsJob, song_id)
+        if not job:
+            return jsonify({"error": "Song not found"}), 404
+
+    if job.status == "failed":
+        return jsonify({"lyrics": "Unable to transcribe lyrics at this time.", "status": "failed"}), 500
+
+    return jsonify({"status": job.status, "attempts": job.attempts}), 202
+
+
+# ================= WAVEFORMS =================
+@bp.route('/api/song/<int:song_id>/peaks')
+def get_peaks(song_id):
+    waveform = db.session.get(SongWaveform, song_id)
+    if waveform is None:
+        if not song_exists(song_id):
+            return jsonify({"error": "Song not found"}), 404
+        queue_waveform(song_id)
+        return jsonify({"status": "pending"}), 202
+    if waveform.status != "ready":
+        return jsonify({"error": "Waveform unavailable", "detail": waveform.error}), 404
+
+    # Interleaved int8 (min, max) pairs, one per bucket across the song
+    response = Response(waveform.peaks, mimetype="application/octet-stream")
+    response.headers["X-Waveform-Buckets"] = str(waveform.buckets)
+    response.set_etag(f"{song_id}-{waveform.created_at.timestamp():.0f}")
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["WAVEFORM_MAX_AGE"]
+    return response.make_conditional(request)
+
+
+# ================= RECOMMENDATIONS =================
+@bp.route('/api/song/<int:song_id>/similar')
+def get_similar_songs(song_id):
+    if not song_exists(song_id):
+        return jsonify({"error": "Song not found"}), 404
+
+    limit = max(1, min(request.args.get("limit", 10, type=int), current_app.config["RECOMMEND_TOP_K"]))
+    return jsonify({"songs": [serialize_song(song) for song in similar_songs(song_id, limit)]})
+
+
+@bp.route('/api/recommendations')
+@role_required(*LISTENER_ROLES, denied=({"error": "Unauthorized"}, 403))
+def get_recommendations():
+    limit = page_size(request.args.get("limit"))
+    songs = recommended_for(session["user_id"], limit)
+    source = "playlists"
+    if not songs:
+        # Nothing to go on yet (no playlists, or the table is not built): fall back to the charts
+        songs, _ = song_page(sort="popular", limit=limit)
+        source = "popular"
+    return jsonify({"source": source, "songs": [serialize_song(song) for song in songs]})
+
+
+# ================= CHARTS =================
+# Read from the materialized chart_entries table, which the rollup compactor keeps current
+@bp.route('/api/charts/<chart>')
+@bp.route('/api/charts/<chart>/<any(genre, creator):scope>/<int:scope_id>')
+def get_chart(chart, scope="global", scope_id=0):
+    if chart not in CHARTS:
+        return jsonify({"error": "Unknown chart"}), 404
+
+    size = current_app.config["CHART_SIZE"]
+    limit = max(1, min(request.args.get("limit", size, type=int), size))
+    return jsonify({
+        "chart": chart,
+        "scope": scope,
+        "scope_id": scope_id,
+        "songs": cached_chart(chart, scope, scope_id, limit)
+    })
+
+
+# ================= METRICS =================
+@bp.route('/metrics')
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    authorized = token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if not (authorized or has_role("ADMIN")):
+        return jsonify({"error": "Unauthorized"}), 403
+    if not instrumentation.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(instrumentation.render(), mimetype="text/plain; version=0.0.4")
+
+
+# ================= AUDIO STREAMING =================
+@bp.route("/stream/<int:song_id>")
+def stream_song(song_id):
+    song = db.session.query(Song.file_path, Song.content_hash, Song.bitrate).filter_by(song_id=song_id).first()
+    if not song:
+        return '', 404
+
+    # ?quality= or the Save-Data / ECT / Downlink client hints pick a rendition
+    quality = requested_quality(request.args, request.headers)
+    renditions = AudioRendition.query.filter_by(content_hash=song.content_hash).all() if song.content_hash else []
+    rendition = pick_rendition(renditions, quality, song.bitrate // 1000 if song.bitrate else None)
+    if rendition:
+        path = os.path.join(current_app.root_path, rendition.file_path)
+        if not os.path.isfile(path):
+            # A rendition whose file went missing is skipped, not a 404
+            rendition = None
+    if rendition is None:
+        path = os.path.join(current_app.root_path, song.file_path.replace("\\", "/"))
+    if not os.path.isfile(path):
+        return '', 404
+
+    response = stream_file(path, os.path.relpath(path, current_app.static_folder).replace(os.sep, "/"))
+    response.headers["X-Rendition"] = rendition.quality if rendition else "original"
+    response.headers["Accept-CH"] = "Save-Data, ECT, Downlink"
+    if "quality" not in request.args:
+        response.vary.update(("Save-Data", "ECT", "Downlink"))
+    return response
 
 
 # ================= PLAY COUNT API =================
-@app.route('/api/song/<int:song_id>/play', methods=['POST'])
+@bp.route('/api/song/<int:song_id>/play', methods=['POST'])
 def increment_play(song_id):
-    song = Song.query.get_or_404(song_id)
+    # Both checks are answered from per-process caches on the hot path
+    if not song_exists(song_id):
+        return '', 404
 
     if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        if user.is_blocked:
+        if is_blocked():
             return '', 403
 
-        if 'USER' in session.get('roles', []) or 'CREATOR' in session.get('roles', []):
-            song.play_count += 1
-            db.session.commit()
+        if has_role(*LISTENER_ROLES):
+            # Buffered and written behind as one UPDATE per song per flush
+            play_buffer.record(song_id, session['user_id'])
 
     return '', 204
 
 
-@app.route('/api/songs')
+@bp.route('/api/play-buffer')
+@role_required("ADMIN", denied=({"error": "Admin access required"}, 403))
+def api_play_buffer():
+    return jsonify(play_buffer.stats())
+
+
+@bp.route('/api/songs')
+@cached_json("catalog", "plays")
 def api_get_songs():
-    # Get all songs with creator and genre info
-    songs = Song.query.options(
-        joinedload(Song.creator),
-        joinedload(Song.genre)
-    ).all()
-
-    song_list = []
-    for song in songs:
-        song_list.append({
-            "song_id": song.song_id,
-            "title": song.title,
-            "artist": song.creator.username if song.creator else "Unknown",
-            "genre": song.genre.genre_name if song.genre else "Unknown",
-            "duration": song.duration,
-            "play_count": song.play_count,
-            "file_path": url_for('static', filename=song.file_path.replace('static/', ''), _external=False)
-        })
+    # Keyset-paginated catalog: pass back "next_cursor" to get the following page
+    try:
+        songs, next_cursor = song_page(
+            sort=request.args.get("sort", "id"),
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     return jsonify({
-        "songs": song_list,
-        "total": len(song_list)
+        "songs": [serialize_song(song) for song in songs],
+        "next_cursor": next_cursor
     })
 
 
-@app.route('/api/users')
-def api_get_users():
-    if 'ADMIN' not in session.get('roles', []):
-        return jsonify({"error": "Admin access required"}), 403
+@bp.route('/api/search')
+def api_search_songs():
+    # Ranked, prefix-matching search over titles, artists, genres and lyrics
+    try:
+        songs, next_cursor = search_songs(
+            request.args.get("q", ""),
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "songs": [serialize_song(song) for song in songs],
+        "next_cursor": next_cursor
+    })
+
 
-    users = User.query.all()
+@bp.route('/api/users')
+@role_required("ADMIN", denied=({"error": "Admin access required"}, 403))
+def api_get_users():
+    users = User.query.options(selectinload(User.roles)).all()
 
     user_list = []
     for user in users:
@@ -725,4 +1103,7 @@ def api_get_users():
 
 # ================= RUN =================
 if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(debug=True)
\ No newline at end of file
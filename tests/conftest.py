@@ -0,0 +1,83 @@
+import io
+import math
+import os
+import struct
+import sys
+import wave
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from controller.config import Config  # noqa: E402
+from controller.database import db  # noqa: E402
+from controller.models import Artist, Genre, Playlist, PlaylistSong, Role, Song, User  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SECRET_KEY = "test"
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'tunex.sqlite3'}"
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        UPLOAD_TEMP_FOLDER = str(tmp_path / "upload_tmp")
+        PLAY_JOURNAL_DIR = str(tmp_path / "play_journal")
+        LYRICS_TRANSCRIBER = "stub"
+        # No background threads: only the requests' own statements run
+        ROLLUP_INTERVAL = 0
+        RECOMMEND_INTERVAL = 0
+        # Uploads' metadata, waveform and transcode jobs run inline
+        BACKGROUND_WORKERS = 0
+        TRANSCODE_WORKERS = 0
+        PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+
+    app = main.create_app(TestConfig)
+    with app.app_context():
+        main.init_db()
+        seed_catalog()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def wav_bytes():
+    """A one-second 440 Hz mono WAV."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(8000)
+        audio.writeframes(b"".join(struct.pack("<h", int(12000 * math.sin(2 * math.pi * 440 * i / 8000)))
+                                   for i in range(8000)))
+    return buffer.getvalue()
+
+
+def seed_catalog():
+    """A creator, a listener, songs in every genre with an artist, and a playlist."""
+    roles = {role.role_name: role for role in Role.query.all()}
+    creator = User(username="creator", email="creator@example.com", password_hash="x")
+    creator.roles.extend([roles["CREATOR"], roles["USER"]])
+    listener = User(username="listener", email="listener@example.com", password_hash="x")
+    listener.roles.append(roles["USER"])
+    db.session.add_all([creator, listener])
+    db.session.flush()
+
+    songs = [
+        Song(title=f"Love song {i}", file_path=f"static/uploads/{i}.mp3", play_count=i,
+             creator_id=creator.user_id, genre_id=genre.genre_id)
+        for i, genre in enumerate(Genre.query.order_by(Genre.genre_id).all() * 5)
+    ]
+    artist = Artist(artist_name="Band")
+    for song in songs:
+        song.artists.append(artist)
+    db.session.add_all(songs)
+    playlist = Playlist(playlist_name="Mix", user_id=listener.user_id)
+    db.session.add(playlist)
+    db.session.flush()
+    db.session.add_all([
+        PlaylistSong(playlist_id=playlist.playlist_id, song_id=song.song_id, position=i * 1024)
+        for i, song in enumerate(songs[:5])
+    ])
+    db.session.commit()
@@ -0,0 +1,45 @@
+from controller.analytics import run_compaction
+from controller.database import db
+from controller.models import (
+    ChartEntry, PlayEvent, Song, SongListener, SongPlayRollup, SongSimilarity, User
+)
+
+
+def test_deleted_song_leaves_no_history_for_its_id(app):
+    with app.app_context():
+        creator = User.query.filter_by(username="creator").one()
+        listener = User.query.filter_by(username="listener").one()
+        song_id, other_id = [song.song_id for song in Song.query.order_by(Song.song_id.desc()).limit(2)]
+        db.session.add_all([PlayEvent(song_id=song_id, user_id=listener.user_id) for _ in range(3)])
+        db.session.add_all([
+            SongSimilarity(song_id=song_id, similar_song_id=other_id, score=1.0, rank=0),
+            SongSimilarity(song_id=other_id, similar_song_id=song_id, score=1.0, rank=0),
+        ])
+        db.session.commit()
+        creator_id = creator.user_id
+    run_compaction(app)
+    with app.app_context():
+        for table in (SongPlayRollup, SongListener, ChartEntry):
+            assert table.query.filter_by(song_id=song_id).count()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"], session["roles"] = creator_id, ["CREATOR"]
+    assert client.post(f"/creator/delete/{song_id}").status_code == 302
+
+    with app.app_context():
+        for table in (SongPlayRollup, SongListener, ChartEntry):
+            assert not table.query.filter_by(song_id=song_id).count()
+        assert not SongSimilarity.query.filter(
+            (SongSimilarity.song_id == song_id) | (SongSimilarity.similar_song_id == song_id)
+        ).count()
+        # The charts were re-ranked without the song rather than left with a gap
+        ranks = [rank for rank, in db.session.query(ChartEntry.rank)
+                 .filter_by(chart="top", scope="global", scope_id=0).order_by(ChartEntry.rank)]
+        assert ranks == list(range(len(ranks)))
+
+        song = Song(title="New upload", file_path="static/uploads/new.mp3",
+                    creator_id=creator_id, genre_id=1)
+        db.session.add(song)
+        db.session.commit()
+        assert song.song_id > song_id
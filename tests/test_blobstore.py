@@ -0,0 +1,39 @@
+import io
+import os
+
+from controller.models import AudioBlob, Song, User
+
+
+def upload(client, data):
+    return client.post("/creator/upload", data={
+        "title": "Same bytes", "genre_id": "1", "song": (io.BytesIO(data), "take.wav")
+    })
+
+
+def test_identical_uploads_share_one_counted_blob(app, wav_bytes):
+    client = app.test_client()
+    with app.app_context():
+        creator_id = User.query.filter_by(username="creator").one().user_id
+    with client.session_transaction() as session:
+        session["user_id"], session["roles"] = creator_id, ["CREATOR"]
+
+    data = wav_bytes
+    assert upload(client, data).status_code == 302
+    assert upload(client, data).status_code == 302
+    with app.app_context():
+        songs = Song.query.filter_by(title="Same bytes").all()
+        blob = AudioBlob.query.one()
+        assert blob.ref_count == 2
+        assert {song.file_path for song in songs} == {blob.file_path}
+        song_ids, path = [song.song_id for song in songs], blob.file_path
+    assert os.path.exists(path)
+
+    assert client.post(f"/creator/delete/{song_ids[0]}").status_code == 302
+    with app.app_context():
+        assert AudioBlob.query.one().ref_count == 1
+    assert os.path.exists(path)
+
+    assert client.post(f"/creator/delete/{song_ids[1]}").status_code == 302
+    with app.app_context():
+        assert AudioBlob.query.count() == 0
+    assert not os.path.exists(path)
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from controller import events
+from controller.database import db
+from controller.events import event_hub, user_channels
+from controller.models import StreamEvent, User
+from controller.notifications import broadcast, notify
+
+
+@pytest.fixture
+def hub(app):
+    # Drive the hub by hand instead of from its polling thread
+    event_hub.pid, event_hub.subscriptions = os.getpid(), set()
+    yield event_hub
+    event_hub.pid, event_hub.subscriptions = None, set()
+
+
+def publish_inbox(app, messages):
+    """Notify the listener of each message, broadcasting the ones starting with "all:"."""
+    with app.app_context():
+        listener = User.query.filter_by(username="listener").one().user_id
+        for message in messages:
+            if message.startswith("all:"):
+                broadcast(message)
+            else:
+                notify(listener, message)
+                db.session.commit()
+        ids = [event_id for event_id, in db.session.query(StreamEvent.id).order_by(StreamEvent.id)]
+    return listener, ids
+
+
+def received(stream):
+    lines = []
+    for chunk in stream:
+        if chunk.startswith("id: "):
+            lines.append(chunk)
+    return lines
+
+
+def test_reconnect_resumes_after_last_event_id(app, hub):
+    listener, ids = publish_inbox(app, ["one", "all:two", "three"])
+    hub.last_id = ids[-1]
+
+    subscription = hub.subscribe(user_channels(listener, ["USER"]), last_event_id=ids[0])
+    stream = hub.stream(subscription)
+    assert next(stream).startswith("retry:")
+    broadcast_event, direct_event = next(stream), next(stream)
+    stream.close()
+
+    assert broadcast_event.startswith(f"id: {ids[1]}\nevent: notification\n") and "all:two" in broadcast_event
+    assert direct_event.startswith(f"id: {ids[2]}\n")
+
+
+def test_events_the_client_has_seen_are_not_sent_again(app, hub):
+    listener, ids = publish_inbox(app, ["one", "two"])
+    # This worker's hub is behind the worker the client was connected to
+    hub.last_id = ids[0]
+    subscription = hub.subscribe(user_channels(listener, ["USER"]), last_event_id=ids[1])
+    with app.app_context():
+        hub.poll()
+    assert subscription.queue.empty()
+    hub.unsubscribe(subscription)
+
+
+def test_overflowing_stream_ends_and_resumes(app, hub, monkeypatch):
+    monkeypatch.setattr(events, "MAX_QUEUED_EVENTS", 2)
+    listener, ids = publish_inbox(app, ["one", "two", "all:three"])
+    hub.last_id = ids[-1]
+
+    # Only two events fit, so the stream ends after them and the client reconnects
+    first = received(hub.stream(hub.subscribe(user_channels(listener, ["USER"]), last_event_id=0)))
+    assert [line.split("\n")[0] for line in first] == [f"id: {ids[0]}", f"id: {ids[1]}"]
+
+    subscription = hub.subscribe(user_channels(listener, ["USER"]), last_event_id=ids[1])
+    stream = hub.stream(subscription)
+    next(stream)
+    assert next(stream).startswith(f"id: {ids[2]}\n")
+    stream.close()
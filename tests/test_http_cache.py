@@ -0,0 +1,46 @@
+import gzip
+import json
+
+import main
+from controller.models import Song, User
+
+
+def test_unchanged_catalog_is_not_modified(app, monkeypatch):
+    client = app.test_client()
+    response = client.get("/api/songs?limit=5")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # A matching If-None-Match is answered before the view queries anything
+    calls = []
+    monkeypatch.setattr(main, "song_page",
+                        lambda *args, song_page=main.song_page, **kwargs: calls.append(1) or song_page(*args, **kwargs))
+    response = client.get("/api/songs?limit=5", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["ETag"] == etag
+    assert not calls
+
+    # Other query strings and encodings are different representations
+    assert client.get("/api/songs?limit=5&sort=id", headers={"If-None-Match": etag}).status_code == 200
+    assert calls
+    gzipped = client.get("/api/songs?limit=5", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert gzipped.status_code == 200 and gzipped.headers["ETag"] != etag
+    assert json.loads(gzip.decompress(gzipped.data)) == client.get("/api/songs?limit=5").get_json()
+
+
+def test_edit_changes_the_etag_and_the_body(app):
+    client = app.test_client()
+    with app.app_context():
+        creator_id = User.query.filter_by(username="creator").one().user_id
+        song_id = Song.query.order_by(Song.song_id).first().song_id
+
+    response = client.get("/api/songs?limit=1")
+    etag = response.headers["ETag"]
+    assert response.get_json()["songs"][0]["title"] == "Love song 0"
+
+    with client.session_transaction() as session:
+        session["user_id"], session["roles"] = creator_id, ["CREATOR"]
+    assert client.post(f"/creator/edit/{song_id}", data={"title": "Renamed"}).status_code == 302
+
+    response = client.get("/api/songs?limit=1", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert response.get_json()["songs"][0]["title"] == "Renamed"
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import select
+
+from controller.database import db
+from controller.models import Song, User
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(app):
+    # The collector is a module singleton shared by every test app
+    instrumentation = app.extensions["instrumentation"]
+    for metric in (instrumentation.latency, instrumentation.requests, instrumentation.statements,
+                   instrumentation.sql_time, instrumentation.repeated):
+        metric.series.clear()
+
+
+def admin_client(app):
+    client = app.test_client()
+    with app.app_context():
+        user_id = User.query.filter_by(email="admin@tunex.com").one().user_id
+    with client.session_transaction() as session:
+        session["user_id"], session["roles"] = user_id, ["ADMIN"]
+    return client
+
+
+def test_metrics_exposition_counts_requests_per_worker(app):
+    client = admin_client(app)
+    client.get("/api/songs")
+    body = client.get("/metrics").get_data(as_text=True)
+
+    worker = f'worker="{os.getpid()}"'
+    assert "# TYPE tunex_requests_total counter" in body
+    assert f'tunex_requests_total{{endpoint="tunex.api_get_songs",method="GET",status="200",{worker}}} 1' in body
+    assert f'tunex_request_duration_seconds_bucket{{endpoint="tunex.api_get_songs",method="GET",{worker},le="+Inf"}} 1' \
+        in body
+
+
+def test_repeated_select_is_reported(app, capsys):
+    def n_plus_one():
+        for song_id in range(1, app.config["N_PLUS_ONE_THRESHOLD"] + 1):
+            db.session.execute(select(Song.title).where(Song.song_id == song_id)).scalar()
+        return "ok"
+
+    app.add_url_rule("/test/n-plus-one", "n_plus_one", n_plus_one)
+    client = admin_client(app)
+    client.get("/test/n-plus-one")
+
+    assert "Possible N+1 in n_plus_one" in capsys.readouterr().out
+    assert 'tunex_repeated_statement_requests_total{endpoint="n_plus_one"' in client.get("/metrics").get_data(True)
+
+
+def test_failed_requests_are_recorded_and_stop_the_profiler(app):
+    def broken():
+        raise RuntimeError("boom")
+
+    app.add_url_rule("/test/broken", "broken", broken)
+    app.testing = True  # the exception propagates instead of becoming a 500 response
+    instrumentation = app.extensions["instrumentation"]
+    instrumentation.profile_rate, instrumentation.profile_slow = 1.0, float("inf")
+
+    with pytest.raises(RuntimeError):
+        app.test_client().get("/test/broken")
+
+    assert sys.getprofile() is None
+    assert instrumentation.requests.series[("broken", "GET", 500)] == 1
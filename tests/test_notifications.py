@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from controller.database import db
+from controller.models import Notification, NotificationCounter, User
+from controller.notifications import (
+    broadcast, create_missing_counters, mark_read, notify, unread_count
+)
+
+
+def user_id(name):
+    return User.query.filter_by(username=name).one().user_id
+
+
+def test_unread_count_never_commits_the_request(app):
+    with app.app_context():
+        listener = db.session.get(User, user_id("listener"))
+        listener.username = "half-edited"
+        assert unread_count(listener.user_id) == 0
+        db.session.rollback()
+        assert db.session.get(User, listener.user_id).username == "listener"
+        assert db.session.get(NotificationCounter, listener.user_id) is None
+
+
+def test_counters_follow_notify_broadcast_and_mark_read(app):
+    with app.app_context():
+        listener = user_id("listener")
+        notify(listener, "Hello")
+        db.session.commit()
+        broadcast("Maintenance tonight")
+        assert unread_count(listener) == 2
+
+        first = Notification.query.filter_by(user_id=listener).order_by(Notification.id).first()
+        assert mark_read(listener, [first.id]) == 1
+        assert mark_read(listener) == 0
+
+
+def test_db_init_counts_inboxes_that_predate_the_counters(app):
+    with app.app_context():
+        listener, creator = user_id("listener"), user_id("creator")
+        db.session.add_all([
+            Notification(user_id=listener, message="old", timestamp=datetime.utcnow()),
+            Notification(user_id=listener, message="old, read", timestamp=datetime.utcnow(),
+                         read_at=datetime.utcnow()),
+        ])
+        db.session.commit()
+        notify(creator, "counted already")
+        db.session.commit()
+
+        create_missing_counters()
+        assert unread_count(listener) == 1
+        assert unread_count(creator) == 1
+        assert db.session.get(NotificationCounter, user_id("creator")).unread == 1
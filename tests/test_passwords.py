@@ -0,0 +1,25 @@
+from werkzeug.security import generate_password_hash
+
+from controller.database import db
+from controller.models import User
+
+
+def test_login_rehashes_with_current_cost(app):
+    with app.app_context():
+        listener = User.query.filter_by(username="listener").one()
+        listener.password_hash = generate_password_hash("secret", "pbkdf2:sha256:500")
+        db.session.commit()
+
+    client = app.test_client()
+    response = client.post("/login", data={"email": "listener@example.com", "password": "secret"})
+    assert response.status_code == 302 and response.location.endswith("/dashboard/user")
+
+    with app.app_context():
+        password_hash = User.query.filter_by(username="listener").one().password_hash
+    assert password_hash.startswith("pbkdf2:sha256:1000$")
+
+    # The upgraded hash still logs in, and is left alone from now on
+    client = app.test_client()
+    client.post("/login", data={"email": "listener@example.com", "password": "secret"})
+    with app.app_context():
+        assert User.query.filter_by(username="listener").one().password_hash == password_hash
@@ -0,0 +1,55 @@
+import fcntl
+import os
+import time
+
+from controller.models import PlayEvent, Song
+from controller.play_buffer import play_buffer
+
+
+def write_journal(app, name, song_id, plays):
+    os.makedirs(app.config["PLAY_JOURNAL_DIR"], exist_ok=True)
+    path = os.path.join(app.config["PLAY_JOURNAL_DIR"], name)
+    with open(path, "w") as journal:
+        journal.writelines(f"{song_id} - {time.time():.3f}\n" for _ in range(plays))
+    return path
+
+
+def test_journal_left_under_our_own_pid_is_replayed(app):
+    # A restarted container can hand the dead worker's pid to the new one
+    with app.app_context():
+        song = Song.query.order_by(Song.song_id).first()
+        song_id, before = song.song_id, song.play_count
+    path = write_journal(app, f"{os.getpid()}.1.log", song_id, 3)
+
+    assert play_buffer.replay_journals() == 3
+    assert not os.path.exists(path)
+    with app.app_context():
+        assert Song.query.get(song_id).play_count == before + 3
+        assert PlayEvent.query.filter_by(song_id=song_id).count() == 3
+
+
+def test_locked_journal_is_left_to_its_owner(app):
+    with app.app_context():
+        song_id = Song.query.order_by(Song.song_id).first().song_id
+    path = write_journal(app, "1.owner.log", song_id, 2)
+
+    with open(path) as owner:
+        fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert play_buffer.replay_journals() == 0
+    assert os.path.exists(path)
+
+
+def test_new_journals_never_reuse_a_name(app):
+    os.makedirs(app.config["PLAY_JOURNAL_DIR"], exist_ok=True)
+    play_buffer.pid = os.getpid()
+    first, second = play_buffer._open_journal(), play_buffer._open_journal()
+    try:
+        names = sorted(os.listdir(app.config["PLAY_JOURNAL_DIR"]))
+        assert len(names) == 2 and all(name.endswith(".log") for name in names)
+        # Both are held, so neither is replayed
+        assert play_buffer.replay_journals() == 0
+    finally:
+        play_buffer._discard(first)
+        play_buffer._discard(second)
+        play_buffer.pid = None
+    assert os.listdir(app.config["PLAY_JOURNAL_DIR"]) == []
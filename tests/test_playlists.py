@@ -0,0 +1,96 @@
+from controller import playlists
+from controller.models import Playlist, PlaylistSong, Song, User
+
+
+def login(app, username):
+    client = app.test_client()
+    with app.app_context():
+        user_id = User.query.filter_by(username=username).one().user_id
+    with client.session_transaction() as session:
+        session["user_id"], session["username"], session["roles"] = user_id, username, ["USER"]
+    return client
+
+
+def test_import_reports_malformed_entries_as_unresolved(app):
+    client = login(app, "listener")
+    with app.app_context():
+        song_id = Song.query.filter_by(title="Love song 3").one().song_id
+    entries = [
+        {"song_id": "abc"}, {"song_id": [1]}, {"song_id": 10 ** 30},
+        {"title": 5}, {"title": "Love song 2", "artist": 7}, {"song_id": str(song_id)},
+        "Love song 1", None,
+    ]
+    response = client.post("/playlist/import", json={"name": "Imported", "songs": entries})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["added"] == 2
+    assert body["unresolved_count"] == 6
+    assert body["unresolved"][-2:] == ["Love song 1", None]
+    with app.app_context():
+        added = PlaylistSong.query.filter_by(playlist_id=body["playlist_id"]).count()
+    assert added == 2
+
+
+def test_playlist_page_requires_a_listener_who_owns_it(app):
+    with app.app_context():
+        playlist_id = Playlist.query.filter_by(playlist_name="Mix").one().playlist_id
+
+    anonymous = app.test_client().get(f"/playlist/{playlist_id}")
+    assert anonymous.status_code == 302 and anonymous.location.endswith("/login")
+    assert login(app, "creator").get(f"/playlist/{playlist_id}").status_code == 403
+    assert login(app, "listener").get(f"/playlist/{playlist_id}").status_code == 200
+
+
+def playlist_order(app, playlist_id):
+    with app.app_context():
+        rows = (PlaylistSong.query.filter_by(playlist_id=playlist_id)
+                .order_by(PlaylistSong.position, PlaylistSong.id).all())
+        return [row.song_id for row in rows], [row.position for row in rows]
+
+
+def test_moves_keep_order_and_rebalance_when_gaps_run_out(app, monkeypatch):
+    rebalanced = []
+    monkeypatch.setattr(playlists, "rebalance",
+                        lambda *args, rebalance=playlists.rebalance: rebalanced.append(rebalance(*args)))
+    client = login(app, "listener")
+    with app.app_context():
+        playlist_id = Playlist.query.filter_by(playlist_name="Mix").one().playlist_id
+    expected, _ = playlist_order(app, playlist_id)
+
+    # Dropping songs right after the first one halves the gap every time,
+    # until the playlist has to be renumbered
+    for i in range(30):
+        song_id = expected[-1 - i % 3]
+        response = client.post(f"/playlist/{playlist_id}/move", json={"song_id": song_id, "after": expected[0]})
+        assert response.status_code == 200
+        expected.remove(song_id)
+        expected.insert(1, song_id)
+
+        order, positions = playlist_order(app, playlist_id)
+        assert order == expected
+        assert len(set(positions)) == len(positions)
+    assert rebalanced
+
+    response = client.post(f"/playlist/{playlist_id}/move", json={"song_id": expected[2], "after": None})
+    assert response.status_code == 200
+    assert playlist_order(app, playlist_id)[0][0] == expected[2]
+
+
+def test_reorder_applies_a_full_order_and_rejects_a_partial_one(app):
+    client = login(app, "listener")
+    with app.app_context():
+        playlist_id = Playlist.query.filter_by(playlist_name="Mix").one().playlist_id
+    original, _ = playlist_order(app, playlist_id)
+
+    reversed_order = original[::-1]
+    assert client.post(f"/playlist/reorder/{playlist_id}", json={"order": reversed_order}).status_code == 204
+    assert playlist_order(app, playlist_id)[0] == reversed_order
+
+    for partial in (reversed_order[1:], reversed_order + [reversed_order[0]]):
+        response = client.post(f"/playlist/reorder/{playlist_id}", json={"order": partial})
+        assert response.status_code == 409
+        assert playlist_order(app, playlist_id)[0] == reversed_order
+
+    response = client.post(f"/playlist/{playlist_id}/move", json={"song_id": original[0], "after": 10 ** 6})
+    assert response.status_code == 409
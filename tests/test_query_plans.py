@@ -0,0 +1,52 @@
+from sqlalchemy import func, select
+
+from controller.database import db
+from controller.models import Song
+from controller.query_plans import find_full_scans, is_bounded, scanned_tables
+
+TABLES = {"songs", "users", "song_artists"}
+
+
+def test_index_scans_count_as_full_scans():
+    plan = [
+        "SCAN songs USING COVERING INDEX ix_songs_genre_song",
+        "SCAN users_1",
+        "SEARCH song_artists USING COVERING INDEX ix_song_artists_song_artist (song_id=?)",
+        "SCAN anon_1",
+        "SCAN (join-1) LEFT-JOIN",
+    ]
+    assert scanned_tables(plan, TABLES) == ["songs", "users"]
+
+
+def test_limit_only_bounds_an_unfiltered_scan():
+    class Row:
+        def __init__(self, detail):
+            self.detail = detail
+
+    walk = [Row("SCAN songs USING INDEX ix_songs_popular")]
+    assert is_bounded("SELECT * FROM songs ORDER BY play_count DESC LIMIT ?", walk)
+    # Filtering on an unindexed column reads every row when nothing matches
+    assert not is_bounded("SELECT * FROM users\nWHERE users.username = ?\n LIMIT ?", [Row("SCAN users")])
+    assert not is_bounded("SELECT * FROM songs ORDER BY title LIMIT ?",
+                          [Row("SCAN songs"), Row("USE TEMP B-TREE FOR ORDER BY")])
+
+
+def test_window_over_whole_table_is_flagged(app):
+    # The shape of the old per-genre first page: ROW_NUMBER() over every song
+    position = func.row_number().over(partition_by=Song.genre_id, order_by=Song.song_id).label("position")
+    ranked = select(Song.song_id, position).subquery()
+    statement = select(ranked.c.song_id).where(ranked.c.position <= 21)
+    with app.app_context(), db.engine.connect() as connection:
+        compiled = statement.compile(connection)
+        plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + str(compiled), tuple(compiled.params.values())
+        ).all()
+    assert "songs" in scanned_tables([row.detail for row in plan], TABLES)
+
+
+def test_hot_routes_avoid_full_scans(app):
+    problems = find_full_scans(app)
+    assert not problems, "\n".join(
+        f"{problem['url']}: {problem['table']}\n  {problem['statement']}\n  {problem['plan']}"
+        for problem in problems
+    )
@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+
+from controller.recommendations import cooccurrence, similarities
+
+
+def test_cosine_of_a_two_of_three_overlap():
+    # Song 1 is in playlists 10, 11 and 12; song 2 in 10 and 11; song 3 only in 12
+    playlist_ids = np.array([10, 10, 11, 11, 12, 12])
+    song_ids = np.array([1, 2, 1, 2, 1, 3])
+    song_ids_out, similar_ids, scores, ranks = similarities(
+        playlist_ids, song_ids, {1: 1, 2: 2, 3: 3}, top_k=5, max_length=10, genre_boost=0.5
+    )
+    result = {(a, b): (score, rank) for a, b, score, rank in
+              zip(song_ids_out.tolist(), similar_ids.tolist(), scores.tolist(), ranks.tolist())}
+
+    assert math.isclose(result[(1, 2)][0], 2 / math.sqrt(3 * 2))  # 0.816
+    assert math.isclose(result[(1, 3)][0], 1 / math.sqrt(3 * 1))
+    assert math.isclose(result[(2, 1)][0], result[(1, 2)][0])
+    assert result[(1, 2)][1] == 0 and result[(1, 3)][1] == 1
+    assert (2, 3) not in result
+
+
+def test_genre_boost_and_long_playlists():
+    playlist_ids = np.array([1, 1, 2, 2, 2])
+    song_ids = np.array([5, 6, 5, 6, 7])
+    song_ids_out, similar_ids, scores, _ = similarities(
+        playlist_ids, song_ids, {5: 1, 6: 1, 7: 2}, top_k=5, max_length=2, genre_boost=0.1
+    )
+    # Playlist 2 is over max_length, so only playlist 1 counts: 1 / sqrt(1 * 1), boosted for the shared genre
+    assert sorted(zip(song_ids_out.tolist(), similar_ids.tolist())) == [(5, 6), (6, 5)]
+    assert np.allclose(scores, 1.1)
+
+
+def test_chunked_counts_match_a_single_pass():
+    rng = np.random.default_rng(7)
+    lengths = rng.integers(1, 12, size=200)
+    playlist_ids = np.repeat(np.arange(200), lengths)
+    song_index = np.concatenate([rng.choice(40, size=n, replace=False) for n in lengths])
+
+    whole = cooccurrence(playlist_ids, song_index, 40, pair_budget=1 << 30)
+    chunked = cooccurrence(playlist_ids, song_index, 40, pair_budget=50)
+    for a, b in zip(whole, chunked):
+        assert np.array_equal(a, b)
+    # Every ordered pair of every playlist is counted once
+    assert whole[2].sum() == (lengths * (lengths - 1)).sum()
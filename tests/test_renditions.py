@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+from controller.database import db
+from controller.models import AudioRendition, Song, User
+
+
+@pytest.fixture
+def song_id(app, tmp_path, wav_bytes):
+    """An uploaded CD-quality song with a rendition file for every rung of the ladder."""
+    client = app.test_client()
+    with app.app_context():
+        creator_id = User.query.filter_by(username="creator").one().user_id
+    with client.session_transaction() as session:
+        session["user_id"], session["roles"] = creator_id, ["CREATOR"]
+    client.post("/creator/upload", data={
+        "title": "Tone", "genre_id": "1", "song": (io.BytesIO(wav_bytes), "tone.wav")
+    })
+
+    with app.app_context():
+        song = Song.query.filter_by(title="Tone").one()
+        song.bitrate = 1411000
+        for quality, kbps in (("low", 64), ("medium", 128), ("high", 192)):
+            path = tmp_path / f"tone.{quality}.mp3"
+            path.write_bytes(quality.encode())
+            db.session.add(AudioRendition(content_hash=song.content_hash, quality=quality,
+                                          bitrate=kbps, file_path=str(path)))
+        db.session.commit()
+        return song.song_id
+
+
+@pytest.mark.parametrize("query, headers, expected", [
+    ("", {}, "high"),
+    ("", {"Save-Data": "on"}, "low"),
+    ("", {"ECT": "2g"}, "low"),
+    ("", {"ECT": "3g"}, "medium"),
+    ("", {"Downlink": "0.6"}, "medium"),
+    ("", {"Downlink": "0.1"}, "low"),
+    ("?quality=medium", {"Save-Data": "on"}, "medium"),
+    ("?quality=original", {}, "original"),
+])
+def test_rendition_follows_quality_and_client_hints(app, song_id, query, headers, expected):
+    response = app.test_client().get(f"/stream/{song_id}{query}", headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["X-Rendition"] == expected
+    if expected != "original":
+        assert response.data == expected.encode()
+    # Only responses picked by client hints vary on them
+    assert ("Save-Data" in response.vary) == (not query)
+
+
+def test_missing_rendition_file_falls_back_to_original(app, song_id, tmp_path, wav_bytes):
+    (tmp_path / "tone.high.mp3").unlink()
+    response = app.test_client().get(f"/stream/{song_id}")
+    assert response.headers["X-Rendition"] == "original"
+    assert response.data == wav_bytes
@@ -0,0 +1,24 @@
+from controller.database import db
+from controller.models import Artist, Song, User
+from controller.search import search_songs
+
+
+def test_artists_linked_through_relationship_are_indexed(app):
+    with app.app_context():
+        songs, _ = search_songs("band", limit=100)
+        assert len(songs) == Song.query.count()
+
+        song = Song.query.order_by(Song.song_id).first()
+        song.artists.append(Artist(artist_name="Soloist"))
+        db.session.commit()
+        assert [found.song_id for found in search_songs("soloist")[0]] == [song.song_id]
+
+
+def test_renamed_creator_is_reindexed(app):
+    with app.app_context():
+        creator = User.query.filter_by(username="creator").one()
+        creator.username = "maestro"
+        db.session.commit()
+
+        assert len(search_songs("maestro", limit=100)[0]) == Song.query.count()
+        assert search_songs("creator")[0] == []
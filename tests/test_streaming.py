@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+from controller.models import Song, User
+
+
+@pytest.fixture
+def stream_url(app, wav_bytes):
+    """The /stream URL of a freshly uploaded WAV, and its bytes."""
+    client = app.test_client()
+    with app.app_context():
+        creator_id = User.query.filter_by(username="creator").one().user_id
+    with client.session_transaction() as session:
+        session["user_id"], session["roles"] = creator_id, ["CREATOR"]
+    client.post("/creator/upload", data={
+        "title": "Tone", "genre_id": "1", "song": (io.BytesIO(wav_bytes), "tone.wav")
+    })
+    with app.app_context():
+        song_id = Song.query.filter_by(title="Tone").one().song_id
+    return f"/stream/{song_id}?quality=original", wav_bytes
+
+
+def test_single_range_is_partial_content(app, stream_url):
+    url, data = stream_url
+    client = app.test_client()
+
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(data)}"
+    assert response.data == data[100:200]
+
+    response = client.get(url, headers={"Range": "bytes=-10"})
+    assert response.status_code == 206 and response.data == data[-10:]
+
+    response = client.get(url, headers={"Range": f"bytes={len(data)}-"})
+    assert response.status_code == 416
+
+
+def test_multiple_ranges_are_multipart(app, stream_url):
+    url, data = stream_url
+    response = app.test_client().get(url, headers={"Range": "bytes=0-9,20-29,-5"})
+
+    assert response.status_code == 206
+    assert response.mimetype == "multipart/byteranges"
+    boundary = response.mimetype_params["boundary"].encode()
+    assert response.content_length == len(response.data)
+
+    parts = response.data.split(b"--" + boundary)
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    bodies = []
+    for part in parts[1:-1]:
+        head, _, body = part.partition(b"\r\n\r\n")
+        assert body.endswith(b"\r\n")
+        bodies.append((head.split(b"Content-Range: ")[1], body[:-2]))
+    size = len(data)
+    assert bodies == [
+        (f"bytes 0-9/{size}".encode(), data[0:10]),
+        (f"bytes 20-29/{size}".encode(), data[20:30]),
+        (f"bytes {size - 5}-{size - 1}/{size}".encode(), data[-5:]),
+    ]
+
+
+def test_stale_if_range_gets_the_whole_file(app, stream_url):
+    url, data = stream_url
+    client = app.test_client()
+    etag = client.get(url).headers["ETag"]
+
+    response = client.get(url, headers={"Range": "bytes=0-9,20-29", "If-Range": etag})
+    assert response.status_code == 206
+    response = client.get(url, headers={"Range": "bytes=0-9,20-29", "If-Range": '"stale"'})
+    assert response.status_code == 200 and response.data == data
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
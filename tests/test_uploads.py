@@ -0,0 +1,63 @@
+import pytest
+
+from controller.models import Song, UploadSession, User
+
+
+@pytest.fixture
+def creator(app):
+    client = app.test_client()
+    with app.app_context():
+        user_id = User.query.filter_by(username="creator").one().user_id
+    with client.session_transaction() as session:
+        session["user_id"], session["roles"] = user_id, ["CREATOR"]
+    return client
+
+
+def test_chunked_upload_creates_song(app, creator, wav_bytes):
+    response = creator.post("/creator/upload/session", json={
+        "filename": "take.wav", "title": "Chunked", "genre_id": 1, "size": len(wav_bytes)
+    })
+    assert response.status_code == 201
+    upload_id = response.get_json()["upload_id"]
+
+    half = len(wav_bytes) // 2
+    assert creator.put(f"/creator/upload/{upload_id}?offset=0", data=wav_bytes[:half]).get_json() == \
+        {"received": half, "size": len(wav_bytes)}
+    # A resend of an earlier offset is refused, and the client resumes from "received"
+    assert creator.put(f"/creator/upload/{upload_id}?offset=0", data=wav_bytes[:half]).status_code == 409
+    assert creator.get(f"/creator/upload/{upload_id}").get_json()["received"] == half
+    assert creator.post(f"/creator/upload/{upload_id}/complete").status_code == 409
+    creator.put(f"/creator/upload/{upload_id}?offset={half}", data=wav_bytes[half:])
+
+    response = creator.post(f"/creator/upload/{upload_id}/complete")
+    assert response.status_code == 201
+    with app.app_context():
+        song = Song.query.get(response.get_json()["song_id"])
+        assert song.title == "Chunked" and song.duration == 1
+        with open(song.file_path, "rb") as f:
+            assert f.read() == wav_bytes
+        assert UploadSession.query.count() == 0
+
+
+@pytest.mark.parametrize("payload", [
+    {"filename": "take.wav", "title": "No genre", "size": 10},
+    {"filename": "take.wav", "title": "Bad genre", "genre_id": "rock", "size": 10},
+    {"filename": "take.wav", "title": "Unknown genre", "genre_id": 999, "size": 10},
+    {"filename": "take.wav", "title": "No size", "genre_id": 1},
+    {"filename": "take.wav", "title": "Bad size", "genre_id": 1, "size": "big"},
+    {"filename": "take.wav", "title": 5, "genre_id": 1, "size": 10},
+    ["not", "an", "object"],
+])
+def test_malformed_session_is_rejected(app, creator, payload):
+    response = creator.post("/creator/upload/session", json=payload)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    with app.app_context():
+        assert UploadSession.query.count() == 0
+
+
+def test_non_numeric_offset_is_rejected(app, creator):
+    upload_id = creator.post("/creator/upload/session", json={
+        "filename": "take.wav", "title": "Chunked", "genre_id": 1, "size": 10
+    }).get_json()["upload_id"]
+    assert creator.put(f"/creator/upload/{upload_id}?offset=x", data=b"0123").status_code == 400
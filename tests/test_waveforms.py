@@ -0,0 +1,56 @@
+import numpy as np
+
+from controller.database import db
+from controller.models import Song, SongWaveform, User
+from controller.waveforms import waveforms_cli
+
+
+def add_song(app, file_path):
+    with app.app_context():
+        creator_id = User.query.filter_by(username="creator").one().user_id
+        song = Song(title="Tone", file_path=str(file_path), creator_id=creator_id, genre_id=1)
+        db.session.add(song)
+        db.session.commit()
+        return song.song_id
+
+
+def test_peaks_are_pending_then_served(app, tmp_path, wav_bytes):
+    path = tmp_path / "tone.wav"
+    path.write_bytes(wav_bytes)
+    song_id = add_song(app, path)
+    client = app.test_client()
+
+    # The first request queues the job (run inline here) and does not wait for it
+    response = client.get(f"/api/song/{song_id}/peaks")
+    assert response.status_code == 202 and response.get_json() == {"status": "pending"}
+
+    response = client.get(f"/api/song/{song_id}/peaks")
+    assert response.status_code == 200
+    buckets = int(response.headers["X-Waveform-Buckets"])
+    peaks = np.frombuffer(response.data, np.int8).reshape(buckets, 2)
+    # A 12000-amplitude sine peaks at 12000 >> 8 = 46 either way
+    assert peaks[:, 0].min() == -47 and peaks[:, 1].max() == 46
+
+    assert client.get(f"/api/song/{song_id}/peaks",
+                      headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert client.get("/api/song/999999/peaks").status_code == 404
+
+
+def test_failed_decode_is_stored_until_retried(app, tmp_path, wav_bytes):
+    path = tmp_path / "late.wav"
+    song_id = add_song(app, path)
+    client = app.test_client()
+
+    assert client.get(f"/api/song/{song_id}/peaks").status_code == 202
+    response = client.get(f"/api/song/{song_id}/peaks")
+    assert response.status_code == 404 and response.get_json()["detail"]
+    with app.app_context():
+        assert db.session.get(SongWaveform, song_id).status == "failed"
+
+    # Failures are not retried by a plain backfill, only with --retry-failed
+    path.write_bytes(wav_bytes)
+    runner = app.test_cli_runner()
+    runner.invoke(waveforms_cli, ["backfill"])
+    assert client.get(f"/api/song/{song_id}/peaks").status_code == 404
+    runner.invoke(waveforms_cli, ["backfill", "--retry-failed"])
+    assert client.get(f"/api/song/{song_id}/peaks").status_code == 200